@@ -23,7 +23,10 @@ entity self_trig is
         THRESHOLD       : integer := 10;
 
         -- rate counter
-        g_CLK_FREQUENCY : integer := 40000000
+        g_CLK_FREQUENCY : integer := 40079000; -- rate counter window in clock cycles (LHC frequency)
+
+        -- compressed-time simulation, FLASH_PERIOD and g_CLK_FREQUENCY are divided by it
+        TIME_SCALE      : integer := 1
     );
     port (
         clk_i           : in  std_logic;
@@ -44,6 +47,8 @@ end self_trig;
 
 architecture Behavioral of self_trig is
 
+    constant FLASH_PERIOD_SCALED : integer := FLASH_PERIOD / TIME_SCALE;
+
     signal slip_i_internal : integer_vector(NUM_ETROCS - 1 downto 0);
 
     type data_flash_array_t is array (integer range 0 to 2) of std_logic_vector(UPLINK_WIDTH - 1 downto 0);
@@ -80,7 +85,7 @@ begin
                 flash_inst_0 : entity work.flash_bit
                     generic map (
                         DATA_WIDTH      => ETROC_WIDTH,
-                        FLASH_PERIOD    => FLASH_PERIOD,
+                        FLASH_PERIOD    => FLASH_PERIOD_SCALED,
                         THRESHOLD       => THRESHOLD
                     )
                     port map (
@@ -96,7 +101,7 @@ begin
                 flash_inst_1 : entity work.flash_bit
                     generic map (
                         DATA_WIDTH      => ETROC_WIDTH,
-                        FLASH_PERIOD    => FLASH_PERIOD,
+                        FLASH_PERIOD    => FLASH_PERIOD_SCALED,
                         THRESHOLD       => THRESHOLD
                     )
                     port map (
@@ -112,7 +117,7 @@ begin
                 flash_inst_2 : entity work.flash_bit
                     generic map (
                         DATA_WIDTH      => ETROC_WIDTH,
-                        FLASH_PERIOD    => FLASH_PERIOD,
+                        FLASH_PERIOD    => FLASH_PERIOD_SCALED,
                         THRESHOLD       => THRESHOLD
                     )
                     port map (
@@ -166,9 +171,11 @@ begin
     --------------------------------------------------------------------------------
     trigger_inst : entity work.trigger_rx
         generic map (
-            NUM_ETROCS => NUM_ETROCS,
-            CNT_BITS   => CNT_BITS,
-            WIDTH      => UPLINK_WIDTH
+            NUM_ETROCS      => NUM_ETROCS,
+            CNT_BITS        => CNT_BITS,
+            WIDTH           => UPLINK_WIDTH,
+            g_CLK_FREQUENCY => g_CLK_FREQUENCY,
+            TIME_SCALE      => TIME_SCALE
         )
         port map (
             clock         => clk_i,
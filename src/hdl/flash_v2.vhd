@@ -60,9 +60,9 @@ begin
       g_TRANSMIT_LOW_TO_HIGH  => true -- TODO: check this
     )
     port map (
-      clk_i       => clk_i;
-      slip_cnt_i  => slip_count;
-      data_i      => data_i;
+      clk_i       => clk_i,
+      slip_cnt_i  => slip_count,
+      data_i      => data_i,
       data_o      => data_sliped
     );
 
@@ -168,7 +168,7 @@ begin
               -- Clear flashing bits if pattern continues 
               if pattern_correct then
                 expected_pattern <= not expected_pattern;
-                if clear_i then
+                if clear_i = '1' then
                   tmp_data := (others => '0');
                 end if;
 
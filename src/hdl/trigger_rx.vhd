@@ -14,9 +14,11 @@ use work.def_pkg.all;
 entity trigger_rx is
   generic
   (
-    NUM_ETROCS : integer := 28;
-    CNT_BITS   : integer := 26;
-    WIDTH      : integer := 224
+    NUM_ETROCS      : integer := 28;
+    CNT_BITS        : integer := 26;
+    WIDTH           : integer := 224;
+    g_CLK_FREQUENCY : integer := 40079000; -- rate counter window in clock cycles (LHC frequency)
+    TIME_SCALE      : integer := 1         -- compressed-time simulation, divides the window
   );
   port
   (
@@ -77,7 +79,7 @@ begin
     constant NUM : integer := 2 ** (IRATE + 3);
   begin
 
-    slip_ietroc_gen : for IETROC in 0 to 224/NUM - 1 generate
+    slip_ietroc_gen : for IETROC in 0 to WIDTH/NUM - 1 generate
     begin
 
       bitslip_inst : entity work.bitslip
@@ -206,7 +208,7 @@ begin
     trig_rate_counter_inst : entity work.rate_counter
       generic
       map (
-      g_CLK_FREQUENCY => x"02638e98",
+      g_CLK_FREQUENCY => std_logic_vector(to_unsigned(g_CLK_FREQUENCY / TIME_SCALE, 32)),
       g_COUNTER_WIDTH => CNT_BITS)
       port
       map (
@@ -0,0 +1,356 @@
+"""
+Description: Many configurations of a small unit in one elaboration
+
+A bitslip or flash_bit simulation is mostly GHDL compile, elaborate and start: the
+test itself is done in well under a second. batch_wrapper.py generates a VHDL
+wrapper (batch_<unit>) that instantiates every configuration side by side on one
+clock, with the instance ports concatenated into shared buses:
+
+    data_i / data_o    data words, instance i at bits [lo, lo + width)
+    ctrl_i             bitslip: slip count of every instance (clog2(width) bits each)
+    status_o           flash_bit: active_o of every instance, bit i
+    reset_i            flash_bit: shared synchronous reset
+
+batch_tb drives one random stream per instance through the packed buses (one write
+per bus and cycle, whatever the number of instances), splits data_o / status_o back
+per instance and checks each against the reference: golden_model.bitslip, or
+golden_model.FlashBitModel on a flashing bit with noise (lock_scan.trial_stimulus).
+
+    python src/tests/batch_wrapper.py bitslip --widths 8 16 32
+    python src/tests/batch_wrapper.py flash_bit --widths 8 16 --thresholds 4 7 10 --separate
+
+--separate also runs every configuration in its own simulation and prints both wall
+times. The pytest launchers are test_bitslip.py::test_bitslip_batch and
+test_flashbit.py::test_flashbit_batch.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+
+import cocotb
+import numpy as np
+from cocotb.clock import Clock
+from cocotb.triggers import ClockCycles, RisingEdge
+
+from golden_model import FlashBitModel, bitslip
+from hdl_build import run_json_tb
+from lock_scan import flashbit_budget, trial_stimulus
+from sim_farm import CLK_PERIOD_NS, SIM_BUILD_ROOT, read_spec, write_result
+
+
+UNITS = {
+    "bitslip": {
+        "sources": ["bitslip.vhd"],
+        "width": "g_DATA_WIDTH",
+        "defaults": {"g_DATA_WIDTH": 32, "g_SLIP_CNT_WIDTH": 8, "g_TRANSMIT_LOW_TO_HIGH": True},
+    },
+    "flash_bit": {
+        "sources": ["flash.vhd"],
+        "width": "DATA_WIDTH",
+        "defaults": {"DATA_WIDTH": 8, "FLASH_PERIOD": 3546, "THRESHOLD": 7},
+    },
+}
+
+BITSLIP_WORDS = int(os.getenv("BITSLIP_WORDS", 20_000))
+FLASH_PERIOD = 100
+OCCUPANCY = 1e-4
+SEED = 1
+
+HERE = os.path.abspath(os.path.dirname(__file__))
+RTL_DIR = os.path.join(HERE, "..", "hdl")
+BATCH_ROOT = os.path.join(SIM_BUILD_ROOT, "batch")
+
+
+def configurations(unit, widths, thresholds=(7,), flash_period=FLASH_PERIOD, low_to_high=(True, False)):
+    """Generic sets of the configuration grid of a unit, defaults for everything else"""
+    if unit == "bitslip":
+        grid = [{"g_DATA_WIDTH": w, "g_TRANSMIT_LOW_TO_HIGH": d} for w in widths for d in low_to_high]
+    else:
+        grid = [{"DATA_WIDTH": w, "FLASH_PERIOD": flash_period, "THRESHOLD": t} for w in widths for t in thresholds]
+    return [{**UNITS[unit]["defaults"], **generics} for generics in grid]
+
+
+def layout(unit, instances):
+    """
+    Bus slices of every instance: {"data": (lo, width), "ctrl": (lo, bits), "status": (lo, bits)}
+    and the total width of each bus
+    """
+    slots, totals = [], {"data": 0, "ctrl": 0, "status": 0}
+    for generics in instances:
+        width = generics[UNITS[unit]["width"]]
+        sizes = {"data": width,
+                 "ctrl": (width - 1).bit_length() if unit == "bitslip" else 0,
+                 "status": 1 if unit == "flash_bit" else 0}
+        slots.append({bus: (totals[bus], size) for bus, size in sizes.items()})
+        for bus, size in sizes.items():
+            totals[bus] += size
+    return slots, totals
+
+
+def _literal(value):
+    return str(value).lower() if isinstance(value, bool) else str(value)
+
+
+def _slice(signal, field):
+    lo, width = field
+    return f"{signal}({lo + width - 1} downto {lo})"
+
+
+def wrapper_vhdl(unit, instances):
+    """
+    VHDL source of the batch_<unit> wrapper entity. Port actuals are plain names or
+    slices (VHDL-93 takes no expressions there), so it analyzes at the default --std.
+    """
+    slots, totals = layout(unit, instances)
+    ports = ["clk_i    : in  std_logic"]
+    if unit == "flash_bit":
+        ports.append("reset_i  : in  std_logic")
+    ports.append(f"data_i   : in  std_logic_vector({totals['data'] - 1} downto 0)")
+    if totals["ctrl"]:
+        ports.append(f"ctrl_i   : in  std_logic_vector({totals['ctrl'] - 1} downto 0)")
+    ports.append(f"data_o   : out std_logic_vector({totals['data'] - 1} downto 0)")
+    if totals["status"]:
+        ports.append(f"status_o : out std_logic_vector({totals['status'] - 1} downto 0)")
+
+    signals, body = [], []
+    for i, (generics, slot) in enumerate(zip(instances, slots)):
+        generic_map = ",\n      ".join(f"{name} => {_literal(value)}" for name, value in generics.items())
+        port_map = ["clk_i => clk_i"]
+        if unit == "bitslip":
+            width = generics[UNITS[unit]["width"]]
+            signals.append(f"  signal slip_{i} : integer range 0 to {width - 1};\n")
+            body.append(f"  slip_{i} <= to_integer(unsigned({_slice('ctrl_i', slot['ctrl'])}));\n")
+            port_map.append(f"slip_cnt_i => slip_{i}")
+        else:
+            port_map.append("reset_i => reset_i")
+        port_map += [f"data_i => {_slice('data_i', slot['data'])}", f"data_o => {_slice('data_o', slot['data'])}"]
+        if unit == "flash_bit":
+            port_map.append(f"active_o => status_o({slot['status'][0]})")
+        body.append(f"  inst_{i} : entity work.{unit}\n"
+                    f"    generic map (\n      {generic_map}\n    )\n"
+                    f"    port map (\n      " + ",\n      ".join(port_map) + "\n    );\n")
+
+    summary = "\n".join(f"--   inst_{i}: " + ", ".join(f"{k}={_literal(v)}" for k, v in g.items())
+                        for i, g in enumerate(instances))
+    ports_text = ";\n    ".join(ports)
+    return (f"-- Generated by batch_wrapper.py, do not edit\n{summary}\n\n"
+            "library IEEE;\nuse IEEE.STD_LOGIC_1164.ALL;\nuse IEEE.NUMERIC_STD.ALL;\n\n"
+            f"entity batch_{unit} is\n  port (\n    {ports_text}\n  );\nend batch_{unit};\n\n"
+            f"architecture generated of batch_{unit} is\n" + "".join(["\n"] + signals if signals else [])
+            + "\nbegin\n\n" + "\n".join(body) + "\nend generated;\n")
+
+
+def pack(columns, fields):
+    """One bus integer per cycle from one array per instance, placed at its (lo, width) field"""
+    bus = np.zeros(len(columns[0]), dtype=object)
+    for values, (lo, _) in zip(columns, fields):
+        bus |= np.asarray(values, dtype=np.uint64).astype(object) << lo
+    return bus.tolist()
+
+
+def unpack(bus, fields):
+    """Inverse of pack: one uint64 array per (lo, width) field"""
+    bus = np.asarray(bus, dtype=object)
+    return [((bus >> lo) & ((1 << width) - 1)).astype(np.uint64) for lo, width in fields]
+
+
+def batch_stimulus(unit, instances, cycles, seed=SEED, occupancy=OCCUPANCY):
+    """Per instance {"data": data_i, "ctrl": slip counts or None}, seeded per instance"""
+    stimuli = []
+    for i, generics in enumerate(instances):
+        rng = np.random.default_rng([seed, i])
+        width = generics[UNITS[unit]["width"]]
+        if unit == "bitslip":
+            slips = rng.integers(0, width, cycles)
+            slips[:width] = np.arange(width)[:cycles]  # every slip count at least once
+            stimuli.append({"data": rng.integers(0, 1 << width, cycles, dtype=np.uint64), "ctrl": slips})
+        else:
+            period = 2 * generics["FLASH_PERIOD"]
+            words = trial_stimulus(width, generics["FLASH_PERIOD"], int(rng.integers(0, width)),
+                                   int(rng.integers(0, period)), occupancy, cycles, int(rng.integers(1 << 31)))
+            stimuli.append({"data": words.astype(np.uint64), "ctrl": None})
+    return stimuli
+
+
+def batch_expected(unit, instances, stimuli):
+    """Reference register values after every edge: {"data": data_o, "status": active_o or None}"""
+    expected = []
+    for generics, stim in zip(instances, stimuli):
+        if unit == "bitslip":
+            prev = np.concatenate([[0], stim["data"][:-1]]).astype(np.uint64)
+            data = bitslip(stim["data"], prev, stim["ctrl"], generics["g_DATA_WIDTH"],
+                           generics["g_TRANSMIT_LOW_TO_HIGH"])
+            expected.append({"data": data, "status": None})
+        else:
+            model = FlashBitModel(generics["DATA_WIDTH"], generics["FLASH_PERIOD"], generics["THRESHOLD"])
+            data, active = model.run(stim["data"])
+            expected.append({"data": data.astype(np.uint64), "status": active.astype(np.uint64)})
+    return expected
+
+
+def check(unit, instances, expected, got):
+    """Per instance mismatch counts and first differing cycle of every output"""
+    results = []
+    for generics, exp, out in zip(instances, expected, got):
+        result = {"generics": generics}
+        for bus in ("data", "status"):
+            if exp[bus] is None:
+                continue
+            bad = np.flatnonzero(out[bus] != exp[bus])
+            result[f"{bus}_mismatches"] = len(bad)
+            result[f"{bus}_first_mismatch"] = int(bad[0]) if len(bad) else None
+        if unit == "flash_bit":
+            active = np.flatnonzero(out["status"])
+            result["lock_cycle"] = int(active[0]) if len(active) else None
+        result["passed"] = not any(result[f"{bus}_mismatches"] for bus in ("data", "status")
+                                   if f"{bus}_mismatches" in result)
+        results.append(result)
+    return results
+
+
+def default_cycles(unit, instances):
+    """bitslip: BITSLIP_WORDS. flash_bit: the test_flashbit.py lock budget of the slowest instance"""
+    if unit == "bitslip":
+        return BITSLIP_WORDS
+    return max(flashbit_budget(g["DATA_WIDTH"], g["THRESHOLD"]) * g["FLASH_PERIOD"] for g in instances)
+
+
+@cocotb.test()
+async def batch_tb(dut):
+    """Drives every instance of BATCH_SPEC through the packed buses, writes the per instance checks to BATCH_RESULT"""
+    spec = read_spec("batch")
+    unit, instances, cycles = spec["unit"], spec["instances"], spec["cycles"]
+    slots, _ = layout(unit, instances)
+    stimuli = batch_stimulus(unit, instances, cycles, spec["seed"], spec["occupancy"])
+    data_bus = pack([s["data"] for s in stimuli], [slot["data"] for slot in slots])
+    ctrl_bus = pack([s["ctrl"] for s in stimuli], [slot["ctrl"] for slot in slots]) if unit == "bitslip" else None
+
+    cocotb.start_soon(Clock(dut.clk_i, CLK_PERIOD_NS, units="ns").start())
+    dut.data_i.value = 0
+    if ctrl_bus is not None:
+        dut.ctrl_i.value = 0
+    if unit == "flash_bit":
+        dut.reset_i.value = 1
+    await ClockCycles(dut.clk_i, 2)
+    if unit == "flash_bit":
+        dut.reset_i.value = 0
+
+    # Register values of edge t are read right after edge t + 1
+    data_out, status_out = [0] * cycles, [0] * cycles
+    start = time.perf_counter()
+    for t in range(cycles + 1):
+        if t < cycles:
+            dut.data_i.value = data_bus[t]
+            if ctrl_bus is not None:
+                dut.ctrl_i.value = ctrl_bus[t]
+        await RisingEdge(dut.clk_i)
+        if t:
+            data_out[t - 1] = dut.data_o.value.integer
+            if unit == "flash_bit":
+                status_out[t - 1] = dut.status_o.value.integer
+    wall = time.perf_counter() - start
+
+    data_got = unpack(data_out, [slot["data"] for slot in slots])
+    status_got = unpack(status_out, [slot["status"] for slot in slots])
+    got = [{"data": d, "status": s} for d, s in zip(data_got, status_got)]
+    results = check(unit, instances, batch_expected(unit, instances, stimuli), got)
+    for i, result in enumerate(results):
+        log = dut._log.info if result["passed"] else dut._log.error
+        log(f"[Batch] inst_{i} {instances[i]}: " + ("matched" if result["passed"] else str(result)))
+
+    write_result("batch", {"cycles": cycles, "sim_s": wall, "instances": results})
+    failed = sum(not r["passed"] for r in results)
+    if failed:
+        raise cocotb.result.TestFailure(f"{failed} of {len(instances)} instances differ from the reference")
+    dut._log.info(f"[Batch] {len(instances)} {unit} instances x {cycles} cycles matched in {wall:.1f} s")
+
+
+def batch_name(unit, instances, cycles, seed, occupancy):
+    key = json.dumps([unit, instances, cycles, seed, occupancy], sort_keys=True)
+    return f"{unit}_{hashlib.sha256(key.encode()).hexdigest()[:12]}"
+
+
+def run_batch(unit, instances, cycles=None, seed=SEED, occupancy=OCCUPANCY, root=BATCH_ROOT):
+    """
+    Generates the wrapper for instances, simulates them together in one GHDL run and
+    returns {"instances": per instance checks, "wall_s": build + run time}, or {"error"}
+    """
+    cycles = cycles or default_cycles(unit, instances)
+    sim_build = os.path.abspath(os.path.join(root, batch_name(unit, instances, cycles, seed, occupancy)))
+    os.makedirs(sim_build, exist_ok=True)
+    wrapper = os.path.join(sim_build, f"batch_{unit}.vhd")
+    with open(wrapper, "w") as f:
+        f.write(wrapper_vhdl(unit, instances))
+    result, wall = run_json_tb(
+        "batch",
+        sim_build,
+        {"unit": unit, "instances": instances, "cycles": cycles, "seed": seed, "occupancy": occupancy},
+        vhdl_sources=[os.path.join(RTL_DIR, src) for src in UNITS[unit]["sources"]] + [wrapper],
+        toplevel=f"batch_{unit}",
+        toplevel_lang="vhdl",
+        module="batch_wrapper",
+        python_search=[HERE],
+    )
+    if result is None:
+        return {"unit": unit, "error": f"no results, see {sim_build}", "wall_s": wall}
+    return {"unit": unit, **result, "wall_s": wall}
+
+
+def print_report(report, separate=None):
+    if "error" in report:
+        print(f"{report['unit']}: {report['error']}")
+        return
+    for i, result in enumerate(report["instances"]):
+        generics = ", ".join(f"{k}={_literal(v)}" for k, v in result["generics"].items())
+        extra = f", lock cycle {result['lock_cycle']}" if "lock_cycle" in result else ""
+        mismatches = sum(result.get(f"{bus}_mismatches", 0) for bus in ("data", "status"))
+        print(f"inst_{i:<3} {'ok' if result['passed'] else 'FAIL':<4} {mismatches:>6} mismatches  {generics}{extra}")
+    print(f"{len(report['instances'])} instances x {report['cycles']} cycles in one simulation: "
+          f"{report['wall_s']:.1f} s (simulation {report['sim_s']:.1f} s)")
+    if separate is not None:
+        print(f"one simulation per instance: {separate:.1f} s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("unit", choices=list(UNITS))
+    parser.add_argument("--widths", nargs="+", type=int, default=[8, 16, 32])
+    parser.add_argument("--thresholds", nargs="+", type=int, default=[7], help="flash_bit THRESHOLD values")
+    parser.add_argument("--flash-period", type=int, default=FLASH_PERIOD)
+    parser.add_argument("--low-to-high", nargs="+", choices=("true", "false"), default=["true", "false"],
+                        help="bitslip g_TRANSMIT_LOW_TO_HIGH values")
+    parser.add_argument("--cycles", type=int, default=None)
+    parser.add_argument("--occupancy", type=float, default=OCCUPANCY, help="flash_bit noise per bit and cycle")
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--separate", action="store_true", help="also run one simulation per instance")
+    parser.add_argument("--root", default=BATCH_ROOT)
+    parser.add_argument("-o", "--output", default=None, help="write the report as JSON")
+    args = parser.parse_args(argv)
+
+    instances = configurations(args.unit, args.widths, args.thresholds, args.flash_period,
+                               [d == "true" for d in args.low_to_high])
+    cycles = args.cycles or default_cycles(args.unit, instances)
+    report = run_batch(args.unit, instances, cycles, args.seed, args.occupancy, args.root)
+
+    separate = None
+    if args.separate:
+        # Timing comparison only: alone, every configuration gets the stimulus of instance 0
+        start = time.perf_counter()
+        for generics in instances:
+            run_batch(args.unit, [generics], cycles, args.seed, args.occupancy, args.root)
+        separate = time.perf_counter() - start
+        report["separate_wall_s"] = separate
+
+    print_report(report, separate)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0 if "error" not in report and all(r["passed"] for r in report["instances"]) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
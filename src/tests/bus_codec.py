@@ -0,0 +1,85 @@
+"""
+Description: Packed-bus codec for the self_trig ports built from per-ETROC lanes
+
+slip_i and cnts_o are NUM_ETROCS lanes of def_pkg.INTEGER_WIDTH bits (lane I in bits
+(I+1)*INTEGER_WIDTH-1 downto I*INTEGER_WIDTH), enable_i is one bit per uplink bit.
+Every conversion goes through a single integer: one GPI read or write per bus,
+then vectorized shifts in NumPy.
+
+Lane layouts per rate (ETROC j of the selected rate):
+    cnts_o    lane j * 2**rate   rate=0 0,1,2..27   rate=1 0,2,4..26   rate=2 0,4,8..24
+    slip_i    lane j             every rate's bitslip IETROC reads slip_i_internal(IETROC)
+    enable_i  bits j*W .. (j+1)*W-1 with W = etroc_width(rate)
+"""
+
+import numpy as np
+
+from golden_model import INTEGER_WIDTH, etroc_width
+
+
+def pack_lanes(values, lane_bits=INTEGER_WIDTH):
+    """Array of lane values (lane 0 first) -> bus integer"""
+    values = np.asarray(values, dtype=np.uint64)
+    if values.size and int(values.max()) >> lane_bits:
+        raise ValueError(f"lane value {int(values.max())} does not fit in {lane_bits} bits")
+    bits = (values[:, None] >> np.arange(lane_bits, dtype=np.uint64)) & np.uint64(1)
+    return int.from_bytes(np.packbits(bits.astype(np.uint8).ravel(), bitorder="little").tobytes(), "little")
+
+
+def unpack_lanes(bus, num_lanes, lane_bits=INTEGER_WIDTH):
+    """Bus integer -> uint64 array of num_lanes lane values (lane 0 first)"""
+    nbytes = -(-num_lanes * lane_bits // 8)
+    raw = np.frombuffer(int(bus).to_bytes(nbytes, "little"), dtype=np.uint8)
+    bits = np.unpackbits(raw, bitorder="little")[:num_lanes * lane_bits].reshape(num_lanes, lane_bits)
+    return bits.astype(np.uint64) @ (np.uint64(1) << np.arange(lane_bits, dtype=np.uint64))
+
+
+def counter_lanes(rate, num_etrocs=28):
+    """cnts_o lane of every ETROC at this rate"""
+    return np.arange(0, num_etrocs, 2**rate)
+
+
+def decode_counts(bus, rate=None, num_etrocs=28):
+    """cnts_o integer -> counter values, every lane or only the ETROCs of rate"""
+    counts = unpack_lanes(bus, num_etrocs)
+    return counts if rate is None else counts[counter_lanes(rate, num_etrocs)]
+
+
+def read_counts(dut, rate=None):
+    """Low INTEGER_WIDTH bits of every rate counter with one read of cnts_o"""
+    return decode_counts(dut.cnts_o.value.integer, rate, dut.NUM_ETROCS.value.integer)
+
+
+def encode_slip(slips, num_etrocs=28):
+    """
+    Per-ETROC slip counts -> slip_i integer. ETROC j uses lane j at every rate,
+    missing lanes are 0. The rate-0 bitslips read every lane, so values must stay below 8.
+    """
+    slips = np.asarray(slips, dtype=np.uint64)
+    if len(slips) > num_etrocs:
+        raise ValueError(f"{len(slips)} slip values for {num_etrocs} ETROCs")
+    lanes = np.zeros(num_etrocs, dtype=np.uint64)
+    lanes[:len(slips)] = slips
+    return pack_lanes(lanes)
+
+
+def decode_slip(bus, num_etrocs=28):
+    return unpack_lanes(bus, num_etrocs)
+
+
+def encode_enable(etroc_enable, rate, uplink_width=224):
+    """Enable flag per ETROC of rate -> enable_i integer with every bit of an enabled word set"""
+    width = etroc_width(rate)
+    etroc_enable = np.asarray(etroc_enable, dtype=bool)
+    if len(etroc_enable) != uplink_width // width:
+        raise ValueError(f"rate {rate} has {uplink_width // width} ETROC words, got {len(etroc_enable)} flags")
+    bits = np.repeat(etroc_enable, width)
+    return int.from_bytes(np.packbits(bits, bitorder="little").tobytes(), "little")
+
+
+def decode_enable(bus, rate, uplink_width=224):
+    """enable_i integer -> per-ETROC flags of rate, True only when every bit of the word is set"""
+    width = etroc_width(rate)
+    raw = np.frombuffer(int(bus).to_bytes(uplink_width // 8, "little"), dtype=np.uint8)
+    bits = np.unpackbits(raw, bitorder="little").astype(bool)
+    return bits.reshape(uplink_width // width, width).all(axis=1)
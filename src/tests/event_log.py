@@ -0,0 +1,139 @@
+"""
+Description: Buffered structured event log for the cocotb testbenches
+
+A dut._log.info line per hit or trigger is formatted and written to the console
+synchronously (pytest.ini turns log_cli on at INFO), which costs more than the event
+itself on long or busy runs and cannot be parsed afterwards. EventLog keeps the events
+in memory and writes them in batches of FLUSH_EVENTS:
+
+    jsonl   one JSON object per line, {"kind", "cycle", <fields>}
+    npz     one array per kind and field (<kind>_cycle, <kind>_<field>), written on close
+
+The console only gets the event counts per kind, at most every EVENT_LOG_INTERVAL wall
+seconds, and one line with the totals and the file on close.
+
+    with EventLog(f"test2_rate{rate}", dut._log, label) as events:
+        events.record("hit", cycle, position=bit)
+        events.record_changes("counts", cnts_changes, "values", decode_counts)
+
+EVENT_LOG_FORMAT     jsonl (default), npz, or off to only count
+EVENT_LOG_OUT        output path, may contain {name} and {format},
+                     events_<name>.<format> in the simulation directory by default
+EVENT_LOG_INTERVAL   seconds between console summaries, 10 by default
+"""
+
+import json
+import logging
+import os
+import time
+from collections import Counter
+
+import numpy as np
+
+
+FORMATS = ("jsonl", "npz", "off")
+FLUSH_EVENTS = 4096
+
+
+def _plain(value):
+    """JSON encoder fallback for NumPy scalars and arrays"""
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+class EventLog:
+    """In-memory event buffer with batched file output, see the module docstring"""
+
+    def __init__(self, name, log=None, label=None, fmt=None, path=None, interval_s=None):
+        self.fmt = fmt or os.getenv("EVENT_LOG_FORMAT", "jsonl")
+        if self.fmt not in FORMATS:
+            raise ValueError(f"EVENT_LOG_FORMAT must be one of {FORMATS}, got {self.fmt!r}")
+        self.path = None
+        if self.fmt != "off":
+            self.path = (path or os.getenv("EVENT_LOG_OUT", "events_{name}.{format}")).format(name=name, format=self.fmt)
+        self.log = log or logging.getLogger("cocotb")
+        self.label = label or f"[{name}]"
+        self.interval_s = float(os.getenv("EVENT_LOG_INTERVAL", 10)) if interval_s is None else interval_s
+
+        self.counts = Counter()
+        self._buffer = []
+        self._columns = {}   # npz: kind -> field -> list of batch arrays
+        self._file = None
+        self._last_summary = time.monotonic()
+
+    def record(self, kind, cycle, **fields):
+        self._buffer.append((kind, int(cycle), fields))
+        self.counts[kind] += 1
+        if len(self._buffer) >= FLUSH_EVENTS:
+            self.flush()
+
+        now = time.monotonic()
+        if now - self._last_summary >= self.interval_s:
+            self._last_summary = now
+            self.log.info(f"{self.label} {self.summary()} so far, cycle {cycle}")
+
+    def record_changes(self, kind, changes, field="value", decode=None):
+        """
+        One event per (cycle, value) signal change, as sim_farm.monitor_changes records
+        them. decode turns the raw bus value into the logged one.
+        """
+        for cycle, value in changes:
+            self.record(kind, cycle, **{field: value if decode is None else decode(value)})
+
+    def summary(self):
+        return ", ".join(f"{count} {kind}" for kind, count in sorted(self.counts.items())) or "no events"
+
+    def flush(self):
+        """Writes the buffered events (npz: moves them into compact arrays until close)"""
+        batch, self._buffer = self._buffer, []
+        if not batch or self.fmt == "off":
+            return
+        if self.fmt == "jsonl":
+            if self._file is None:
+                self._file = open(self.path, "w")
+            self._file.write("".join(json.dumps({"kind": kind, "cycle": cycle, **fields}, default=_plain) + "\n"
+                                     for kind, cycle, fields in batch))
+            return
+
+        grouped = {}
+        for kind, cycle, fields in batch:
+            columns = grouped.setdefault(kind, {"cycle": []})
+            columns["cycle"].append(cycle)
+            for field, value in fields.items():
+                columns.setdefault(field, []).append(value)
+        for kind, columns in grouped.items():
+            stored = self._columns.setdefault(kind, {})
+            for field, values in columns.items():
+                stored.setdefault(field, []).append(np.asarray(values))
+
+    def close(self):
+        self.flush()
+        if self.fmt == "jsonl":
+            if self._file is None:
+                self._file = open(self.path, "w")
+            self._file.close()
+        elif self.fmt == "npz":
+            np.savez_compressed(self.path, **{f"{kind}_{field}": np.concatenate(chunks)
+                                              for kind, columns in self._columns.items()
+                                              for field, chunks in columns.items()})
+        where = "" if self.path is None else f", written to {os.path.abspath(self.path)}"
+        self.log.info(f"{self.label} Events: {self.summary()}{where}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+def read_events(path):
+    """Events of a jsonl file as dicts, or {"<kind>_<field>": array} of an npz file"""
+    if path.endswith(".npz"):
+        with np.load(path) as data:
+            return {key: data[key] for key in data.files}
+    with open(path) as f:
+        return [json.loads(line) for line in f]
@@ -0,0 +1,306 @@
+"""
+Description: A/B comparison of the flashing bit detectors flash.vhd (v1) and flash_v2.vhd (v2)
+
+v1 locks on one flashing bit of the word and clears only that bit. v2 bitslips until
+the whole word flashes (all trigger bits, the triggerGranularity pattern), verifies the
+1 -> 0 toggle every FLASH_PERIOD and clears the word while clear_i is '1'. Both run in
+GHDL on identical stimulus, one simulation per design with every scenario after its
+own reset:
+
+    single              one flashing bit every 2*FLASH_PERIOD
+    all_bits            every bit of the word flashes, aligned to the uplink word
+    all_bits_slipped    every bit flashes, split over two uplink words (needs a bitslip)
+    single_hits         single + Poisson hits on the other bits (OCCUPANCY per bit and cycle)
+    all_bits_hits       all_bits_slipped + hits around the flashes
+    single_jitter       single, each flash one cycle early or late with probability JITTER
+    all_bits_jitter     all_bits_slipped with the same jitter
+
+Per design and scenario it reports
+
+    lock_periods        time to the first lock (active_o / locked_o) in FLASH_PERIODs
+    unlocks             lock losses after the first lock, also per 1000 periods (the
+                        flash never stops, so every one is false)
+    clean_flashes       flashes seen while locked whose bits were all removed from data_o
+    leaked_bits         flash bits reaching data_o while locked
+    lost_hits           hit bits removed from data_o while locked (clearing too much)
+    cycles_per_s        simulated cycles per wall second of the scenario
+
+data_o is checked against the ideal output (the input with the flash bits removed,
+passed through the bitslip v2 locked with) on every locked cycle.
+
+    python src/tests/flash_ab.py -o flash_ab.json
+    python src/tests/flash_ab.py --width 16 --flash-period 3546 --scenarios single all_bits_slipped
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cocotb
+import numpy as np
+from cocotb.clock import Clock
+from cocotb.triggers import ClockCycles
+
+from golden_model import bitslip
+from hdl_build import run_json_tb
+from sim_farm import (CLK_PERIOD_NS, SIM_BUILD_ROOT, monitor_changes, pulses_to_events, read_spec, skip_cycles,
+                      write_result)
+from sweep import lock_stats
+
+
+WIDTH = 8
+FLASH_PERIOD = 354
+THRESHOLD = 10
+OCCUPANCY = 1e-3
+JITTER = 0.05
+SEED = 1
+
+SCENARIOS = {
+    "single": {"pattern": "single"},
+    "all_bits": {"pattern": "all"},
+    "all_bits_slipped": {"pattern": "all_slipped"},
+    "single_hits": {"pattern": "single", "occupancy": OCCUPANCY},
+    "all_bits_hits": {"pattern": "all_slipped", "occupancy": OCCUPANCY},
+    "single_jitter": {"pattern": "single", "jitter": JITTER},
+    "all_bits_jitter": {"pattern": "all_slipped", "jitter": JITTER},
+}
+
+# latency: data_o row carrying input row t (v2: bitslip register + state machine register)
+DESIGNS = {
+    "v1": {"sources": ["flash.vhd"], "lock": "active_o", "latency": 0, "bitslip": False},
+    "v2": {"sources": ["bitslip.vhd", "flash_v2.vhd"], "lock": "locked_o", "latency": 2, "bitslip": True},
+}
+
+HERE = os.path.abspath(os.path.dirname(__file__))
+RTL_DIR = os.path.join(HERE, "..", "hdl")
+AB_ROOT = os.path.join(SIM_BUILD_ROOT, "flash_ab")
+
+
+def scenario_cycles(width, flash_period, threshold):
+    """Cycles per scenario: v2 tries every slip for 2*FLASH_PERIOD, then verifies, plus margin"""
+    return (3 * width + 2 * threshold + 20) * 2 * flash_period
+
+
+def ab_stimulus(scenario, width, flash_period, cycles, seed):
+    """
+    (data_i, flash bits of data_i, info) one integer per cycle. A hit on a flash bit
+    is lost in the flash, so the hits are data_i & ~flash.
+    """
+    spec = SCENARIOS[scenario]
+    rng = np.random.default_rng(seed)
+    full = (1 << width) - 1
+    period = 2 * flash_period
+    info = {"phase": int(rng.integers(0, period))}
+
+    if spec["pattern"] == "single":
+        info["index"] = int(rng.integers(0, width))
+        words = [1 << info["index"]]
+    elif spec["pattern"] == "all":
+        words = [full]
+    else:
+        # ETROC word shifted by `offset` bits: its low bits end one uplink word, its high bits start the next
+        info["offset"] = offset = int(rng.integers(1, width))
+        words = [(full << offset) & full, full >> (width - offset)]
+
+    starts = np.arange(info["phase"], cycles - len(words), period)
+    jitter = spec.get("jitter", 0.0)
+    if jitter:
+        shift = rng.choice([-1, 1], len(starts)) * (rng.random(len(starts)) < jitter)
+        starts = np.clip(starts + shift, 0, cycles - len(words))
+
+    flash = np.zeros(cycles, dtype=np.int64)
+    for k, word in enumerate(words):
+        flash[starts + k] |= word
+
+    data = flash.copy()
+    occupancy = spec.get("occupancy", 0.0)
+    if occupancy:
+        hits = rng.poisson(cycles * width * occupancy)
+        np.bitwise_or.at(data, rng.integers(0, cycles, hits), np.int64(1) << rng.integers(0, width, hits))
+    info["flashes"] = len(starts)
+    return data, flash, info
+
+
+def dense(changes, cycles, initial=0):
+    """Per cycle values from (cycle, value) changes"""
+    at = np.array([cycle for cycle, _ in changes], dtype=np.int64)
+    new = np.array([initial] + [value for _, value in changes], dtype=np.int64)
+    # Index of the last change at or before every cycle, 0 = before the first change
+    return new[np.searchsorted(at, np.arange(cycles), side="right")]
+
+
+def _popcount(values):
+    return int(np.unpackbits(np.ascontiguousarray(values, dtype="<u8").view(np.uint8)).sum())
+
+
+def ideal_output(words, design, width, slip=0):
+    """data_o rows an ideal design would produce from words (before clearing)"""
+    latency = DESIGNS[design]["latency"]
+    out = np.zeros(len(words), dtype=np.int64)
+    if DESIGNS[design]["bitslip"]:
+        # data_o row t: bitslip of cur = row t - 1, prev = row t - 2
+        cur = np.concatenate([np.zeros(latency - 1, dtype=np.int64), words])[:len(words)]
+        prev = np.concatenate([np.zeros(latency, dtype=np.int64), words])[:len(words)]
+        out[:] = bitslip(cur, prev, slip, width).astype(np.int64)
+    else:
+        out[latency:] = words[:len(words) - latency]
+    return out
+
+
+def analyze(design, data, flash, lock_changes, out_changes, slip, width, flash_period):
+    """Lock and clearing figures of one scenario run, see the module docstring"""
+    cycles = len(data)
+    lock_cycle, unlocks = lock_stats(lock_changes, 1)
+    locked = dense(lock_changes, cycles).astype(bool)
+    out = dense(out_changes, cycles)
+
+    expected_flash = ideal_output(flash, design, width, slip)
+    expected_hits = ideal_output(data & ~flash, design, width, slip)
+    leaked = np.where(locked, out & expected_flash, 0)
+    lost = np.where(locked, expected_hits & ~out, 0)
+
+    flash_rows = np.flatnonzero((expected_flash != 0) & locked)
+    # Rows of one flash are at most two apart, flashes 2*FLASH_PERIOD - 2 at least
+    groups = np.split(flash_rows, np.flatnonzero(np.diff(flash_rows) > 2) + 1) if len(flash_rows) else []
+    periods_locked = 0 if lock_cycle is None else (cycles - lock_cycle) / flash_period
+
+    return {
+        "lock_cycle": lock_cycle,
+        "lock_periods": None if lock_cycle is None else lock_cycle / flash_period,
+        "unlocks": unlocks,
+        "unlocks_per_1k_periods": 1000 * unlocks / periods_locked if periods_locked else None,
+        "flashes_locked": len(groups),
+        "clean_flashes": sum(1 for rows in groups if not leaked[rows].any()),
+        "leaked_bits": _popcount(leaked),
+        "lost_hits": _popcount(lost),
+    }
+
+
+@cocotb.test()
+async def flash_ab_tb(dut):
+    """Runs every scenario in FLASH_AB_SPEC after its own reset, writes the raw signal changes to FLASH_AB_RESULT"""
+    spec = read_spec("flash_ab")
+    design = DESIGNS[spec["design"]]
+    lock_signal = getattr(dut, design["lock"])
+    cocotb.start_soon(Clock(dut.clk_i, CLK_PERIOD_NS, units="ns").start())
+    if hasattr(dut, "clear_i"):
+        dut.clear_i.value = 1
+
+    results = {}
+    for scenario in spec["scenarios"]:
+        data, _, _ = ab_stimulus(scenario, spec["width"], spec["flash_period"], spec["cycles"], spec["seed"])
+        events = pulses_to_events({int(c): int(data[c]) for c in np.flatnonzero(data)})
+
+        # Released right after an edge, the next edge samples row 0
+        dut.data_i.value = 0
+        dut.reset_i.value = 1
+        await ClockCycles(dut.clk_i, 2)
+        dut.reset_i.value = 0
+        edge0_ns = cocotb.utils.get_sim_time("ns") + CLK_PERIOD_NS
+
+        lock_changes, out_changes = [], []
+        monitors = [cocotb.start_soon(monitor_changes(lock_signal, edge0_ns, lock_changes)),
+                    cocotb.start_soon(monitor_changes(dut.data_o, edge0_ns, out_changes))]
+        start = time.perf_counter()
+        now = 0
+        for cycle, word in events:
+            if cycle >= spec["cycles"]:
+                break
+            await skip_cycles(dut, cycle - now)
+            now = cycle
+            dut.data_i.value = word
+        await skip_cycles(dut, spec["cycles"] - now)
+        wall = time.perf_counter() - start
+        for monitor in monitors:
+            monitor.kill()
+
+        slip = int(dut.slip_count.value) if design["bitslip"] else 0
+        results[scenario] = {"lock_changes": lock_changes, "out_changes": out_changes, "slip": slip,
+                             "sim_s": wall, "cycles_per_s": spec["cycles"] / wall if wall else 0.0}
+        dut._log.info(f"[Flash A/B {spec['design']}] {scenario}: {len(lock_changes)} lock changes, "
+                      f"{len(out_changes)} data_o changes, {spec['cycles'] / wall:.0f} cycles/s")
+
+    write_result("flash_ab", results)
+
+
+def run_design(design, scenarios, width, flash_period, threshold, seed, root=AB_ROOT):
+    """Simulates every scenario on one design, returns {scenario: result} plus the build + run wall time"""
+    cycles = scenario_cycles(width, flash_period, threshold)
+    sim_build = os.path.join(root, f"{design}_w{width}_fp{flash_period}_t{threshold}")
+    raw, wall = run_json_tb(
+        "flash_ab",
+        sim_build,
+        {"design": design, "scenarios": scenarios, "width": width, "flash_period": flash_period,
+         "cycles": cycles, "seed": seed},
+        vhdl_sources=[os.path.join(RTL_DIR, src) for src in DESIGNS[design]["sources"]],
+        toplevel="flash_bit",
+        toplevel_lang="vhdl",
+        module="flash_ab",
+        python_search=[HERE],
+        parameters={"DATA_WIDTH": width, "FLASH_PERIOD": flash_period, "THRESHOLD": threshold},
+    )
+    if raw is None:
+        return {"design": design, "error": f"no results, see {os.path.abspath(sim_build)}", "wall_s": wall}
+
+    results = {}
+    for scenario, r in raw.items():
+        data, flash, info = ab_stimulus(scenario, width, flash_period, cycles, seed)
+        results[scenario] = {**info, "slip": r["slip"], "sim_s": r["sim_s"], "cycles_per_s": r["cycles_per_s"],
+                             **analyze(design, data, flash, r["lock_changes"], r["out_changes"], r["slip"],
+                                       width, flash_period)}
+    return {"design": design, "cycles": cycles, "wall_s": wall, "scenarios": results}
+
+
+def _run_design(args):
+    return run_design(*args)
+
+
+def print_table(reports, scenarios):
+    print(f"{'scenario':<18} {'design':>6} {'lock per':>8} {'unlocks':>7} {'/1k per':>7} {'flashes':>7} "
+          f"{'clean':>6} {'leaked':>7} {'lost':>5} {'cyc/s':>8}")
+    for scenario in scenarios:
+        for report in reports:
+            if "error" in report:
+                continue
+            r = report["scenarios"][scenario]
+            lock = "-" if r["lock_periods"] is None else f"{r['lock_periods']:.1f}"
+            rate = "-" if r["unlocks_per_1k_periods"] is None else f"{r['unlocks_per_1k_periods']:.1f}"
+            print(f"{scenario:<18} {report['design']:>6} {lock:>8} {r['unlocks']:>7} {rate:>7} "
+                  f"{r['flashes_locked']:>7} {r['clean_flashes']:>6} {r['leaked_bits']:>7} {r['lost_hits']:>5} "
+                  f"{r['cycles_per_s']:>8.0f}")
+    for report in reports:
+        if "error" in report:
+            print(f"{report['design']}: {report['error']}")
+        else:
+            print(f"{report['design']}: {len(report['scenarios'])} scenarios x {report['cycles']} cycles, "
+                  f"build + run {report['wall_s']:.1f} s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--designs", nargs="+", default=list(DESIGNS), choices=list(DESIGNS))
+    parser.add_argument("--scenarios", nargs="+", default=list(SCENARIOS), choices=list(SCENARIOS))
+    parser.add_argument("--width", type=int, default=WIDTH, choices=(8, 16, 32))
+    parser.add_argument("--flash-period", type=int, default=FLASH_PERIOD)
+    parser.add_argument("--threshold", type=int, default=THRESHOLD)
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--root", default=AB_ROOT, help="GHDL build directories")
+    parser.add_argument("-o", "--output", default=None, help="write every result as JSON")
+    args = parser.parse_args(argv)
+
+    with ProcessPoolExecutor(len(args.designs)) as pool:
+        reports = list(pool.map(_run_design, [(design, args.scenarios, args.width, args.flash_period,
+                                               args.threshold, args.seed, args.root) for design in args.designs]))
+    print_table(reports, args.scenarios)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"width": args.width, "flash_period": args.flash_period, "threshold": args.threshold,
+                       "seed": args.seed, "reports": reports}, f, indent=2)
+    return 1 if any("error" in report for report in reports) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
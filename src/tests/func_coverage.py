@@ -0,0 +1,344 @@
+"""
+Description: Opt-in functional coverage of the self_trig testbenches
+
+With FUNC_COVERAGE=1 a testbench started with start_coverage() samples, through
+value-change callbacks on the signals themselves (no per-cycle polling), the bins
+
+    state       flash_bit state reached, per rate and ETROC word (INIT, SEARCH, ACTIVE)
+    transition  INIT>SEARCH, SEARCH>ACTIVE, SEARCH>INIT and ACTIVE>INIT (unlock) per
+                flash_bit, edges taken while reset_i is '1' do not count
+    index       flashing bit index a flash_bit locked on (SEARCH>ACTIVE, not deposited)
+    slip        slip_i value seen by every ETROC word of the selected rate
+    lane        trigger_rx counter lane (cnt_gen(I).cnt_flag) firing at each rate
+
+Testbenches label the stimulus running at the time with
+
+    with stimulus(f"trigger_rate{rate}"):
+        failures = await run_trigger_test(dut, rate)
+
+(a no-op while coverage is off). finish_coverage() logs the bins reached and writes
+them as JSON with the simulated cycles of every stimulus (FUNC_COVERAGE_OUT,
+coverage_<name>.json in the simulation directory by default).
+
+Run as a script, the module merges the files of any number of runs (parallel units
+included), reports coverage per group against the full bin space of the design and
+ranks the stimuli greedily by new bins per simulated cycle. Stimuli adding nothing
+the better ones have not reached are marked redundant.
+
+    FUNC_COVERAGE=1 pytest -n auto src/tests/test_Top.py src/tests/test_latency.py
+    python src/tests/func_coverage.py --uncovered 10 -o coverage.json
+
+FUNC_COVERAGE       1 to enable, unset or 0 by default
+FUNC_COVERAGE_OUT   output path, may contain {name}
+"""
+
+import argparse
+import contextlib
+import glob
+import json
+import os
+import sys
+
+import cocotb
+from cocotb.triggers import Edge, First, RisingEdge
+from cocotb.utils import get_sim_time
+
+from bus_codec import counter_lanes, decode_slip
+from golden_model import ACTIVE, INIT, RATES, SEARCH, etroc_width
+from sim_farm import SIM_BUILD_ROOT
+from warm_start import flash_instance
+
+
+STATE_NAMES = {INIT: "INIT", SEARCH: "SEARCH", ACTIVE: "ACTIVE"}
+TRANSITIONS = (("INIT", "SEARCH"), ("SEARCH", "ACTIVE"), ("SEARCH", "INIT"), ("ACTIVE", "INIT"))
+GROUPS = ("state", "transition", "index", "slip", "lane")
+DEFAULT_GLOB = os.path.join(SIM_BUILD_ROOT, "*", "coverage_*.json")
+
+_active = None
+
+
+def enabled():
+    return os.getenv("FUNC_COVERAGE", "0") not in ("", "0")
+
+
+def bin_key(group, *fields):
+    return "/".join(map(str, (group, *fields)))
+
+
+def bin_space(num_etrocs=28, rates=RATES):
+    """Every bin of a self_trig with NUM_ETROCS ETROCs, see the module docstring"""
+    bins = []
+    for rate in rates:
+        width = etroc_width(rate)
+        for ietroc in range(8 * num_etrocs // width):
+            bins += [bin_key("state", rate, ietroc, name) for name in STATE_NAMES.values()]
+            bins += [bin_key("transition", rate, ietroc, f"{old}>{new}") for old, new in TRANSITIONS]
+            bins += [bin_key("index", rate, ietroc, bit) for bit in range(width)]
+            bins += [bin_key("slip", rate, ietroc, slip) for slip in range(width)]
+        bins += [bin_key("lane", rate, int(lane)) for lane in counter_lanes(rate, num_etrocs)]
+    return bins
+
+
+class Coverage:
+    """Bins reached per stimulus label, see the module docstring"""
+
+    def __init__(self, name, clk_period_ns=10, num_etrocs=28, now_ns=None):
+        if now_ns is None:
+            def now_ns():
+                return get_sim_time("ns")
+
+        self.name = name
+        self.clk_period_ns = clk_period_ns
+        self.num_etrocs = num_etrocs
+        self.rate = 0
+        self.label = name
+        self.stimuli = {}   # label -> {"cycles", "bins": {key: hits}}
+        self.first = {}     # key -> cycle it was first reached
+        self._now = now_ns
+        self._start = self._since = now_ns()
+        self._tasks = []
+
+    def _entry(self, label):
+        return self.stimuli.setdefault(label, {"cycles": 0.0, "bins": {}})
+
+    def cycle(self):
+        return int((self._now() - self._start) // self.clk_period_ns)
+
+    def record(self, group, *fields):
+        key = bin_key(group, *fields)
+        bins = self._entry(self.label)["bins"]
+        bins[key] = bins.get(key, 0) + 1
+        self.first.setdefault(key, self.cycle())
+
+    def _switch(self, label):
+        now = self._now()
+        self._entry(self.label)["cycles"] += (now - self._since) / self.clk_period_ns
+        self._since, self.label = now, label
+
+    @contextlib.contextmanager
+    def stimulus(self, label):
+        previous = self.label
+        self._switch(label)
+        try:
+            yield
+        finally:
+            self._switch(previous)
+
+    def install(self, dut):
+        uplink_width = dut.UPLINK_WIDTH.value.integer
+        watchers = [self._watch_ports(dut)]
+        for rate in RATES:
+            for ietroc in range(uplink_width // etroc_width(rate)):
+                watchers.append(self._watch_flash(dut, rate, ietroc, flash_instance(dut, rate, ietroc)))
+        watchers += [self._watch_lane(dut.trigger_inst.cnt_gen[lane].cnt_flag, lane)
+                     for lane in range(self.num_etrocs)]
+        self._tasks = [cocotb.start_soon(watcher) for watcher in watchers]
+
+    def uninstall(self):
+        for task in self._tasks:
+            task.kill()
+        self._tasks = []
+        self._switch(self.label)
+
+    def flash_change(self, rate, ietroc, old, new, index, in_reset=False):
+        """
+        Bins of one flash_bit state change. Warm start deposits jump straight from INIT
+        to ACTIVE and reset clears every FSM, neither is a transition, so the index
+        bins only see the bit of a SEARCH>ACTIVE lock and never a deposited index.
+        """
+        self.record("state", rate, ietroc, new)
+        if (old, new) in TRANSITIONS and not in_reset:
+            self.record("transition", rate, ietroc, f"{old}>{new}")
+            if new == "ACTIVE":
+                self.record("index", rate, ietroc, index)
+
+    async def _watch_flash(self, dut, rate, ietroc, inst):
+        state = STATE_NAMES[int(inst.state.value)]
+        self.record("state", rate, ietroc, state)
+        while True:
+            await Edge(inst.state)
+            new = STATE_NAMES[int(inst.state.value)]
+            in_reset = dut.reset_i.value.is_resolvable and bool(dut.reset_i.value.integer)
+            self.flash_change(rate, ietroc, state, new, int(inst.index.value), in_reset)
+            state = new
+
+    async def _watch_ports(self, dut):
+        while True:
+            self.rate = int(dut.rate_i.value)
+            slip = dut.slip_i.value
+            if slip.is_resolvable:
+                width = etroc_width(self.rate)
+                slips = decode_slip(slip.integer, self.num_etrocs)[:8 * self.num_etrocs // width]
+                for ietroc, value in enumerate(slips.tolist()):
+                    if value < width:
+                        self.record("slip", self.rate, ietroc, value)
+            await First(Edge(dut.slip_i), Edge(dut.rate_i))
+
+    async def _watch_lane(self, flag, lane):
+        while True:
+            await RisingEdge(flag)
+            self.record("lane", self.rate, lane)
+
+    def summary(self):
+        stimuli = {label: {"cycles": int(round(entry["cycles"])), "bins": entry["bins"]}
+                   for label, entry in self.stimuli.items() if entry["cycles"] or entry["bins"]}
+        bins = {}
+        for entry in stimuli.values():
+            for key, hits in entry["bins"].items():
+                bins[key] = bins.get(key, 0) + hits
+        return {
+            "name": self.name,
+            "clk_period_ns": self.clk_period_ns,
+            "num_etrocs": self.num_etrocs,
+            "cycles": sum(entry["cycles"] for entry in stimuli.values()),
+            "bins": bins,
+            "first": self.first,
+            "stimuli": stimuli,
+        }
+
+
+def start_coverage(dut, name, clk_period_ns=10):
+    """Installs the bin watchers when FUNC_COVERAGE is set, returns the collector (None when off)"""
+    global _active
+    if not enabled():
+        return None
+    _active = Coverage(name, clk_period_ns, dut.NUM_ETROCS.value.integer)
+    _active.install(dut)
+    return _active
+
+
+def finish_coverage(log=None):
+    """Stops the watchers, logs the coverage per group and writes the JSON file"""
+    global _active
+    collector, _active = _active, None
+    if collector is None:
+        return None
+    collector.uninstall()
+    summary = collector.summary()
+    groups = group_coverage(summary["bins"], bin_space(collector.num_etrocs))
+    log = log or cocotb.log
+    log.info(f"[Coverage {collector.name}] " + ", ".join(
+        f"{group} {row['covered']}/{row['bins']}" for group, row in groups.items()))
+
+    path = os.getenv("FUNC_COVERAGE_OUT", "coverage_{name}.json").format(name=collector.name)
+    with open(path, "w") as f:
+        json.dump(summary, f, indent=2)
+    log.info(f"[Coverage {collector.name}] Written to {os.path.abspath(path)}")
+    return summary
+
+
+def stimulus(label):
+    """Context manager labelling the running stimulus, a no-op when coverage is off"""
+    return _active.stimulus(label) if _active is not None else contextlib.nullcontext()
+
+
+def merge(runs):
+    """Hits per bin summed over runs"""
+    bins = {}
+    for run in runs:
+        for key, hits in run["bins"].items():
+            bins[key] = bins.get(key, 0) + hits
+    return bins
+
+
+def group_coverage(bins, space):
+    """{group: {"bins", "covered", "percent", "uncovered": [keys]}}"""
+    report = {}
+    for group in GROUPS:
+        keys = [key for key in space if key.split("/", 1)[0] == group]
+        uncovered = [key for key in keys if not bins.get(key)]
+        report[group] = {
+            "bins": len(keys),
+            "covered": len(keys) - len(uncovered),
+            "percent": 100.0 * (len(keys) - len(uncovered)) / len(keys) if keys else 100.0,
+            "uncovered": uncovered,
+        }
+    return report
+
+
+def rank_stimuli(runs, space):
+    """
+    Greedy order of every (run, stimulus): next is the one reaching the most bins not
+    reached yet per simulated cycle. Returns rows with the new bins and the cumulative
+    coverage after each.
+    """
+    space = set(space)
+    items = [{"run": run["name"], "stimulus": label, "cycles": entry["cycles"],
+              "reached": set(entry["bins"]) & space}
+             for run in runs for label, entry in run["stimuli"].items()]
+    covered, rows = set(), []
+    while items:
+        def gain(item):
+            return len(item["reached"] - covered) / max(item["cycles"], 1)
+
+        best = max(items, key=lambda item: (gain(item), -item["cycles"]))
+        items.remove(best)
+        new = best["reached"] - covered
+        covered |= new
+        rows.append({"run": best["run"], "stimulus": best["stimulus"], "cycles": best["cycles"],
+                     "bins": len(best["reached"]), "new": len(new),
+                     "new_per_mcycle": 1e6 * len(new) / max(best["cycles"], 1),
+                     "cumulative_percent": 100.0 * len(covered) / len(space) if space else 100.0,
+                     "redundant": not new})
+    return rows
+
+
+def load_runs(patterns):
+    paths = sorted({path for pattern in patterns for path in glob.glob(pattern)})
+    runs = []
+    for path in paths:
+        with open(path) as f:
+            runs.append(json.load(f))
+    return paths, runs
+
+
+def print_report(groups, ranking, uncovered=0):
+    print(f"{'group':<12} {'covered':>8} {'bins':>6} {'%':>6}")
+    for group, row in groups.items():
+        print(f"{group:<12} {row['covered']:>8} {row['bins']:>6} {row['percent']:>6.1f}")
+    total = sum(row["bins"] for row in groups.values())
+    print(f"{'total':<12} {sum(row['covered'] for row in groups.values()):>8} {total:>6} "
+          f"{100.0 * sum(row['covered'] for row in groups.values()) / max(total, 1):>6.1f}")
+
+    print(f"\n{'run':<32} {'stimulus':<28} {'cycles':>10} {'bins':>6} {'new':>6} {'new/Mcyc':>9} {'cum %':>6}")
+    for row in ranking:
+        print(f"{row['run']:<32} {row['stimulus']:<28} {row['cycles']:>10} {row['bins']:>6} {row['new']:>6} "
+              f"{row['new_per_mcycle']:>9.1f} {row['cumulative_percent']:>6.1f}"
+              + ("  redundant" if row["redundant"] else ""))
+
+    if uncovered:
+        for group, row in groups.items():
+            if row["uncovered"]:
+                more = len(row["uncovered"]) - uncovered
+                print(f"uncovered {group}: " + ", ".join(row["uncovered"][:uncovered])
+                      + (f" (+{more} more)" if more > 0 else ""))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("files", nargs="*", default=[DEFAULT_GLOB], help="coverage files or globs")
+    parser.add_argument("--uncovered", type=int, default=0, metavar="N", help="list N uncovered bins per group")
+    parser.add_argument("-o", "--output", default=None, help="write the merged bins and ranking as JSON")
+    args = parser.parse_args(argv)
+
+    paths, runs = load_runs(args.files)
+    if not runs:
+        parser.error(f"no coverage files match {' '.join(args.files)}")
+    sizes = {run["num_etrocs"] for run in runs}
+    if len(sizes) > 1:
+        parser.error(f"runs mix NUM_ETROCS {sorted(sizes)}, merge them separately")
+
+    space = bin_space(sizes.pop())
+    bins = merge(runs)
+    groups = group_coverage(bins, space)
+    ranking = rank_stimuli(runs, space)
+    print(f"{len(runs)} runs, {sum(run['cycles'] for run in runs)} cycles")
+    print_report(groups, ranking, args.uncovered)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"files": paths, "bins": bins, "groups": groups, "ranking": ranking}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
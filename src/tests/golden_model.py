@@ -0,0 +1,420 @@
+"""
+Description: Cycle-accurate NumPy reference model of the full self trigger (Top.vhd)
+
+Models every stage of `self_trig`:
+- the per-rate flash_bit INIT/SEARCH/ACTIVE state machines (flash.vhd)
+- the bitslip stages, rate mux and enable mask (trigger_rx.vhd, bitslip.vhd)
+- the OR reduction tree with its or_8_rr / or_16_r alignment delays
+- trigger_o and the per-ETROC counter flags that feed rate_counter
+
+Timing convention: row t of the stimulus is the value of uplink_data_i sampled at
+rising edge t, row t of every output is the value of that register after rising
+edge t. Buses are stored as uint8 arrays of shape (cycles, UPLINK_WIDTH // 8) where
+byte k holds bits 8k+7 downto 8k of the VHDL vector.
+
+The flash_bit FSMs are evaluated event by event (only at cycles carrying data while
+in INIT and at the 2*FLASH_PERIOD checkpoints), everything after them is evaluated on
+whole arrays at once, so millions of cycles run in seconds.
+"""
+
+import numpy as np
+
+
+INTEGER_WIDTH = 8  # def_pkg.INTEGER_WIDTH
+ETROC_WIDTH = 8    # uplink bits per ETROC, UPLINK_WIDTH = ETROC_WIDTH * NUM_ETROCS
+RATES = (0, 1, 2)  # 0==320, 1==640, 2==1280
+
+# flash_bit state_type encoding
+INIT, SEARCH, ACTIVE = 0, 1, 2
+
+# Edges between the one sampling a hit on uplink_data_i (into flash_bit data_o) and the
+# one setting trigger_o, slip 0: bitslip prev_data and data_o, data_slip, data_masked,
+# or_8, or_16, or_32, trigger_o
+TRIGGER_LATENCY = 8
+
+_LANE_DTYPES = {0: np.dtype("<u1"), 1: np.dtype("<u2"), 2: np.dtype("<u4")}
+
+
+def etroc_width(rate):
+    """Bits per ETROC word at the given data rate (8, 16 or 32)"""
+    return ETROC_WIDTH * (2**rate)
+
+
+def pack_words(words, uplink_width=224):
+    """Convert a sequence of uplink integers into a (cycles, uplink_width // 8) uint8 array"""
+    nbytes = uplink_width // 8
+    out = np.zeros((len(words), nbytes), dtype=np.uint8)
+    for row, word in enumerate(words):
+        out[row] = np.frombuffer(int(word).to_bytes(nbytes, "little"), dtype=np.uint8)
+    return out
+
+
+def expand_events(events, cycles, uplink_width=224):
+    """
+    Dense (cycles, uplink_width // 8) stimulus from sparse (cycle, word) changes, each
+    word is held until the next change (the bus is 0 before the first one)
+    """
+    out = np.zeros((cycles, uplink_width // 8), dtype=np.uint8)
+    events = sorted(events)
+    stops = [cycle for cycle, _ in events[1:]] + [cycles]
+    for (cycle, word), stop in zip(events, stops):
+        if word:
+            out[cycle:stop] = pack_words([word], uplink_width)[0]
+    return out
+
+
+def unpack_words(data):
+    """Convert a (cycles, nbytes) uint8 array back into a list of uplink integers"""
+    data = np.ascontiguousarray(data, dtype=np.uint8)
+    return [int.from_bytes(row.tobytes(), "little") for row in data]
+
+
+def to_lanes(data, rate):
+    """View a (cycles, nbytes) uint8 bus as (cycles, num_links) ETROC words for a rate"""
+    return np.ascontiguousarray(data, dtype=np.uint8).view(_LANE_DTYPES[rate])
+
+
+def from_lanes(lanes, rate):
+    """Inverse of to_lanes, returns a (cycles, nbytes) uint8 array"""
+    return np.ascontiguousarray(lanes, dtype=_LANE_DTYPES[rate]).view(np.uint8)
+
+
+def bitslip(cur, prev, slip, data_width, transmit_low_to_high=True):
+    """
+    Vectorized bitslip.vhd output for arrays of (cur, prev, slip), broadcasting allowed.
+    cur is data_i at the clock edge, prev is prev_data (data_i one edge earlier).
+    """
+    cur = np.asarray(cur, dtype=np.uint64)
+    prev = np.asarray(prev, dtype=np.uint64)
+    slip = np.asarray(slip, dtype=np.uint64)
+    mask = np.uint64((1 << data_width) - 1)
+    width = np.uint64(data_width)
+
+    # Shift amounts are kept below 64 so slip == 0 never shifts by the full word
+    low_mask = (np.uint64(1) << slip) - np.uint64(1)
+    if transmit_low_to_high:
+        # data_i(i - 1 downto 0) & prev_data(g_DATA_WIDTH - 1 downto i)
+        slipped = ((cur & low_mask) << (width - slip)) | (prev >> slip)
+    else:
+        # prev_data(i - 1 downto 0) & data_i(g_DATA_WIDTH - 1 downto i)
+        slipped = ((prev & low_mask) << (width - slip)) | (cur >> slip)
+
+    return np.where(slip == 0, prev, slipped) & mask
+
+
+class FlashBitModel:
+    """Event driven model of one flash_bit instance (flash.vhd)"""
+
+    def __init__(self, data_width, flash_period, threshold):
+        self.data_width = data_width
+        self.flash_period = flash_period
+        self.threshold = threshold
+        self.reset()
+
+    def reset(self):
+        """Synchronous reset values"""
+        self.state = INIT
+        self.index = 0
+        self.count = 0
+        self.clk_counter = 0
+        self.active_o = False
+
+    def snapshot(self):
+        """Internal signal values, named like the VHDL signals"""
+        return {
+            "state": self.state,
+            "index": self.index,
+            "count": self.count,
+            "clk_counter": self.clk_counter,
+        }
+
+    def restore(self, snap):
+        """Load internal signal values produced by snapshot()"""
+        self.state = snap["state"]
+        self.index = snap["index"]
+        self.count = snap["count"]
+        self.clk_counter = snap["clk_counter"]
+        self.active_o = self.state == ACTIVE
+
+    def run(self, words):
+        """
+        Clock the FSM once per element of words (data_i at each edge).
+        Returns (data_o, active_o) arrays holding the register values after each edge.
+        """
+        words = np.asarray(words)
+        nonzero = np.flatnonzero(words)
+        values, intervals = self.run_events(nonzero, words[nonzero], len(words))
+        data_o = words.copy()
+        data_o[nonzero] = values
+        active_o = np.zeros(len(words), dtype=bool)
+        for start, stop in intervals:
+            active_o[start:stop] = True
+        return data_o, active_o
+
+    def run_events(self, times, values, cycles):
+        """
+        Sparse form of run() for long, mostly empty stimuli: data_i is zero on every
+        edge except values[i] at edge times[i] (sorted, unique, below cycles).
+        Returns (data_o at those edges, [(start, stop)] edge ranges with active_o '1').
+        """
+        times = np.asarray(times, dtype=np.int64)
+        data_o = np.array(values, copy=True)
+        intervals = []
+        last_period = 2 * self.flash_period - 1
+
+        t = 0
+        while t < cycles:
+            if self.state == INIT:
+                # index walks by one every edge until a '1' shows up
+                k = np.searchsorted(times, t)
+                if k == len(times):
+                    self.index = (self.index + cycles - t) % self.data_width
+                    t = cycles
+                    break
+
+                found = int(times[k])
+                index = (self.index + found - t) % self.data_width
+                word = int(data_o[k])
+
+                # First '1' at or above index, otherwise first '1' below it
+                upper = (word >> index) << index
+                pick = upper if upper else word
+                self.index = (pick & -pick).bit_length() - 1
+
+                self.state = SEARCH
+                self.count = 0
+                self.clk_counter = 0
+                t = found + 1
+                continue
+
+            # SEARCH / ACTIVE only look at data_i when clk_counter wraps
+            check = t + last_period - self.clk_counter
+            if self.state == ACTIVE:
+                stop = min(check, cycles - 1) + 1
+                if intervals and intervals[-1][1] == t:
+                    intervals[-1] = (intervals[-1][0], stop)
+                else:
+                    intervals.append((t, stop))
+
+            if check >= cycles:
+                self.clk_counter += cycles - t
+                t = cycles
+                break
+
+            k = np.searchsorted(times, check)
+            seen = k < len(times) and times[k] == check and (int(data_o[k]) >> self.index) & 1
+            self.clk_counter = 0
+            if seen and self.state == SEARCH:
+                if self.count == self.threshold - 1:
+                    self.state = ACTIVE
+                self.count += 1
+            elif seen:
+                data_o[k] &= ~(1 << self.index) & ((1 << self.data_width) - 1)
+            else:
+                self.state = INIT
+                self.count = 0
+            t = check + 1
+
+        if cycles:
+            # active_o register mirrors the state processed on the last edge
+            self.active_o = bool(intervals) and intervals[-1][1] == cycles
+        return data_o, intervals
+
+
+class SelfTrigModel:
+    """
+    Reference model of self_trig. State is kept between calls to run(), so a long
+    stimulus can be streamed through in chunks with identical results.
+    NUM_ETROCS must be a multiple of 4 and UPLINK_WIDTH = 8 * NUM_ETROCS.
+    """
+
+    def __init__(self, num_etrocs=28, uplink_width=224, flash_period=3546, threshold=10, cnt_bits=26):
+        self.num_etrocs = num_etrocs
+        self.uplink_width = uplink_width
+        self.flash_period = flash_period
+        self.threshold = threshold
+        self.cnt_bits = cnt_bits
+        self.nbytes = uplink_width // 8
+
+        self.flash = {
+            rate: [
+                FlashBitModel(etroc_width(rate), flash_period, threshold)
+                for _ in range(uplink_width // etroc_width(rate))
+            ]
+            for rate in RATES
+        }
+
+        # Port values, kept until the next call to run()
+        self.rate = 0
+        self.enable = np.full(self.nbytes, 0xFF, dtype=np.uint8)
+        self.slip = np.zeros(num_etrocs, dtype=np.int64)
+
+        # trigger_rx registers are not reset in the RTL, they start at '0'
+        self._flash_hist = np.zeros((2, self.nbytes), dtype=np.uint8)   # data_flash(rate_i), last two edges
+        self._slip_hist = np.zeros((2, self.nbytes), dtype=np.uint8)    # data_slip, last two edges
+        self._masked_hist = np.zeros((4, self.nbytes), dtype=np.uint8)  # data_masked, last four edges
+        self.cycle = 0
+
+    def reset(self, cycles=1, post_edge=True):
+        """
+        Hold reset_i high for a number of edges (only flash_bit has a reset).
+
+        With post_edge, one more edge with reset_i '0' and all-zero data is clocked,
+        as test_Top.reset_dut() does before the stimulus starts: on it the INIT
+        flash index of every lane advances from 0 to 1.
+        """
+        prev_active = self._lane_active()
+        for lanes in self.flash.values():
+            for fsm in lanes:
+                fsm.reset()
+
+        num_links = self.uplink_width // etroc_width(self.rate)
+        self._advance_pipeline(
+            np.zeros((cycles, self.nbytes), dtype=np.uint8),
+            np.zeros((cycles, num_links), dtype=bool),
+            prev_active,
+        )
+        if post_edge:
+            self.run(np.zeros((1, self.nbytes), dtype=np.uint8))
+
+    def snapshot(self):
+        """Per rate list of flash_bit internal signal values"""
+        return {rate: [fsm.snapshot() for fsm in lanes] for rate, lanes in self.flash.items()}
+
+    def restore(self, snap):
+        """Load flash_bit internal signal values produced by snapshot()"""
+        for rate, lanes in snap.items():
+            for fsm, values in zip(self.flash[int(rate)], lanes):
+                fsm.restore(values)
+
+    def run(self, uplink, rate=None, enable=None, slip=None):
+        """
+        Clock the model once per row of uplink.
+
+        uplink : (cycles, UPLINK_WIDTH // 8) uint8 array, see pack_words()
+        rate   : rate_i
+        enable : enable_i as an integer or a (UPLINK_WIDTH // 8,) uint8 array, all ones by default
+        slip   : per ETROC slip values (slip_i), zeros by default
+
+        Port arguments left as None keep their previous value.
+        Returns a dict of arrays named after the RTL signals, one row per edge.
+        """
+        uplink = np.ascontiguousarray(uplink, dtype=np.uint8).reshape(-1, self.nbytes)
+        if rate is not None:
+            self.rate = rate
+        if enable is not None:
+            if not isinstance(enable, np.ndarray):
+                enable = pack_words([enable], self.uplink_width)[0]
+            self.enable = enable
+        if slip is not None:
+            self.slip = np.asarray(slip, dtype=np.int64)
+
+        prev_active = self._lane_active()
+
+        # All three flash_bit arrays are always clocked, rate_i only selects one of them
+        for irate in RATES:
+            lanes = to_lanes(uplink, irate)
+            data_o = np.empty_like(lanes)
+            active_o = np.empty(lanes.shape, dtype=bool)
+            for ietroc, fsm in enumerate(self.flash[irate]):
+                data_o[:, ietroc], active_o[:, ietroc] = fsm.run(lanes[:, ietroc])
+            if irate == self.rate:
+                flash_data, lane_active = from_lanes(data_o, irate), active_o
+
+        out = self._advance_pipeline(flash_data, lane_active, prev_active)
+
+        # active_o port: smaller vectors for rates 1 and 2 are padded with '0' in the low bits
+        active_port = np.zeros((len(uplink), self.num_etrocs), dtype=bool)
+        active_port[:, self.num_etrocs - lane_active.shape[1]:] = lane_active
+        out["active_o"] = active_port
+        return out
+
+    def _lane_active(self):
+        return np.array([fsm.active_o for fsm in self.flash[self.rate]], dtype=bool)
+
+    def _advance_pipeline(self, flash_data, lane_active, prev_active):
+        cycles = len(flash_data)
+        width = etroc_width(self.rate)
+        num_links = self.uplink_width // width
+
+        # bitslip: data_o(t) = slip(data_i(t), prev_data(t)) with data_i(t) = data_flash(t - 1)
+        flash_x = np.concatenate([self._flash_hist, flash_data])
+        cur = to_lanes(flash_x[1:cycles + 1], self.rate)
+        prev = to_lanes(flash_x[:cycles], self.rate)
+        slipped = bitslip(cur, prev, self.slip[:num_links], width).astype(_LANE_DTYPES[self.rate])
+
+        # data_masked(t) = data_slip(t - 1) and (enable_i and active_enable(t - 1))
+        slip_x = np.concatenate([self._slip_hist, from_lanes(slipped, self.rate)])
+        active_enable = np.concatenate([prev_active[np.newaxis, :], lane_active[:-1]])
+        enable_lanes = to_lanes(self.enable[np.newaxis, :], self.rate)
+        trigger_enable = from_lanes(np.where(active_enable, enable_lanes, 0), self.rate)
+        masked = slip_x[:cycles] & trigger_enable
+
+        masked_x = np.concatenate([self._masked_hist, masked])
+        rows = len(masked_x)
+        nonzero_8 = masked_x[:, :self.num_etrocs] != 0
+        nonzero_16 = nonzero_8.reshape(rows, -1, 2).any(axis=2)
+        nonzero_32 = nonzero_16.reshape(rows, -1, 2).any(axis=2)
+
+        # or_8(t) = reduce(data_masked(t - 1)), each further OR stage adds one edge,
+        # or_8_rr / or_16_r / or_32 all line up on data_masked(t - 3)
+        out = {
+            "data_flash": flash_data,
+            "data_masked": masked,
+            "or_8": nonzero_8[3:cycles + 3],
+            "or_16": nonzero_16[2:cycles + 2],
+            "or_32": nonzero_32[1:cycles + 1],
+            "trigger_o": nonzero_32[:cycles].any(axis=1),
+        }
+
+        # cnt_flag lanes: rate=0 0,1,2..27 / rate=1 0,2,4.. / rate=2 0,4,8..
+        step = 2**self.rate
+        cnt_flag = np.zeros((cycles, self.num_etrocs), dtype=bool)
+        cnt_flag[:, ::step] = (nonzero_8, nonzero_16, nonzero_32)[self.rate][:cycles]
+        out["cnt_flag"] = cnt_flag
+
+        self._flash_hist = flash_x[-2:]
+        self._slip_hist = slip_x[-2:]
+        self._masked_hist = masked_x[-4:]
+        self.cycle += cycles
+        return out
+
+
+def trigger_cycles(trace):
+    """Cycles (edge numbers) after which trigger_o is '1'"""
+    return np.flatnonzero(trace["trigger_o"])
+
+
+def trigger_pulses(trace):
+    """
+    trigger_o pulses as (rise, fall) edge numbers: trigger_o goes to '1' on edge rise
+    and back to '0' on edge fall (fall is len(trace) if still high at the end)
+    """
+    high = np.concatenate([[False], trace["trigger_o"], [False]])
+    edges = np.flatnonzero(high[1:] != high[:-1])
+    return [(int(rise), int(fall)) for rise, fall in zip(edges[::2], edges[1::2])]
+
+
+def rate_counts(cnt_flag, clk_frequency, counter_width, phase=0):
+    """
+    rate_counter outputs for one lane of cnt_flag (row t = value after edge t, as in
+    SelfTrigModel.run). rate_counter counts en_i on the edges where its timer is below
+    g_CLK_FREQUENCY and latches the count into rate_o on the next edge, so a window is
+    clk_frequency + 1 edges long. en_i at edge t is cnt_flag row t - 1, phase is the
+    timer value before edge 0.
+
+    Returns (latch edges, counts saturated at 2**counter_width - 1) of every window
+    that lies completely inside the trace, rate_o holds counts[i] after edge latches[i].
+    """
+    cnt_flag = np.asarray(cnt_flag, dtype=bool)
+    period = clk_frequency + 1
+    cycles = len(cnt_flag)
+    # The timer before edge t is (phase + t) % period, it latches when it equals clk_frequency
+    first = (clk_frequency - phase) % period
+    latches = np.arange(first, cycles, period)
+    latches = latches[latches >= period]
+
+    # Window of latch L counts rows L - period .. L - 2
+    csum = np.concatenate([[0], np.cumsum(cnt_flag, dtype=np.int64)])
+    counts = csum[latches - 1] - csum[latches - period]
+    return latches, np.minimum(counts, (1 << counter_width) - 1).astype(np.uint64)
@@ -0,0 +1,253 @@
+"""
+Description: Simulator backends and the content-hashed GHDL compilation cache
+
+Drop-in replacement for cocotb_test.simulator.run used by every test launcher.
+SIM selects the backend (BACKENDS, ghdl by default) and VHDL_STD the language
+revision, passed to analysis, elaboration and run with the backend's own flag.
+
+With SIM=ghdl the VHDL sources
+are analyzed and elaborated once per cache key, in a directory shared by every test
+module and kept between pytest sessions:
+
+    sim_build/cache/ghdl/<toplevel>-<key>
+
+key = hash(GHDL version, toplevel, analysis arguments, names and contents of the sources)
+
+Top-level generics are not part of the key, GHDL binds them when the design is
+run (-g options on `ghdl -r`), so every generic set shares one compiled library.
+A new key starts from a copy of the newest library of the same toplevel, so
+`ghdl -m` only re-analyzes the units whose sources changed. The per-test sim_build
+directory only receives the elaborated executable (or a stamp file for the mcode
+backend) so cocotb-test skips its own compile step and runs straight away.
+
+With waves=True GHDL writes a .ghw, WAVE_FORMAT=vcd makes it write <toplevel>.vcd
+instead (readable by wave_events.py).
+
+Set HDL_CACHE=0 to fall back to plain cocotb-test compilation. nvc binds generics
+at elaboration, so its builds are left to cocotb-test in the per-unit sim_build.
+
+run_json_tb launches the cocotb tests of the tools (sweep, lock_scan, flash_ab,
+batch_wrapper) that take a JSON spec and hand back a JSON result.
+"""
+
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import shutil
+import subprocess
+import time
+from contextlib import contextmanager
+
+from cocotb_test import simulator
+
+from sim_farm import SIM_BUILD_ROOT
+
+
+CACHE_ROOT = os.path.join(SIM_BUILD_ROOT, "cache")
+COMPLETE_STAMP = ".complete"
+
+BACKENDS = ("ghdl", "nvc")
+
+# def_pkg declares its own integer_vector, which VHDL-2008 predefines in std.standard,
+# so the tree is analyzed as VHDL-93 unless VHDL_STD says otherwise
+VHDL_STD = "93"
+STD_FLAGS = {
+    "ghdl": {"93": "--std=93c", "08": "--std=08"},
+    "nvc": {"93": "--std=1993", "08": "--std=2008"},
+}
+
+logger = logging.getLogger("cocotb")
+
+
+def backend():
+    """Simulator selected with SIM, ghdl when unset"""
+    sim = os.environ.setdefault("SIM", "ghdl")
+    if sim not in BACKENDS:
+        raise ValueError(f"SIM={sim}, supported backends are {BACKENDS}")
+    return sim
+
+
+def std_flag(sim):
+    """Language revision flag for a backend, from VHDL_STD (93 or 08)"""
+    std = os.getenv("VHDL_STD", VHDL_STD)
+    if std not in STD_FLAGS[sim]:
+        raise ValueError(f"VHDL_STD={std}, expected one of {tuple(STD_FLAGS[sim])}")
+    return STD_FLAGS[sim][std]
+
+
+def simulator_version(sim):
+    """First line of `<sim> --version`"""
+    out = subprocess.run([sim, "--version"], capture_output=True, text=True, check=True)
+    return out.stdout.splitlines()[0].strip()
+
+
+def ghdl_version():
+    """First line of `ghdl --version`, part of the cache key"""
+    return simulator_version("ghdl")
+
+
+def source_key(toplevel, vhdl_sources, compile_args, tool_version):
+    """Hash of everything that affects analysis and elaboration"""
+    h = hashlib.sha256()
+    h.update(tool_version.encode())
+    h.update(toplevel.encode())
+    for arg in compile_args:
+        h.update(b"\0arg:" + arg.encode())
+    for path in vhdl_sources:
+        h.update(b"\0src:" + os.path.basename(path).encode())
+        with open(path, "rb") as f:
+            h.update(hashlib.sha256(f.read()).digest())
+    return h.hexdigest()[:16]
+
+
+@contextmanager
+def _locked(path):
+    """Exclusive lock so parallel units (pytest -n) build a key only once"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _newest_build(cache_dir, toplevel, exclude):
+    """Most recent complete library of the same toplevel, used to seed a new key"""
+    if not os.path.isdir(cache_dir):
+        return None
+    candidates = [
+        os.path.join(cache_dir, name)
+        for name in os.listdir(cache_dir)
+        if name.startswith(f"{toplevel}-") and name != exclude
+        and os.path.isfile(os.path.join(cache_dir, name, COMPLETE_STAMP))
+    ]
+    return max(candidates, key=os.path.getmtime, default=None)
+
+
+def _ghdl(args, cwd):
+    logger.info("Running command: " + " ".join(args))
+    subprocess.run(args, cwd=cwd, check=True)
+
+
+def compile_ghdl(toplevel, vhdl_sources, compile_args=()):
+    """
+    Analyze and elaborate toplevel into the shared cache, returns the cache directory.
+    The GHDL library is named after the toplevel, like cocotb-test does.
+    """
+    compile_args = list(compile_args)
+    cache_dir = os.path.abspath(os.path.join(CACHE_ROOT, "ghdl"))
+    key = source_key(toplevel, vhdl_sources, compile_args, ghdl_version())
+    build_dir = os.path.join(cache_dir, f"{toplevel}-{key}")
+
+    with _locked(os.path.join(cache_dir, f"{toplevel}.lock")):
+        if os.path.isfile(os.path.join(build_dir, COMPLETE_STAMP)):
+            logger.info(f"HDL cache hit: {build_dir}")
+            os.utime(build_dir)
+            return build_dir
+
+        # Interrupted builds are redone from scratch
+        shutil.rmtree(build_dir, ignore_errors=True)
+        seed = _newest_build(cache_dir, toplevel, os.path.basename(build_dir))
+        if seed is not None:
+            logger.info(f"HDL cache miss: updating {seed} -> {build_dir}")
+            shutil.copytree(seed, build_dir)
+            os.remove(os.path.join(build_dir, COMPLETE_STAMP))
+        else:
+            logger.info(f"HDL cache miss: building {build_dir}")
+            os.makedirs(build_dir)
+
+        start = time.perf_counter()
+        _ghdl(["ghdl", "-i"] + compile_args + [f"--work={toplevel}"] + list(vhdl_sources), build_dir)
+        _ghdl(["ghdl", "-m"] + compile_args + [f"--work={toplevel}", toplevel], build_dir)
+        with open(os.path.join(build_dir, COMPLETE_STAMP), "w") as f:
+            f.write(f"{time.perf_counter() - start:.3f}\n")
+
+    return build_dir
+
+
+def stage(build_dir, toplevel, sim_build):
+    """
+    Make the compiled design available to a cocotb-test run in sim_build: the
+    elaborated executable for the LLVM/GCC backends, a stamp file for mcode.
+    Either way it is newer than the sources, so cocotb-test does not recompile.
+    """
+    os.makedirs(sim_build, exist_ok=True)
+    target = os.path.join(sim_build, toplevel)
+    executable = os.path.join(build_dir, toplevel)
+    if os.path.exists(target):
+        os.remove(target)
+    if os.path.isfile(executable):
+        shutil.copy2(executable, target)
+    else:
+        with open(target, "w") as f:
+            f.write(f"{build_dir}\n")
+    os.utime(target)
+
+
+def run(**kwargs):
+    """
+    cocotb_test.simulator.run on the selected backend, with the GHDL compile step
+    served from the cache
+    """
+    __tracebackhide__ = True  # Hide the traceback when using PyTest.
+
+    sim = backend()
+    # extra_args reach analysis, elaboration and run on both backends
+    kwargs["extra_args"] = [std_flag(sim)] + list(kwargs.get("extra_args") or [])
+    if sim == "ghdl" and kwargs.get("waves") and os.getenv("WAVE_FORMAT", "ghw") == "vcd":
+        kwargs["waves"] = False
+        kwargs["sim_args"] = list(kwargs.get("sim_args") or []) + [f"--vcd={kwargs['toplevel']}.vcd"]
+
+    if sim != "ghdl" or os.getenv("HDL_CACHE", "1") == "0" or kwargs.get("force_compile"):
+        return simulator.run(**kwargs)
+
+    toplevel = kwargs["toplevel"]
+    vhdl_sources = [os.path.abspath(path) for path in kwargs["vhdl_sources"]]
+    # Same order as cocotb-test's Ghdl
+    compile_args = (list(kwargs.get("compile_args") or []) + kwargs["extra_args"]
+                    + list(kwargs.get("vhdl_compile_args") or []))
+    sim_build = os.path.abspath(kwargs.get("sim_build", SIM_BUILD_ROOT))
+
+    build_dir = compile_ghdl(toplevel, vhdl_sources, compile_args)
+    stage(build_dir, toplevel, sim_build)
+
+    # `ghdl -r --workdir=<cache>` finds the analyzed library in the shared cache
+    kwargs["compile_args"] = list(kwargs.get("compile_args") or []) + [f"--workdir={build_dir}"]
+    kwargs["sim_build"] = sim_build
+    return simulator.run(**kwargs)
+
+
+def run_json_tb(name, sim_build, spec=None, extra_env=None, **kwargs):
+    """
+    run() for a cocotb test that exchanges JSON with its launcher: spec is written to
+    <sim_build>/<name>_spec.json and passed as <NAME>_SPEC, the test writes its result
+    to <NAME>_RESULT (sim_farm.read_spec / write_result). An old result is removed
+    first, so a crashed or timed-out simulation returns None rather than a stale one.
+    Returns (result or None, wall seconds of build and run).
+    """
+    sim_build = os.path.abspath(sim_build)
+    os.makedirs(sim_build, exist_ok=True)
+    result_path = os.path.join(sim_build, f"{name}_result.json")
+    if os.path.exists(result_path):
+        os.remove(result_path)
+    env = {"COCOTB_LOG_FILE": "stdout", f"{name.upper()}_RESULT": result_path, **(extra_env or {})}
+    if spec is not None:
+        spec_path = os.path.join(sim_build, f"{name}_spec.json")
+        with open(spec_path, "w") as f:
+            json.dump(spec, f)
+        env[f"{name.upper()}_SPEC"] = spec_path
+
+    start = time.perf_counter()
+    try:
+        run(sim_build=sim_build, waves=False, gui=0, extra_env=env, **kwargs)
+    except SystemExit:
+        # A failing test still writes its result, the caller decides from its content
+        pass
+    wall = time.perf_counter() - start
+    if not os.path.isfile(result_path):
+        return None, wall
+    with open(result_path) as f:
+        return json.load(f), wall
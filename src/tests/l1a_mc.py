@@ -0,0 +1,330 @@
+"""
+Description: Detector-scale L1A rate Monte Carlo of the self trigger
+
+Runs many self_trig modules (28 ETROCs each) over seconds of beam time without a
+simulator. Each module is the flash_bit / enable_i / active_enable / OR-reduction path
+of Top.vhd and trigger_rx.vhd at one rate, slip 0:
+
+- every ETROC word flashes its flash bit every 2*FLASH_PERIOD edges from its phase,
+  on top of Poisson noise (per bit and edge) and hits (per word and edge, one bit)
+- the flash_bit FSMs are golden_model.FlashBitModel run on the sparse events, so
+  lock-in, unlocks and the clearing of the flash bit are the RTL behaviour
+- a hit sampled at edge t passes if it survives the clearing, its enable_i bit is set
+  and the word is ACTIVE after edge t + 3 (active_enable), trigger_o follows after
+  edge t + TRIGGER_LATENCY; trigger_o pulses of a module are its triggers
+
+The L1A is the OR of every module's trigger_o. Per module and in total it reports
+
+    triggers, rate_hz   trigger_o pulses and their rate, share of the summed rates
+    lock_s              time until every ETROC word of the module was ACTIVE
+    unlocks             ACTIVE words falling back to INIT
+    dead_fraction       time with at least one ETROC word of the module not ACTIVE
+    lockin/unlock_dead  ETROC word time spent before the first lock / after an unlock
+
+Modules and beam time are sharded into (segment, module) units over a process pool.
+Segment 0 starts from reset, later segments start with every word locked on its flash
+(warm_start.locked_state), so an unlock running across a segment boundary ends there.
+Every unit has its own seed, results do not depend on the number of processes.
+
+    python src/tests/l1a_mc.py --modules 72 --seconds 2 --noise 1e-6 --hits 1e-5 -o l1a.json
+    python src/tests/l1a_mc.py --config detector.json --rate 1 -j 16
+
+A --config JSON holds {"rate", "flash_period", "threshold" (all optional), "modules":
+[{"name", "noise", "hits", "phases", "flash_bits", "enable"}]}, each module entry a
+number for every ETROC word of the rate or a list with one per word (28, 14 or 7).
+Missing phases are drawn at random, flash_bits default to 0 and enable to all ones.
+"""
+
+import argparse
+import json
+import math
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from golden_model import TRIGGER_LATENCY, FlashBitModel, etroc_width
+from time_scale import FLASH_PERIOD
+from warm_start import locked_state
+
+
+CLOCK_HZ = 40079000   # Top.vhd g_CLK_FREQUENCY, LHC bunch clock
+UPLINK_WIDTH = 224
+THRESHOLD = 10
+RATE = 0
+MODULES = 36
+SECONDS = 1.0
+SEGMENT_S = 0.25      # beam time per work unit
+NOISE = 1e-6          # per bit and edge
+HITS = 1e-5           # per ETROC word and edge
+SEED = 1
+
+# active_o row gating data_masked for a hit sampled at edge t (active_enable, one edge
+# after the active_o register, data_masked is flash data_o delayed by four edges)
+MASK_ACTIVE_LAG = 3
+_ACTIVE_AT_END = np.iinfo(np.int64).max
+
+
+def default_params(**overrides):
+    params = {"rate": RATE, "flash_period": FLASH_PERIOD, "threshold": THRESHOLD,
+              "uplink_width": UPLINK_WIDTH, "clock_hz": CLOCK_HZ}
+    params.update({key: value for key, value in overrides.items() if value is not None})
+    return params
+
+
+def resolve_module(spec, params, rng, index=0):
+    """Module entry with one value per ETROC word of the rate for every field, phases drawn if missing"""
+    width = etroc_width(params["rate"])
+    num_words = params["uplink_width"] // width
+    period = 2 * params["flash_period"]
+    phases = spec.get("phases")
+    if phases is None:
+        phases = rng.integers(0, period, num_words)
+    defaults = {"noise": NOISE, "hits": HITS, "phases": phases, "flash_bits": 0, "enable": (1 << width) - 1}
+
+    module = {"name": spec.get("name", f"m{index}")}
+    for key, default in defaults.items():
+        value = spec.get(key, default)
+        value = np.broadcast_to(value, num_words) if np.ndim(value) == 0 else np.asarray(value)
+        if len(value) != num_words:
+            raise ValueError(f"module {module['name']}: {key} needs {num_words} values at rate {params['rate']}, "
+                             f"got {len(value)}")
+        module[key] = value.tolist()
+    if any(not 0 <= bit < width for bit in module["flash_bits"]):
+        raise ValueError(f"module {module['name']}: flash_bits must be below {width}")
+    return module
+
+
+def module_events(module, params, start, cycles, rng):
+    """Per ETROC word (edges, values) of one segment: flashes, noise and hits, sorted and merged"""
+    width = etroc_width(params["rate"])
+    period = 2 * params["flash_period"]
+    events = []
+    for phase, bit, noise, hits in zip(module["phases"], module["flash_bits"], module["noise"], module["hits"]):
+        flashes = np.arange((phase - start) % period, cycles, period, dtype=np.int64)
+        count = rng.poisson(cycles * width * noise) + rng.poisson(cycles * hits)
+        times = np.concatenate([flashes, rng.integers(0, cycles, count)])
+        values = np.concatenate([np.full(len(flashes), 1 << bit, dtype=np.uint32),
+                                 np.left_shift(1, rng.integers(0, width, count)).astype(np.uint32)])
+
+        # Events on the same edge OR into one word
+        order = np.argsort(times, kind="stable")
+        times, values = times[order], values[order]
+        first = np.flatnonzero(np.diff(times, prepend=-1))
+        events.append((times[first], np.bitwise_or.reduceat(values, first) if len(first) else values))
+    return events
+
+
+def _live_cycles(intervals, num_words, cycles):
+    """Edges on which every word is ACTIVE, from the per word (start, stop) ranges"""
+    bounds = np.array([edge for word in intervals for edge in word], dtype=np.int64).reshape(-1, 2)
+    if len(bounds) == 0:
+        return 0
+    edges, inverse = np.unique(bounds.ravel(), return_inverse=True)
+    level = np.zeros(len(edges), dtype=np.int64)
+    np.add.at(level, inverse, np.tile([1, -1], len(bounds)))
+    spans = np.diff(np.append(edges, cycles))
+    return int(spans[np.cumsum(level) == num_words].sum())
+
+
+def simulate_module(module, params, events, start, cycles, warm):
+    """
+    One module over one segment. Returns the absolute trigger_o edges (sorted) and the
+    lock statistics of the segment.
+    """
+    width = etroc_width(params["rate"])
+    period = 2 * params["flash_period"]
+    fired, intervals = [], []
+    lock_cycle, unlocks, lockin_dead, unlock_dead = 0, 0, 0, 0
+    for iword, (times, values) in enumerate(events):
+        fsm = FlashBitModel(width, params["flash_period"], params["threshold"])
+        if warm:
+            phase, bit = module["phases"][iword], module["flash_bits"][iword]
+            fsm.restore(locked_state(bit, (phase - start) % period, params["flash_period"], params["threshold"]))
+        data_o, active = fsm.run_events(times, values, cycles)
+        intervals.append(active)
+
+        starts = np.array([s for s, _ in active], dtype=np.int64)
+        stops = np.array([s for _, s in active], dtype=np.int64)
+        if fsm.active_o:
+            stops[-1] = _ACTIVE_AT_END
+        gate = times + MASK_ACTIVE_LAG
+        j = np.searchsorted(starts, gate, side="right") - 1
+        live = (j >= 0) & (gate < stops[np.maximum(j, 0)]) if len(active) else np.zeros(len(times), dtype=bool)
+        fired.append(times[live & (data_o & module["enable"][iword] != 0)])
+
+        first_lock = active[0][0] if active else cycles
+        lock_cycle = None if lock_cycle is None or not active else max(lock_cycle, first_lock)
+        unlocks += sum(stop < cycles for _, stop in active)
+        lockin_dead += first_lock
+        unlock_dead += cycles - first_lock - sum(stop - s for s, stop in active)
+
+    return {
+        "trigger_edges": np.unique(np.concatenate(fired)) + start + TRIGGER_LATENCY,
+        "lock_cycle": lock_cycle,
+        "unlocks": unlocks,
+        "lockin_dead": lockin_dead,
+        "unlock_dead": unlock_dead,
+        "live_cycles": _live_cycles(intervals, len(events), cycles),
+    }
+
+
+def run_unit(unit):
+    """Worker: events and model of one (segment, module) unit"""
+    module, params = unit["module"], unit["params"]
+    rng = np.random.default_rng([unit["seed"], unit["index"], unit["segment"]])
+    events = module_events(module, params, unit["start"], unit["cycles"], rng)
+    result = simulate_module(module, params, events, unit["start"], unit["cycles"], warm=unit["segment"] > 0)
+    result.update(index=unit["index"], segment=unit["segment"], cycles=unit["cycles"])
+    return result
+
+
+def count_pulses(edges, last=-2):
+    """(pulses, last high edge) of sorted trigger_o edges, last continues a pulse from the previous segment"""
+    if len(edges) == 0:
+        return 0, last
+    pulses = 1 + int(np.count_nonzero(np.diff(edges) > 1)) - int(edges[0] == last + 1)
+    return pulses, int(edges[-1])
+
+
+def make_units(modules, params, seconds, segment_s, seed):
+    """(segment, module) work units, segment major so every segment completes in order"""
+    total = int(round(seconds * params["clock_hz"]))
+    segment_cycles = max(1, int(round(segment_s * params["clock_hz"])))
+    units = []
+    for segment, start in enumerate(range(0, total, segment_cycles)):
+        cycles = min(segment_cycles, total - start)
+        units.extend({"module": module, "params": params, "index": index, "segment": segment,
+                      "start": start, "cycles": cycles, "seed": seed}
+                     for index, module in enumerate(modules))
+    return units
+
+
+def simulate(modules, params, seconds=SECONDS, segment_s=SEGMENT_S, seed=SEED, jobs=None):
+    """Runs every unit on a process pool and reduces the segments as they complete"""
+    units = make_units(modules, params, seconds, segment_s, seed)
+    rows = [{"name": m["name"], "triggers": 0, "lock_cycle": 0, "unlocks": 0, "lockin_dead": 0,
+             "unlock_dead": 0, "live_cycles": 0, "_last": -2} for m in modules]
+    l1a, l1a_last, pending = 0, -2, []
+    start = time.perf_counter()
+
+    with ProcessPoolExecutor(jobs) as pool:
+        for result in pool.map(run_unit, units):
+            row = rows[result["index"]]
+            pulses, row["_last"] = count_pulses(result["trigger_edges"], row["_last"])
+            row["triggers"] += pulses
+            if result["segment"] == 0:
+                row["lock_cycle"] = result["lock_cycle"]
+            for key in ("unlocks", "lockin_dead", "unlock_dead", "live_cycles"):
+                row[key] += result[key]
+
+            pending.append(result["trigger_edges"])
+            if len(pending) == len(modules):
+                pulses, l1a_last = count_pulses(np.unique(np.concatenate(pending)), l1a_last)
+                l1a += pulses
+                pending = []
+
+    return report(rows, params, units, l1a, time.perf_counter() - start)
+
+
+def report(rows, params, units, l1a, run_time_s):
+    clock = params["clock_hz"]
+    cycles = sum(u["cycles"] for u in units if u["index"] == 0)
+    num_words = params["uplink_width"] // etroc_width(params["rate"])
+    total_rate = sum(row["triggers"] for row in rows) * clock / cycles
+    modules = []
+    for row in rows:
+        rate_hz = row["triggers"] * clock / cycles
+        modules.append({
+            "name": row["name"],
+            "triggers": row["triggers"],
+            "rate_hz": rate_hz,
+            "share": rate_hz / total_rate if total_rate else 0.0,
+            "lock_s": None if row["lock_cycle"] is None else row["lock_cycle"] / clock,
+            "unlocks": row["unlocks"],
+            "dead_fraction": 1 - row["live_cycles"] / cycles,
+            "lockin_dead": row["lockin_dead"] / (num_words * cycles),
+            "unlock_dead": row["unlock_dead"] / (num_words * cycles),
+        })
+
+    locks = [m["lock_s"] for m in modules]
+    aggregate = {
+        "modules": len(rows),
+        "etrocs": len(rows) * params["uplink_width"] // 8,
+        "seconds": cycles / clock,
+        "l1a": l1a,
+        "l1a_rate_hz": l1a * clock / cycles,
+        "sum_module_rate_hz": total_rate,
+        "lock_s": None if None in locks else max(locks, default=0.0),
+        "unlocks": sum(m["unlocks"] for m in modules),
+        "dead_fraction": float(np.mean([m["dead_fraction"] for m in modules])),
+        "lockin_dead": float(np.mean([m["lockin_dead"] for m in modules])),
+        "unlock_dead": float(np.mean([m["unlock_dead"] for m in modules])),
+        "units": len(units),
+        "run_time_s": run_time_s,
+    }
+    return {"params": params, "aggregate": aggregate, "modules": modules}
+
+
+def print_table(result, top=10):
+    a = result["aggregate"]
+    lock = "-" if a["lock_s"] is None else f"{a['lock_s'] * 1e3:.2f} ms"
+    print(f"{a['modules']} modules / {a['etrocs']} ETROCs, {a['seconds']:.3f} s of beam at rate {result['params']['rate']}")
+    print(f"L1A {a['l1a']} ({a['l1a_rate_hz']:.1f} Hz, sum of modules {a['sum_module_rate_hz']:.1f} Hz), "
+          f"lock-in {lock}, {a['unlocks']} unlocks, dead {a['dead_fraction']:.2e} "
+          f"(lock-in {a['lockin_dead']:.2e}, unlocks {a['unlock_dead']:.2e}), "
+          f"{a['units']} units in {a['run_time_s']:.1f} s")
+    print(f"{'module':>10} {'triggers':>9} {'rate Hz':>10} {'share':>6} {'lock ms':>8} {'unlocks':>7} {'dead':>9}")
+    for m in sorted(result["modules"], key=lambda m: -m["triggers"])[:top]:
+        lock = "-" if m["lock_s"] is None else f"{m['lock_s'] * 1e3:.2f}"
+        print(f"{m['name']:>10} {m['triggers']:>9} {m['rate_hz']:>10.1f} {m['share']:>6.3f} {lock:>8} "
+              f"{m['unlocks']:>7} {m['dead_fraction']:>9.2e}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--config", default=None, help="JSON detector description, see the module docstring")
+    parser.add_argument("--modules", type=int, default=MODULES, help="identical modules without --config")
+    parser.add_argument("--noise", type=float, default=NOISE, help="noise occupancy per bit and edge")
+    parser.add_argument("--hits", type=float, default=HITS, help="hit occupancy per ETROC word and edge")
+    parser.add_argument("--rate", type=int, choices=(0, 1, 2), default=None)
+    parser.add_argument("--flash-period", type=int, default=None)
+    parser.add_argument("--threshold", type=int, default=None)
+    parser.add_argument("--seconds", type=float, default=SECONDS, help="beam time")
+    parser.add_argument("--segment-s", type=float, default=SEGMENT_S, help="beam time per work unit")
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="worker processes, all CPUs by default")
+    parser.add_argument("--top", type=int, default=10, help="modules listed in the table")
+    parser.add_argument("-o", "--output", default=None, help="write the full report as JSON")
+    args = parser.parse_args(argv)
+
+    config = {}
+    if args.config:
+        with open(args.config) as f:
+            config = json.load(f)
+    # Command line settings win over the config file
+    params = default_params(**{key: config.get(key) for key in ("rate", "flash_period", "threshold")})
+    for key, value in (("rate", args.rate), ("flash_period", args.flash_period), ("threshold", args.threshold)):
+        if value is not None:
+            params[key] = value
+
+    specs = config.get("modules") or [{"noise": args.noise, "hits": args.hits} for _ in range(args.modules)]
+    rng = np.random.default_rng(args.seed)
+    try:
+        modules = [resolve_module(spec, params, rng, index) for index, spec in enumerate(specs)]
+    except ValueError as exc:
+        parser.error(str(exc))
+    if not math.isfinite(args.seconds) or args.seconds <= 0 or args.segment_s <= 0:
+        parser.error("--seconds and --segment-s must be positive")
+
+    result = simulate(modules, params, args.seconds, args.segment_s, args.seed, args.jobs)
+    print_table(result, args.top)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,283 @@
+"""
+Description: Lock-in time scan of the flash_bit search algorithm
+
+After a reset every flash_bit walks its index in INIT until the first '1', confirms
+it in SEARCH on THRESHOLD flashes 2*FLASH_PERIOD apart and only then goes ACTIVE. A
+noise hit picked as candidate costs a full 2*FLASH_PERIOD before INIT starts again,
+so the time to ACTIVE depends on the hit occupancy and on the flashing bit position.
+
+Every point of the grid (DATA_WIDTH x THRESHOLD x occupancy x flashing bit index)
+runs --trials cold starts through golden_model.FlashBitModel, each with a random
+flash phase and Poisson noise hits on every other bit (occupancy = probability per
+bit and cycle). Per point it reports
+
+    locked              trials ACTIVE within the budget
+    lock_periods        p50 / p90 / p99 / max time to ACTIVE in FLASH_PERIODs, histogram
+    in_test_budget      trials locked within the (2*DATA_WIDTH)+THRESHOLD+10 periods of test_flashbit.py
+    unlocks             active_o falls after the first lock, summed over the trials
+    false_locks         trials ending ACTIVE on a bit other than the flashing one
+
+--ghdl N replays the first N trials of every point on flash_bit in GHDL (lock_scan_tb)
+and fails when the lock cycle or the unlocks differ from the model.
+
+    python src/tests/lock_scan.py --widths 8 16 32 --occupancy 0 1e-5 1e-4 1e-3 -o lock_scan.json
+    python src/tests/lock_scan.py --widths 8 --indices 0 7 --thresholds 4 10 --ghdl 2
+"""
+
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import cocotb
+import numpy as np
+from cocotb.clock import Clock
+from cocotb.triggers import ClockCycles
+
+from golden_model import ACTIVE, FlashBitModel
+from hdl_build import run_json_tb
+from sim_farm import (CLK_PERIOD_NS, SIM_BUILD_ROOT, monitor_changes, pulses_to_events, read_spec, skip_cycles,
+                      write_result)
+from sweep import lock_stats
+
+
+FLASH_PERIOD = 3546
+WIDTHS = (8, 16, 32)
+THRESHOLDS = (10,)
+OCCUPANCIES = (0.0, 1e-5, 1e-4, 1e-3)
+TRIALS = 50
+BUDGET_FACTOR = 2   # simulated periods per trial, in multiples of the test_flashbit budget
+SEED = 1
+
+HERE = os.path.abspath(os.path.dirname(__file__))
+RTL_DIR = os.path.join(HERE, "..", "hdl")
+SCAN_ROOT = os.path.join(SIM_BUILD_ROOT, "lock_scan")
+
+
+def flashbit_budget(width, threshold):
+    """Flash periods test_flashbit.py allows for the lock-in and the clear check"""
+    return 2 * width + threshold + 10
+
+
+def trial_stimulus(width, flash_period, index, phase, occupancy, cycles, seed):
+    """
+    data_i of one trial, one integer per cycle: the flashing bit `index` every
+    2 * flash_period cycles from `phase`, Poisson hits on every other bit
+    """
+    rng = np.random.default_rng(seed)
+    words = np.zeros(cycles, dtype=np.int64)
+    hits = rng.binomial(cycles * (width - 1), occupancy) if occupancy else 0
+    others = np.delete(np.arange(width), index)
+    np.bitwise_or.at(words, rng.integers(0, cycles, hits), np.int64(1) << rng.choice(others, hits))
+    words[phase::2 * flash_period] |= 1 << index
+    return words
+
+
+def trial_seeds(point, trials, seed=SEED):
+    """(flash phase, stimulus seed) of every trial of a point, reproducible per point"""
+    rng = np.random.default_rng([seed, point["width"], point["index"], point["threshold"],
+                                 int(round(point["occupancy"] * 1e12))])
+    phases = rng.integers(0, 2 * point["flash_period"], trials)
+    seeds = rng.integers(0, 2**32, trials)
+    return [(int(phase), int(s)) for phase, s in zip(phases, seeds)]
+
+
+def run_trial(point, phase, seed, cycles):
+    """(lock cycle or None, unlocks, ends ACTIVE on a bit other than the flashing one) from the model"""
+    words = trial_stimulus(point["width"], point["flash_period"], point["index"], phase,
+                           point["occupancy"], cycles, seed)
+    model = FlashBitModel(point["width"], point["flash_period"], point["threshold"])
+    _, active = model.run(words)
+    rises = np.flatnonzero(active)
+    if not len(rises):
+        return None, 0, False
+    lock = int(rises[0])
+    unlocks = int(np.count_nonzero(active[lock:-1] & ~active[lock + 1:]))
+    return lock, unlocks, model.state == ACTIVE and model.index != point["index"]
+
+
+def summarize(point, trials, budget_periods):
+    """Distribution of the (lock cycle, unlocks, false lock) trials of one point"""
+    period = point["flash_period"]
+    locks = np.array([lock for lock, _, _ in trials if lock is not None], dtype=np.int64)
+    periods = locks / period
+    summary = {
+        **point,
+        "trials": len(trials),
+        "budget_periods": budget_periods,
+        "locked": len(locks),
+        "in_test_budget": int(np.count_nonzero(periods <= flashbit_budget(point["width"], point["threshold"]))),
+        "unlocks": sum(unlocks for _, unlocks, _ in trials),
+        "false_locks": sum(false for _, _, false in trials),
+        "lock_periods": None,
+        "histogram": {},
+    }
+    if len(locks):
+        p50, p90, p99 = np.percentile(periods, [50, 90, 99])
+        summary["lock_periods"] = {"p50": p50, "p90": p90, "p99": p99, "max": float(periods.max())}
+        bins, counts = np.unique(np.floor(periods).astype(np.int64), return_counts=True)
+        summary["histogram"] = {str(b): int(c) for b, c in zip(bins, counts)}
+    return summary
+
+
+def scan_point(point, trials, budget_factor=BUDGET_FACTOR, seed=SEED):
+    """Model trials of one point, returns (summary, per trial (phase, seed, lock, unlocks))"""
+    budget_periods = budget_factor * flashbit_budget(point["width"], point["threshold"])
+    cycles = budget_periods * point["flash_period"]
+    results, raw = [], []
+    for phase, trial_seed in trial_seeds(point, trials, seed):
+        lock, unlocks, false = run_trial(point, phase, trial_seed, cycles)
+        results.append((lock, unlocks, false))
+        raw.append({"phase": phase, "seed": trial_seed, "lock_cycle": lock, "unlocks": unlocks})
+    return summarize(point, results, budget_periods), raw
+
+
+def expand_grid(widths, thresholds, occupancies, indices=None, flash_period=FLASH_PERIOD):
+    """Every point, indices=None scans every bit of each width"""
+    points = []
+    for width, threshold, occupancy in itertools.product(widths, thresholds, occupancies):
+        bits = range(width) if indices is None else [i for i in indices if i < width]
+        points.extend({"width": width, "threshold": threshold, "occupancy": occupancy, "index": index,
+                       "flash_period": flash_period} for index in bits)
+    return points
+
+
+# --- GHDL spot check ---
+
+@cocotb.test()
+async def lock_scan_tb(dut):
+    """
+    Replays the trials in LOCK_SCAN_SPEC on flash_bit and writes the lock cycle and
+    unlocks of each to LOCK_SCAN_RESULT
+    """
+    spec = read_spec("lock_scan")
+    point, cycles = spec["point"], spec["cycles"]
+    cocotb.start_soon(Clock(dut.clk_i, CLK_PERIOD_NS, units="ns").start())
+
+    results = []
+    for trial in spec["trials"]:
+        words = trial_stimulus(point["width"], point["flash_period"], point["index"], trial["phase"],
+                               point["occupancy"], cycles, trial["seed"])
+        events = pulses_to_events({int(c): int(words[c]) for c in np.flatnonzero(words)})
+
+        # Released right after an edge, the next edge is the model's first
+        dut.data_i.value = 0
+        dut.reset_i.value = 1
+        await ClockCycles(dut.clk_i, 2)
+        dut.reset_i.value = 0
+        edge0_ns = cocotb.utils.get_sim_time("ns") + CLK_PERIOD_NS
+
+        changes = []
+        monitor = cocotb.start_soon(monitor_changes(dut.active_o, edge0_ns, changes))
+        now = 0
+        for cycle, word in events:
+            if cycle >= cycles:
+                break
+            await skip_cycles(dut, cycle - now)
+            now = cycle
+            dut.data_i.value = word
+        await skip_cycles(dut, cycles - now)
+        monitor.kill()
+
+        lock, unlocks = lock_stats(changes, 1)
+        results.append({**trial, "ghdl_lock_cycle": lock, "ghdl_unlocks": unlocks})
+        dut._log.info(f"[Lock scan] phase {trial['phase']} seed {trial['seed']}: lock cycle {lock}, "
+                      f"unlocks {unlocks}, model {trial['lock_cycle']}, {trial['unlocks']}")
+
+    write_result("lock_scan", results)
+
+
+def ghdl_point(point, trials, cycles, root=SCAN_ROOT):
+    """Runs model trials of one point in GHDL, returns them with ghdl_lock_cycle / ghdl_unlocks added"""
+    spec = {"point": point, "cycles": cycles, "trials": trials}
+    # The hash covers flash_period, cycles and the trial phases / seeds, so other runs never share a directory
+    digest = hashlib.sha256(json.dumps(spec, sort_keys=True).encode()).hexdigest()[:12]
+    name = "w{width}_t{threshold}_i{index}_o{occupancy:g}_".format(**point) + digest
+    checked, _ = run_json_tb(
+        "lock_scan",
+        os.path.join(root, name),
+        spec,
+        vhdl_sources=[os.path.join(RTL_DIR, "flash.vhd")],
+        toplevel="flash_bit",
+        toplevel_lang="vhdl",
+        module="lock_scan",
+        python_search=[HERE],
+        parameters={"DATA_WIDTH": point["width"], "FLASH_PERIOD": point["flash_period"],
+                    "THRESHOLD": point["threshold"]},
+    )
+    if checked is None:
+        return [{**trial, "ghdl_lock_cycle": "error", "ghdl_unlocks": "error"} for trial in trials]
+    return checked
+
+
+def _scan(args):
+    return scan_point(*args)
+
+
+def print_table(summaries):
+    """One row per DATA_WIDTH / THRESHOLD / occupancy, trials pooled over the bit indices"""
+    print(f"{'width':>5} {'thr':>4} {'occupancy':>9} {'trials':>7} {'locked':>7} {'in test':>7} "
+          f"{'p50':>7} {'p90':>7} {'p99':>7} {'max':>7} {'unlocks':>7} {'false':>6}   (lock time in periods)")
+    key = lambda s: (s["width"], s["threshold"], s["occupancy"])
+    for (width, threshold, occupancy), group in itertools.groupby(sorted(summaries, key=key), key=key):
+        group = list(group)
+        periods = np.concatenate([np.repeat([int(b) for b in s["histogram"]], list(s["histogram"].values()))
+                                  for s in group] or [np.zeros(0)])
+        stats = (f"{np.percentile(periods, 50):>7.0f} {np.percentile(periods, 90):>7.0f} "
+                 f"{np.percentile(periods, 99):>7.0f} {periods.max():>7.0f}") if len(periods) else f"{'-':>31}"
+        print(f"{width:>5} {threshold:>4} {occupancy:>9.0e} {sum(s['trials'] for s in group):>7} "
+              f"{sum(s['locked'] for s in group):>7} {sum(s['in_test_budget'] for s in group):>7} {stats} "
+              f"{sum(s['unlocks'] for s in group):>7} {sum(s['false_locks'] for s in group):>6}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--widths", type=int, nargs="+", default=list(WIDTHS), choices=WIDTHS)
+    parser.add_argument("--thresholds", type=int, nargs="+", default=list(THRESHOLDS))
+    parser.add_argument("--occupancy", type=float, nargs="+", default=list(OCCUPANCIES),
+                        help="noise hits per bit and cycle")
+    parser.add_argument("--indices", type=int, nargs="+", default=None, help="flashing bits, all by default")
+    parser.add_argument("--flash-period", type=int, default=FLASH_PERIOD)
+    parser.add_argument("--trials", type=int, default=TRIALS, help="cold starts per point")
+    parser.add_argument("--budget-factor", type=int, default=BUDGET_FACTOR,
+                        help="simulated periods in multiples of the test_flashbit.py budget")
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="parallel model processes, all CPUs by default")
+    parser.add_argument("--ghdl", type=int, default=0, metavar="N", help="replay the first N trials per point in GHDL")
+    parser.add_argument("--root", default=SCAN_ROOT, help="GHDL build directories")
+    parser.add_argument("-o", "--output", default=None, help="write every point as JSON")
+    args = parser.parse_args(argv)
+
+    points = expand_grid(args.widths, args.thresholds, args.occupancy, args.indices, args.flash_period)
+    with ProcessPoolExecutor(args.jobs) as pool:
+        scanned = list(pool.map(_scan, [(point, args.trials, args.budget_factor, args.seed) for point in points]))
+    summaries = [summary for summary, _ in scanned]
+    print_table(summaries)
+
+    mismatches = []
+    if args.ghdl:
+        for summary, raw in scanned:
+            point = {key: summary[key] for key in ("width", "threshold", "occupancy", "index", "flash_period")}
+            checked = ghdl_point(point, raw[:args.ghdl], summary["budget_periods"] * point["flash_period"], args.root)
+            summary["ghdl"] = checked
+            for trial in checked:
+                if (trial["ghdl_lock_cycle"], trial["ghdl_unlocks"]) != (trial["lock_cycle"], trial["unlocks"]):
+                    mismatches.append(f"{point} phase {trial['phase']} seed {trial['seed']}: GHDL lock "
+                                      f"{trial['ghdl_lock_cycle']} / {trial['ghdl_unlocks']} unlocks, model "
+                                      f"{trial['lock_cycle']} / {trial['unlocks']}")
+        print(f"GHDL spot check: {sum(len(s['ghdl']) for s in summaries) - len(mismatches)} trials "
+              f"matched, {len(mismatches)} differ")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"seed": args.seed, "trials": args.trials, "points": summaries}, f, indent=2)
+    for msg in mismatches:
+        print(msg, file=sys.stderr)
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
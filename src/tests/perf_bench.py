@@ -0,0 +1,264 @@
+"""
+Description: Performance regression benchmarks of the testbenches with a stored history
+
+Runs self_trig_tb, flashbitclear_tb, flashclearv2_tb and bitslip_tb at a fixed
+RANDOM_SEED over a few generic configurations (CONFIGS) and records per configuration
+
+    build_s         analysis + elaboration, forced rebuild
+    wall_s          simulator start to finish
+    sim_cycles      simulated clock cycles, from the cocotb results file
+    cycles_per_s    sim_cycles per second of test time
+    artifact_bytes  size of the configuration's build / run directory
+    passed          every cocotb test passed
+
+Each run is compared with the median of the last --window runs of the same host and
+backend in the history file and fails (exit code 1) when wall_s, build_s or
+artifact_bytes grew, or cycles_per_s dropped, by more than --threshold. The run is
+then appended to the history.
+
+    python src/tests/perf_bench.py                                  # every configuration
+    python src/tests/perf_bench.py --configs bitslip_w32 flash_bit_w8 --no-record
+    python src/tests/perf_bench.py --list
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import xml.etree.ElementTree as ET
+
+from hdl_build import backend, run
+
+
+CLK_PERIOD_NS = 10
+SEED = 20240601
+HISTORY = "perf_history.json"
+THRESHOLD = 0.25
+WINDOW = 5
+# Differences below this many seconds are noise, whatever the ratio
+TIME_FLOOR_S = 0.5
+
+HERE = os.path.abspath(os.path.dirname(__file__))
+RTL_DIR = os.path.join(HERE, "..", "hdl")
+
+SELF_TRIG_SOURCES = ["def_pkg.vhd", "Top.vhd", "trigger_rx.vhd", "flash.vhd", "bitslip.vhd", "rate_counter.vhd"]
+
+# name: module, toplevel, sources, generics, environment of the simulation
+CONFIGS = {
+    "self_trig_n28_fp3546": {
+        "module": "test_Top", "toplevel": "self_trig", "sources": SELF_TRIG_SOURCES,
+        "parameters": {"g_CLK_FREQUENCY": 10000},
+        "env": {"RATE": "0"},
+    },
+    "self_trig_n28_fp354": {
+        "module": "test_Top", "toplevel": "self_trig", "sources": SELF_TRIG_SOURCES,
+        "parameters": {"g_CLK_FREQUENCY": 10000, "FLASH_PERIOD": 354},
+        "env": {"RATE": "0"},
+    },
+    "self_trig_n56_fp354": {
+        "module": "test_Top", "toplevel": "self_trig", "sources": SELF_TRIG_SOURCES,
+        "parameters": {"g_CLK_FREQUENCY": 10000, "FLASH_PERIOD": 354, "NUM_ETROCS": 56, "UPLINK_WIDTH": 448},
+        "env": {"RATE": "0"},
+    },
+    "flash_bit_w8": {
+        "module": "test_flashbit", "toplevel": "flash_bit", "sources": ["flash.vhd"],
+        "parameters": {"DATA_WIDTH": 8},
+        "env": {},
+    },
+    "flash_bit_w8_fp354": {
+        "module": "test_flashbit", "toplevel": "flash_bit", "sources": ["flash.vhd"],
+        "parameters": {"DATA_WIDTH": 8, "FLASH_PERIOD": 354},
+        "env": {},
+    },
+    "flash_bit_v2": {
+        "module": "test_v2-flashbit", "toplevel": "flash_bit", "sources": ["bitslip.vhd", "flash_v2.vhd"],
+        "parameters": {},
+        "env": {},
+    },
+    "bitslip_w32": {
+        "module": "test_bitslip", "toplevel": "bitslip", "sources": ["bitslip.vhd"],
+        "parameters": {"g_DATA_WIDTH": 32, "g_TRANSMIT_LOW_TO_HIGH": "true"},
+        "env": {"BITSLIP_WORDS": "20000"},
+    },
+}
+
+# metric: +1 when larger is worse, -1 when smaller is worse
+METRICS = {"build_s": 1, "wall_s": 1, "artifact_bytes": 1, "cycles_per_s": -1}
+# Durations, the only metrics TIME_FLOOR_S applies to
+DURATIONS = ("build_s", "wall_s")
+
+
+def _dir_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+    return total
+
+
+def _results(path):
+    """(sim_time_ns, test time s, failures) summed over the testcases of a cocotb results file"""
+    sim_ns, test_s, failures = 0.0, 0.0, 0
+    for case in ET.parse(path).iter("testcase"):
+        sim_ns += float(case.get("sim_time_ns", 0))
+        test_s += float(case.get("time", 0))
+        failures += len(list(case.iter("failure")))
+    return sim_ns, test_s, failures
+
+
+def bench_config(name, build_root):
+    config = CONFIGS[name]
+    sim_build = os.path.abspath(os.path.join(build_root, name))
+    common = dict(
+        vhdl_sources=[os.path.join(RTL_DIR, src) for src in config["sources"]],
+        toplevel=config["toplevel"],
+        toplevel_lang="vhdl",
+        module=config["module"],
+        python_search=[HERE],
+        parameters=config["parameters"],
+        sim_build=sim_build,
+        waves=False,
+        gui=0,
+    )
+
+    # Forced in place, the shared compilation cache would hide the build cost
+    start = time.perf_counter()
+    run(compile_only=True, force_compile=True, **common)
+    build = time.perf_counter() - start
+
+    results_file = os.path.join(sim_build, "perf_results.xml")
+    env = {"RANDOM_SEED": str(SEED), "COCOTB_RESULTS_FILE": results_file, **config["env"]}
+    # cocotb-test lets the calling environment override extra_env, so set it there
+    saved = {var: os.environ.get(var) for var in env}
+    os.environ.update(env)
+    start = time.perf_counter()
+    try:
+        run(**common)
+    except SystemExit:
+        # Failed tests are reported through the results file
+        pass
+    finally:
+        wall = time.perf_counter() - start
+        for var, value in saved.items():
+            if value is None:
+                os.environ.pop(var, None)
+            else:
+                os.environ[var] = value
+
+    sim_ns, test_s, failures = _results(results_file) if os.path.isfile(results_file) else (0.0, 0.0, 1)
+    cycles = int(sim_ns // CLK_PERIOD_NS)
+    return {
+        "build_s": build,
+        "wall_s": wall,
+        "sim_cycles": cycles,
+        "cycles_per_s": cycles / test_s if test_s else 0.0,
+        "artifact_bytes": _dir_size(sim_build),
+        "passed": failures == 0,
+    }
+
+
+def baseline(history, name, host, backend_name, window=WINDOW):
+    """Median of every metric over the last `window` passing runs of name on host / backend"""
+    runs = [entry["results"][name] for entry in history
+            if entry.get("host") == host and entry.get("backend") == backend_name
+            and entry["results"].get(name, {}).get("passed")]
+    runs = runs[-window:]
+    if not runs:
+        return None
+    return {metric: statistics.median(run[metric] for run in runs) for metric in METRICS}
+
+
+def regressions(result, base, threshold=THRESHOLD):
+    """Metrics of result worse than base by more than threshold, as messages"""
+    found = []
+    for metric, direction in METRICS.items():
+        old, new = base[metric], result[metric]
+        if not old:
+            continue
+        change = (new - old) / old * direction
+        if metric in DURATIONS and abs(new - old) < TIME_FLOOR_S:
+            continue
+        if change > threshold:
+            found.append(f"{metric} {old:.4g} -> {new:.4g} ({change:+.0%} worse, limit {threshold:.0%})")
+    return found
+
+
+def load_history(path):
+    if not os.path.isfile(path):
+        return []
+    with open(path) as f:
+        return json.load(f)
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--configs", nargs="+", choices=sorted(CONFIGS), default=list(CONFIGS))
+    parser.add_argument("--history", default=os.getenv("PERF_HISTORY", HISTORY))
+    parser.add_argument("--threshold", type=float, default=THRESHOLD, help="allowed relative regression")
+    parser.add_argument("--window", type=int, default=WINDOW, help="runs in the baseline median")
+    parser.add_argument("--build-root", default=os.path.join("sim_build", "perf"))
+    parser.add_argument("--no-record", action="store_true", help="compare only, do not append to the history")
+    parser.add_argument("--list", action="store_true", help="list the configurations and exit")
+    args = parser.parse_args(argv)
+
+    if args.list:
+        for name, config in CONFIGS.items():
+            print(f"{name:<22} {config['module']:<18} {config['parameters']}")
+        return 0
+
+    history = load_history(args.history)
+    entry = {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "host": platform.node(),
+        "backend": backend(),
+        "seed": SEED,
+        "results": {},
+    }
+
+    failed = []
+    print(f"{'config':<22} {'build s':>8} {'wall s':>8} {'cycles':>10} {'cyc/s':>9} {'MB':>7}  status")
+    for name in args.configs:
+        result = bench_config(name, args.build_root)
+        entry["results"][name] = result
+
+        status = "ok"
+        base = baseline(history, name, entry["host"], entry["backend"], args.window)
+        if not result["passed"]:
+            status = "FAILED tests"
+            failed.append(f"{name}: tests failed")
+        elif base is None:
+            status = "no baseline"
+        else:
+            found = regressions(result, base, args.threshold)
+            if found:
+                status = "REGRESSION"
+                failed.extend(f"{name}: {msg}" for msg in found)
+        print(f"{name:<22} {result['build_s']:>8.2f} {result['wall_s']:>8.2f} {result['sim_cycles']:>10} "
+              f"{result['cycles_per_s']:>9.0f} {result['artifact_bytes'] / 1e6:>7.1f}  {status}")
+
+    if not args.no_record:
+        history.append(entry)
+        with open(args.history, "w") as f:
+            json.dump(history, f, indent=2)
+
+    for msg in failed:
+        print(msg, file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
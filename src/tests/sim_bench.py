@@ -0,0 +1,217 @@
+"""
+Description: Simulator backend speed comparison
+
+Builds and runs self_trig, flash_bit and bitslip on every backend found on PATH
+(hdl_build.BACKENDS) and reports per toplevel:
+
+    elaboration_s          analysis + elaboration wall time, forced rebuild
+    free_running_cycles_s  clock only, Python wakes once for the whole run
+    driven_cycles_s        new random word on the data port and one output read per cycle
+    peak_rss_mb            largest resident set of the simulator processes
+
+    python src/tests/sim_bench.py                         # every backend and toplevel
+    python src/tests/sim_bench.py --backends nvc --toplevels self_trig --cycles 200000 -o bench.json
+
+Every backend/toplevel pair runs in its own Python process so the peak RSS taken
+from getrusage(RUSAGE_CHILDREN) belongs to that pair only.
+"""
+
+import argparse
+import json
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import time
+
+import cocotb
+from cocotb.clock import Clock
+from cocotb.triggers import RisingEdge, Timer
+
+
+CLK_PERIOD_NS = 10
+BENCH_CYCLES = 100_000
+
+HERE = os.path.abspath(os.path.dirname(__file__))
+RTL_DIR = os.path.join(HERE, "..", "hdl")
+
+# toplevel: sources, generics, data port, (input, value) set before the clock starts
+TOPLEVELS = {
+    "self_trig": {
+        "sources": ["def_pkg.vhd", "Top.vhd", "trigger_rx.vhd", "flash.vhd", "bitslip.vhd", "rate_counter.vhd"],
+        "parameters": {"g_CLK_FREQUENCY": 10000},
+        "data": "uplink_data_i",
+        "inputs": [("reset_i", 0), ("enable_i", -1), ("slip_i", 0), ("rate_i", 0)],
+    },
+    "flash_bit": {
+        "sources": ["flash.vhd"],
+        "parameters": {"DATA_WIDTH": 8},
+        "data": "data_i",
+        "inputs": [("reset_i", 0)],
+    },
+    "bitslip": {
+        "sources": ["bitslip.vhd"],
+        "parameters": {},
+        "data": "data_i",
+        "inputs": [("slip_cnt_i", 0)],
+    },
+}
+
+
+@cocotb.test()
+async def bench_tb(dut):
+    """Free-running and driven throughput of the toplevel, written to BENCH_RESULT"""
+    cycles = int(os.getenv("BENCH_CYCLES", BENCH_CYCLES))
+    unit = TOPLEVELS[os.environ["BENCH_TOPLEVEL"]]
+
+    for name, value in unit["inputs"]:
+        port = getattr(dut, name)
+        # -1 sets every bit of a vector
+        port.value = (1 << len(port)) - 1 if value == -1 else value
+    data = getattr(dut, unit["data"])
+    data.value = 0
+    width = len(data)
+
+    cocotb.start_soon(Clock(dut.clk_i, CLK_PERIOD_NS, units="ns").start())
+    await RisingEdge(dut.clk_i)
+
+    start = time.perf_counter()
+    await Timer(cycles * CLK_PERIOD_NS, units="ns")
+    free_running = time.perf_counter() - start
+
+    rng = random.Random(0)
+    words = [rng.getrandbits(width) for _ in range(1024)]
+    output = dut.trigger_o if hasattr(dut, "trigger_o") else dut.data_o
+    start = time.perf_counter()
+    for cycle in range(cycles):
+        data.value = words[cycle & 1023]
+        await RisingEdge(dut.clk_i)
+        output.value
+    driven = time.perf_counter() - start
+
+    result = {
+        "cycles": cycles,
+        "free_running_cycles_s": cycles / free_running,
+        "driven_cycles_s": cycles / driven,
+    }
+    with open(os.environ["BENCH_RESULT"], "w") as f:
+        json.dump(result, f)
+    dut._log.info(f"[Bench] {result}")
+
+
+def available_backends():
+    from hdl_build import BACKENDS
+    return [sim for sim in BACKENDS if shutil.which(sim)]
+
+
+def _peak_rss_mb():
+    # ru_maxrss is in kB on Linux
+    return resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+
+
+def bench_one(backend, toplevel, cycles, build_root):
+    """Runs inside its own process (--single): elaborate, simulate, return the measurements"""
+    os.environ["SIM"] = backend
+    from hdl_build import run
+
+    unit = TOPLEVELS[toplevel]
+    sim_build = os.path.abspath(os.path.join(build_root, f"{toplevel}_{backend}"))
+    result_path = os.path.join(sim_build, "bench_result.json")
+    common = dict(
+        vhdl_sources=[os.path.join(RTL_DIR, src) for src in unit["sources"]],
+        toplevel=toplevel,
+        toplevel_lang="vhdl",
+        module="sim_bench",
+        python_search=[HERE],
+        parameters=unit["parameters"],
+        sim_build=sim_build,
+        waves=False,
+        gui=0,
+    )
+
+    # The shared GHDL cache would hide the elaboration cost, so build in place
+    start = time.perf_counter()
+    run(compile_only=True, force_compile=True, **common)
+    elaboration = time.perf_counter() - start
+    elaboration_rss = _peak_rss_mb()
+
+    start = time.perf_counter()
+    run(extra_env={"BENCH_TOPLEVEL": toplevel, "BENCH_CYCLES": str(cycles), "BENCH_RESULT": result_path,
+                   "COCOTB_LOG_FILE": "stdout"},
+        **common)
+    wall = time.perf_counter() - start
+
+    with open(result_path) as f:
+        result = json.load(f)
+    result.update({
+        "backend": backend,
+        "toplevel": toplevel,
+        "elaboration_s": elaboration,
+        "run_wall_s": wall,
+        "elaboration_rss_mb": elaboration_rss,
+        "peak_rss_mb": _peak_rss_mb(),
+    })
+    return result
+
+
+def compare(results):
+    """{toplevel: fastest backend by driven throughput}"""
+    best = {}
+    for result in results:
+        current = best.get(result["toplevel"])
+        if current is None or result["driven_cycles_s"] > current["driven_cycles_s"]:
+            best[result["toplevel"]] = result
+    return {toplevel: result["backend"] for toplevel, result in best.items()}
+
+
+def print_table(results):
+    print(f"{'toplevel':<10} {'backend':<7} {'elab s':>8} {'free cyc/s':>12} {'driven cyc/s':>13} {'peak MB':>8}")
+    for r in results:
+        print(f"{r['toplevel']:<10} {r['backend']:<7} {r['elaboration_s']:>8.2f} "
+              f"{r['free_running_cycles_s']:>12.0f} {r['driven_cycles_s']:>13.0f} {r['peak_rss_mb']:>8.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--backends", nargs="+", default=None, help="default: every backend on PATH")
+    parser.add_argument("--toplevels", nargs="+", choices=sorted(TOPLEVELS), default=list(TOPLEVELS))
+    parser.add_argument("--cycles", type=int, default=BENCH_CYCLES)
+    parser.add_argument("--build-root", default=os.path.join("sim_build", "bench"))
+    parser.add_argument("-o", "--output", default="sim_bench.json")
+    parser.add_argument("--single", nargs=2, metavar=("BACKEND", "TOPLEVEL"), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.single:
+        print(json.dumps(bench_one(*args.single, args.cycles, args.build_root)))
+        return 0
+
+    backends = args.backends or available_backends()
+    if not backends:
+        parser.error("no simulator backend found on PATH")
+
+    results = []
+    for backend in backends:
+        for toplevel in args.toplevels:
+            proc = subprocess.run(
+                [sys.executable, __file__, "--single", backend, toplevel,
+                 "--cycles", str(args.cycles), "--build-root", args.build_root],
+                stdout=subprocess.PIPE, text=True)
+            if proc.returncode:
+                print(f"{toplevel} on {backend} failed (exit {proc.returncode})", file=sys.stderr)
+                continue
+            # The result is the last line, the simulator log comes before it
+            results.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+
+    print_table(results)
+    fastest = compare(results)
+    for toplevel, backend in fastest.items():
+        print(f"fastest for {toplevel}: {backend}")
+    with open(args.output, "w") as f:
+        json.dump({"results": results, "fastest": fastest}, f, indent=2)
+    return 0 if results else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
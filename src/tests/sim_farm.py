@@ -0,0 +1,114 @@
+"""
+Description: Helpers to split long testbenches into independent simulation units
+
+A testbench that loops over rates or bit indices reads the values it should cover
+with selected(), the pytest launcher turns every value into its own parametrized
+test with its own sim_build directory. The units are independent simulator
+processes, so `pytest -n auto` (pytest-xdist) runs them concurrently and merges the
+results into one report.
+
+Select a subset from the command line with the same names, e.g.
+    RATE=1 pytest src/tests/test_Top.py
+    FLASH_IDX=0,7 pytest src/tests/test_flashbit.py
+
+It also holds the clock and sparse driving helpers shared by the testbenches and the
+tools that run their own cocotb test (sweep, lock_scan, flash_ab, batch_wrapper), and
+the simulator side of their JSON spec / result exchange (hdl_build.run_json_tb).
+"""
+
+import json
+import os
+
+import cocotb
+from cocotb.triggers import Edge, RisingEdge, Timer
+
+
+SIM_BUILD_ROOT = "sim_build"
+CLK_PERIOD_NS = 10
+
+
+def _parse(text):
+    return [int(value) for value in str(text).split(",") if value.strip()]
+
+
+def selected(name, default):
+    """
+    Simulator side: values given with a +NAME=a,b plusarg, by the launcher (unit_env)
+    or with a NAME=a,b environment variable, default (an iterable) when none is set
+    """
+    plusargs = getattr(cocotb, "plusargs", None) or {}
+    if name in plusargs:
+        return _parse(plusargs[name])
+    for var in (f"SIM_UNIT_{name}", name):
+        if os.environ.get(var):
+            return _parse(os.environ[var])
+    return list(default)
+
+
+def units(name, default):
+    """Launcher side: values to parametrize over, narrowed by a NAME environment variable"""
+    if os.environ.get(name):
+        return [value for value in _parse(os.environ[name]) if value in list(default)]
+    return list(default)
+
+
+def sim_build_dir(toplevel, **unit):
+    """Separate build/run directory per toplevel and unit so units can run concurrently"""
+    suffix = "".join(f"_{key}{value}" for key, value in sorted(unit.items()))
+    return os.path.join(SIM_BUILD_ROOT, f"{toplevel}{suffix}")
+
+
+def unit_env(**unit):
+    """
+    extra_env entries that select a unit inside the simulation. They use their own
+    names because cocotb-test lets the calling environment override extra_env.
+    """
+    return {f"SIM_UNIT_{key.upper()}": str(value) for key, value in unit.items()}
+
+
+def read_spec(name):
+    """Simulator side: the spec hdl_build.run_json_tb handed over in <NAME>_SPEC"""
+    with open(os.environ[f"{name.upper()}_SPEC"]) as f:
+        return json.load(f)
+
+
+def write_result(name, result):
+    """Simulator side: result for hdl_build.run_json_tb, written to <NAME>_RESULT"""
+    with open(os.environ[f"{name.upper()}_RESULT"], "w") as f:
+        json.dump(result, f, indent=2)
+
+
+def pulses_to_events(pulses):
+    """
+    Turn single cycle words {cycle: word} (bus is 0 on every other cycle) into the
+    sorted list of (cycle, word) changes a sparse driver has to apply
+    """
+    events = []
+    for cycle in sorted(pulses):
+        if events and events[-1][0] == cycle:
+            events[-1] = (cycle, pulses[cycle])
+        else:
+            events.append((cycle, pulses[cycle]))
+        if cycle + 1 not in pulses:
+            events.append((cycle + 1, 0))
+    return events
+
+
+async def skip_cycles(dut, cycles):
+    """
+    Same as ClockCycles(dut.clk_i, cycles) when called right after a rising edge, but
+    the bulk of the wait is one Timer ending half a period before the last edge, so
+    Python is not woken up on every clock edge in between
+    """
+    if cycles > 1:
+        await Timer(cycles * CLK_PERIOD_NS - CLK_PERIOD_NS // 2, units="ns")
+    if cycles > 0:
+        await RisingEdge(dut.clk_i)
+
+
+async def monitor_changes(signal, edge0_ns, changes):
+    """Wakes only when signal changes and appends (clock cycle, new value)"""
+    while True:
+        await Edge(signal)
+        cycle = int(cocotb.utils.get_sim_time("ns") - edge0_ns) // CLK_PERIOD_NS
+        changes.append((cycle, signal.value.integer))
@@ -0,0 +1,266 @@
+"""
+Description: Opt-in throughput profiler for the cocotb testbenches
+
+With SIM_PROFILE=1 a testbench started with start_profile() counts every signal
+read and write per handle, times the Python side of the run and splits each
+labelled phase into
+
+    simulator   wall time outside the cocotb scheduler: HDL evaluation and callbacks
+    python      coroutines, drivers, reference model calls, between triggers
+    gpi         signal reads / writes (part of the Python side, reported apart)
+    logging     record formatting and console / file output (also part of the Python side)
+
+plus simulated cycles per wall second. Phases are marked in the testbench with
+
+    with phase("trigger injection"):
+        pulses = await drive_sparse(...)
+
+and are no-ops while profiling is off. finish_profile() logs a summary table and
+writes the profile as JSON (SIM_PROFILE_OUT, profile_<name>.json in the simulation
+directory by default).
+
+SIM_PROFILE       1 to enable, unset or 0 by default
+SIM_PROFILE_OUT   output path, may contain {name}
+SIM_PROFILE_TOP   handles listed in the summary table, 10 by default
+"""
+
+import contextlib
+import json
+import logging
+import os
+import time
+
+import cocotb
+from cocotb import handle as cocotb_handle
+from cocotb.utils import get_sim_time
+
+
+_active = None
+
+
+def enabled():
+    return os.getenv("SIM_PROFILE", "0") not in ("", "0")
+
+
+def _subclasses(cls):
+    for sub in cls.__subclasses__():
+        yield sub
+        yield from _subclasses(sub)
+
+
+class Profiler:
+    """GPI access counters and time split of one simulation, see the module docstring"""
+
+    def __init__(self, name, clk_period_ns=10):
+        self.name = name
+        self.clk_period_ns = clk_period_ns
+        self.accesses = {}  # handle path -> [reads, writes]
+        self.python_s = 0.0
+        self.gpi_s = 0.0
+        self.logging_s = 0.0
+        self.log_records = 0
+        self.phases = {}    # label -> accumulated deltas
+        self._depth = 0
+        self._react_start = 0.0
+        self._patched = []
+        self._start = None
+
+    # --- hooks ---
+
+    def _count(self, obj, index):
+        counts = self.accesses.get(obj._path)
+        if counts is None:
+            counts = self.accesses[obj._path] = [0, 0]
+        counts[index] += 1
+
+    def _wrap_property(self, cls, prop):
+        profiler = self
+
+        def fget(obj):
+            start = time.perf_counter()
+            try:
+                return prop.fget(obj)
+            finally:
+                profiler.gpi_s += time.perf_counter() - start
+                profiler._count(obj, 0)
+
+        def fset(obj, value):
+            start = time.perf_counter()
+            try:
+                prop.fset(obj, value)
+            finally:
+                profiler.gpi_s += time.perf_counter() - start
+                profiler._count(obj, 1)
+
+        self._patch(cls, "value", property(fget, fset if prop.fset else None, None, prop.__doc__))
+
+    def _patch(self, owner, attr, new):
+        self._patched.append((owner, attr, owner.__dict__[attr] if isinstance(owner, type) else getattr(owner, attr)))
+        setattr(owner, attr, new)
+
+    def install(self):
+        # Every handle class that defines its own value property
+        for cls in [cocotb_handle.NonHierarchyObject, *_subclasses(cocotb_handle.NonHierarchyObject)]:
+            if isinstance(cls.__dict__.get("value"), property):
+                self._wrap_property(cls, cls.__dict__["value"])
+
+        setimmediatevalue = cocotb_handle.NonHierarchyObject.setimmediatevalue
+
+        def counted_setimmediatevalue(obj, value):
+            start = time.perf_counter()
+            try:
+                setimmediatevalue(obj, value)
+            finally:
+                self.gpi_s += time.perf_counter() - start
+                self._count(obj, 1)
+
+        self._patch(cocotb_handle.NonHierarchyObject, "setimmediatevalue", counted_setimmediatevalue)
+
+        # Every simulator callback enters Python through the scheduler's _react, triggers
+        # look it up when they are primed, so an instance attribute catches them all
+        scheduler = cocotb.scheduler
+        react = scheduler._react
+
+        def timed_react(trigger):
+            if self._depth:
+                return react(trigger)
+            self._depth += 1
+            self._react_start = time.perf_counter()
+            try:
+                return react(trigger)
+            finally:
+                self.python_s += time.perf_counter() - self._react_start
+                self._depth -= 1
+
+        self._patched.append((scheduler, "_react", None))
+        scheduler._react = timed_react
+
+        call_handlers = logging.Logger.callHandlers
+
+        def timed_call_handlers(logger, record):
+            start = time.perf_counter()
+            try:
+                call_handlers(logger, record)
+            finally:
+                self.logging_s += time.perf_counter() - start
+                self.log_records += 1
+
+        self._patch(logging.Logger, "callHandlers", timed_call_handlers)
+        self._start = self._snapshot()
+
+    def uninstall(self):
+        for owner, attr, original in reversed(self._patched):
+            if original is None:
+                delattr(owner, attr)
+            else:
+                setattr(owner, attr, original)
+        self._patched = []
+
+    # --- accounting ---
+
+    def _python_s(self):
+        # Includes the part of the _react call still running
+        return self.python_s + (time.perf_counter() - self._react_start if self._depth else 0.0)
+
+    def _snapshot(self):
+        reads = sum(counts[0] for counts in self.accesses.values())
+        writes = sum(counts[1] for counts in self.accesses.values())
+        return {
+            "wall_s": time.perf_counter(),
+            "sim_ns": get_sim_time("ns"),
+            "python_s": self._python_s(),
+            "gpi_s": self.gpi_s,
+            "logging_s": self.logging_s,
+            "reads": reads,
+            "writes": writes,
+        }
+
+    def _split(self, delta):
+        """Derived figures of a snapshot difference"""
+        cycles = delta["sim_ns"] / self.clk_period_ns
+        wall = delta["wall_s"]
+        return {
+            "calls": delta.get("calls", 1),
+            "cycles": int(cycles),
+            "wall_s": wall,
+            "simulator_s": max(wall - delta["python_s"], 0.0),
+            "python_s": max(delta["python_s"] - delta["gpi_s"] - delta["logging_s"], 0.0),
+            "gpi_s": delta["gpi_s"],
+            "logging_s": delta["logging_s"],
+            "reads": delta["reads"],
+            "writes": delta["writes"],
+            "cycles_per_s": cycles / wall if wall else 0.0,
+        }
+
+    @contextlib.contextmanager
+    def phase(self, label):
+        before = self._snapshot()
+        try:
+            yield
+        finally:
+            after = self._snapshot()
+            delta = {key: after[key] - before[key] for key in before}
+            total = self.phases.setdefault(label, dict.fromkeys(delta, 0))
+            for key, value in delta.items():
+                total[key] += value
+            total["calls"] = total.get("calls", 0) + 1
+
+    def summary(self):
+        now = self._snapshot()
+        delta = {key: now[key] - self._start[key] for key in now}
+        hottest = sorted(self.accesses.items(), key=lambda item: -sum(item[1]))
+        return {
+            "name": self.name,
+            "clk_period_ns": self.clk_period_ns,
+            "log_records": self.log_records,
+            "total": self._split(delta),
+            "phases": {label: self._split(total) for label, total in self.phases.items()},
+            "handles": {path: {"reads": reads, "writes": writes} for path, (reads, writes) in hottest},
+        }
+
+    def table(self, summary=None, top=10):
+        summary = summary or self.summary()
+        rows = [("total", summary["total"])] + list(summary["phases"].items())
+        lines = [f"{'phase':<20} {'cycles':>10} {'cyc/s':>9} {'wall s':>8} {'sim s':>8} "
+                 f"{'py s':>8} {'gpi s':>8} {'log s':>8} {'reads':>9} {'writes':>9}"]
+        for label, p in rows:
+            lines.append(f"{label:<20} {p['cycles']:>10} {p['cycles_per_s']:>9.0f} {p['wall_s']:>8.2f} "
+                         f"{p['simulator_s']:>8.2f} {p['python_s']:>8.2f} {p['gpi_s']:>8.2f} "
+                         f"{p['logging_s']:>8.2f} {p['reads']:>9} {p['writes']:>9}")
+        lines.append(f"{'handle':<40} {'reads':>9} {'writes':>9}")
+        for path, counts in list(summary["handles"].items())[:top]:
+            lines.append(f"{path:<40} {counts['reads']:>9} {counts['writes']:>9}")
+        return "\n".join(lines)
+
+
+def start_profile(name, clk_period_ns=10):
+    """Installs the profiler when SIM_PROFILE is set, returns it (None when off)"""
+    global _active
+    if not enabled():
+        return None
+    _active = Profiler(name, clk_period_ns)
+    _active.install()
+    return _active
+
+
+def finish_profile(log=None):
+    """Removes the hooks, logs the summary table and writes the JSON profile"""
+    global _active
+    profiler, _active = _active, None
+    if profiler is None:
+        return None
+    profiler.uninstall()
+    summary = profiler.summary()
+    log = log or cocotb.log
+    log.info(f"[Profile {profiler.name}]\n" + profiler.table(summary, int(os.getenv("SIM_PROFILE_TOP", 10))))
+
+    path = os.getenv("SIM_PROFILE_OUT", "profile_{name}.json").format(name=profiler.name)
+    with open(path, "w") as f:
+        json.dump(summary, f, indent=2)
+    log.info(f"[Profile {profiler.name}] Written to {os.path.abspath(path)}")
+    return summary
+
+
+def phase(label):
+    """Context manager marking a phase of the active profile, a no-op when profiling is off"""
+    return _active.phase(label) if _active is not None else contextlib.nullcontext()
@@ -0,0 +1,136 @@
+"""
+Description: Pre-generated constrained-random uplink stimulus
+
+The whole run is built up front with NumPy as two compact arrays holding only the
+cycles where uplink_data_i changes: `cycles` and `words` (one packed row per change,
+byte k = bits 8k+7..8k as in golden_model). Every '1' is a single-cycle pulse, the
+bus returns to 0 on the next cycle unless another pulse follows. A driver only
+replays the arrays, and the same seed always gives the same run.
+
+    stim = generate(rate=0, cycles=246000, flash_period=3546, flash_interval=3546,
+                    hit_interval=6000, seed=7)
+    pulses = await drive_sparse(dut, stim.events(), stim.total_cycles)
+"""
+
+import numpy as np
+
+from golden_model import etroc_width
+
+
+class Stimulus:
+    """Sparse stimulus: cycles (sorted, int64) and words (len(cycles), uplink_width // 8) uint8"""
+
+    def __init__(self, cycles, words, total_cycles, hits, flash_bits, flash_offsets, flash_phases, seed):
+        self.cycles = cycles
+        self.words = words
+        self.total_cycles = total_cycles
+        self.hits = hits                    # (n, 2) int64 array of (cycle, uplink bit)
+        self.flash_bits = flash_bits        # absolute flashing bit of every ETROC word
+        self.flash_offsets = flash_offsets  # flashing bit inside every ETROC word
+        self.flash_phases = flash_phases    # first flash cycle of every ETROC word
+        self.seed = seed
+
+    def __len__(self):
+        return len(self.cycles)
+
+    def events(self):
+        """(cycle, word) changes for drive_sparse / expand_events"""
+        for cycle, row in zip(self.cycles.tolist(), self.words):
+            yield cycle, int.from_bytes(row.tobytes(), "little")
+
+    def dense(self):
+        """(total_cycles, uplink_width // 8) array with one row per cycle, e.g. for write_trace"""
+        out = np.zeros((self.total_cycles, self.words.shape[1]), dtype=np.uint8)
+        # Every non-zero word lasts a single cycle
+        out[self.cycles] = self.words
+        return out
+
+    def hit_map(self):
+        """{cycle: [uplink bits]} of the injected hits"""
+        out = {}
+        for cycle, bit in self.hits.tolist():
+            out.setdefault(cycle, []).append(bit)
+        return out
+
+
+def _resolve(value, rng, count, high, name):
+    """Per-ETROC offsets / phases from an int, "random" or a sequence"""
+    if isinstance(value, str):
+        if value != "random":
+            raise ValueError(f"{name} must be an int, a sequence or 'random', got {value!r}")
+        return rng.integers(0, high, count)
+    out = np.broadcast_to(np.asarray(value, dtype=np.int64), (count,)).copy()
+    if out.min() < 0 or out.max() >= high:
+        raise ValueError(f"{name} must be in 0..{high - 1}")
+    return out
+
+
+def generate(rate, cycles, flash_period, flash_interval=None, flash_offsets=0, flash_phases=0,
+             occupancy=0.0, hit_interval=None, burst_size=1, burst_length=1,
+             exclude_flash_bits=True, uplink_width=224, seed=None):
+    """
+    Constrained-random stimulus for one rate.
+
+    flash_interval     cycles between flashes of an ETROC word, 2 * flash_period by default
+    flash_offsets      flashing bit inside each ETROC word: int, sequence or "random"
+    flash_phases       first flash cycle of each ETROC word (< flash_interval): int, sequence or "random"
+    occupancy          probability of a hit per uplink bit and cycle (Poisson hits)
+    hit_interval       additionally one hit every hit_interval cycles, starting at hit_interval
+    burst_size         bits hit together by every hit (distinct random positions)
+    burst_length       consecutive cycles every hit is repeated on
+    exclude_flash_bits hits never land on a flashing bit
+    """
+    rng = np.random.default_rng(seed)
+    width = etroc_width(rate)
+    num_links = uplink_width // width
+    flash_interval = 2 * flash_period if flash_interval is None else flash_interval
+
+    offsets = _resolve(flash_offsets, rng, num_links, width, "flash_offsets")
+    phases = _resolve(flash_phases, rng, num_links, flash_interval, "flash_phases")
+    flash_bits = np.arange(num_links) * width + offsets
+
+    # Flashes: every ETROC word from its phase on, every flash_interval cycles
+    per_link = [np.arange(phase, cycles, flash_interval) for phase in phases]
+    flash_cycles = np.concatenate(per_link) if per_link else np.zeros(0, dtype=np.int64)
+    flash_bit_col = np.repeat(flash_bits, [len(c) for c in per_link])
+
+    # Hit times: periodic and Poisson
+    starts = [np.arange(hit_interval, cycles, hit_interval)] if hit_interval else []
+    num_random = rng.binomial(cycles * uplink_width, occupancy) if occupancy else 0
+    starts.append(np.sort(rng.integers(0, cycles, num_random)))
+    starts = np.concatenate(starts).astype(np.int64)
+
+    # Hit positions, burst_size distinct bits per hit drawn from the allowed bits
+    allowed = np.setdiff1d(np.arange(uplink_width), flash_bits) if exclude_flash_bits else np.arange(uplink_width)
+    if burst_size > len(allowed):
+        raise ValueError(f"burst_size {burst_size} exceeds the {len(allowed)} bits hits may use")
+    if burst_size == 1:
+        hit_bits = rng.choice(allowed, len(starts))
+    else:
+        picks = np.argsort(rng.random((len(starts), len(allowed))), axis=1)[:, :burst_size]
+        hit_bits = allowed[picks].ravel()
+    hit_cycles = np.repeat(starts, burst_size)
+
+    # Bursts repeat every hit on consecutive cycles
+    hit_cycles = (hit_cycles[:, None] + np.arange(burst_length)).ravel()
+    hit_bits = np.repeat(hit_bits, burst_length)
+    keep = hit_cycles < cycles
+    hits = np.stack([hit_cycles[keep], hit_bits[keep]], axis=1)
+    hits = hits[np.lexsort((hits[:, 1], hits[:, 0]))]
+
+    # Pack every '1' into the word of its cycle
+    all_cycles = np.concatenate([flash_cycles, hits[:, 0]])
+    all_bits = np.concatenate([flash_bit_col, hits[:, 1]])
+    pulse_cycles, row = np.unique(all_cycles, return_inverse=True)
+    pulse_words = np.zeros((len(pulse_cycles), uplink_width // 8), dtype=np.uint8)
+    np.bitwise_or.at(pulse_words, (row, all_bits // 8), (1 << (all_bits % 8)).astype(np.uint8))
+
+    # Return to 0 after every pulse that is not followed by another one
+    ends = pulse_cycles[np.append(np.diff(pulse_cycles) != 1, True)] + 1
+    ends = ends[ends < cycles]
+    change_cycles = np.concatenate([pulse_cycles, ends])
+    change_words = np.concatenate([pulse_words, np.zeros((len(ends), uplink_width // 8), dtype=np.uint8)])
+    order = np.argsort(change_cycles, kind="stable")
+
+    return Stimulus(change_cycles[order], change_words[order], cycles, hits,
+                    flash_bits, offsets, phases, seed)
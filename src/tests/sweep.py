@@ -0,0 +1,278 @@
+"""
+Description: Cached generic sweep of self_trig over FLASH_PERIOD, THRESHOLD, NUM_ETROCS and CNT_BITS
+
+Every point of the grid is one simulation of sweep_tb: a cold start from reset with a
+flashing bit at a random offset in every ETROC word of RATE, Poisson noise hits at
+OCCUPANCY and one injected hit every HIT_INTERVAL cycles. Per point it reports
+
+    lock_cycle          first cycle every flash_bit of the rate is ACTIVE (None if never)
+    unlocks             times the full lock was lost again afterwards
+    efficiency          injected hits after the lock followed by a trigger_o rise
+    fake_triggers       trigger_o rises after the lock explained by no hit
+    matches_model       trigger_o equals the golden model on every cycle
+    passed              locked within the run and matched the model
+    run_time_s          simulator wall time
+
+Results are cached in sim_build/sweep/results/<key>.json. The key covers the generics,
+the sweep settings, the VHDL sources (hdl_build.source_key) and this file, so
+points already simulated are read back instead of re-run. Points run in parallel,
+each in its own process and sim_build directory.
+
+    python src/tests/sweep.py -g THRESHOLD=4,6,10 -g FLASH_PERIOD=354,3546 -j 8
+    python src/tests/sweep.py -g NUM_ETROCS=28,56 -g CNT_BITS=16,26 --occupancy 1e-4 -o scan.json
+"""
+
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import cocotb
+import numpy as np
+from cocotb.clock import Clock
+
+from golden_model import etroc_width, trigger_pulses
+from hdl_build import backend, run_json_tb, simulator_version, source_key, std_flag
+from sim_farm import CLK_PERIOD_NS, SIM_BUILD_ROOT, write_result
+from stimulus import generate
+from test_Top import drive_sparse, reset_dut, run_model
+from test_latency import MATCH_WINDOW, match_hits
+from time_scale import flash_period
+
+
+SWEEP_GENERICS = ("FLASH_PERIOD", "THRESHOLD", "NUM_ETROCS", "CNT_BITS")
+DEFAULTS = {"FLASH_PERIOD": 3546, "THRESHOLD": 10, "NUM_ETROCS": 28, "CNT_BITS": 26}
+
+RATE = 0
+OCCUPANCY = 0.0
+HIT_INTERVAL = 97     # cycles between injected hits, above MATCH_WINDOW
+EXTRA_PERIODS = 20    # flash periods simulated after the nominal lock budget
+SEED = 1
+
+HERE = os.path.abspath(os.path.dirname(__file__))
+RTL_DIR = os.path.join(HERE, "..", "hdl")
+SOURCES = ["def_pkg.vhd", "Top.vhd", "trigger_rx.vhd", "flash.vhd", "bitslip.vhd", "rate_counter.vhd"]
+SWEEP_ROOT = os.path.join(SIM_BUILD_ROOT, "sweep")
+
+
+def lock_budget(rate, threshold):
+    """Flash periods a noiseless cold start needs at worst: one search per bit, then the confirmations"""
+    return 2 * (etroc_width(rate) + threshold + 2)
+
+
+def lock_stats(changes, locked):
+    """(first cycle active_o == locked, number of times it left locked afterwards) from (cycle, value) changes"""
+    lock_cycle, unlocks, was_locked = None, 0, False
+    for cycle, value in changes:
+        if value == locked and lock_cycle is None:
+            lock_cycle = cycle
+        if was_locked and value != locked:
+            unlocks += 1
+        was_locked = value == locked
+    return lock_cycle, unlocks
+
+
+@cocotb.test()
+async def sweep_tb(dut):
+    """One sweep point, settings from the SWEEP_* environment, result written to SWEEP_RESULT"""
+    cocotb.start_soon(Clock(dut.clk_i, CLK_PERIOD_NS, units="ns").start())
+
+    rate = int(os.getenv("SWEEP_RATE", RATE))
+    occupancy = float(os.getenv("SWEEP_OCCUPANCY", OCCUPANCY))
+    hit_interval = int(os.getenv("SWEEP_HIT_INTERVAL", HIT_INTERVAL))
+    seed = int(os.getenv("SWEEP_SEED", SEED))
+
+    UPLINK_WIDTH = dut.UPLINK_WIDTH.value.integer
+    NUM_ETROCS = dut.NUM_ETROCS.value.integer
+    FLASH_PERIOD = flash_period(dut)
+    THRESHOLD = dut.THRESHOLD.value.integer
+    label = f"[Sweep FLASH_PERIOD={FLASH_PERIOD} THRESHOLD={THRESHOLD} NUM_ETROCS={NUM_ETROCS}]"
+
+    num_links = UPLINK_WIDTH // etroc_width(rate)
+    total_cycles = (lock_budget(rate, THRESHOLD) + EXTRA_PERIODS) * FLASH_PERIOD
+
+    await reset_dut(dut)
+    dut.rate_i.value = rate
+    dut.enable_i.value = (1 << UPLINK_WIDTH) - 1
+    dut.slip_i.value = 0
+
+    stim = generate(rate, total_cycles, FLASH_PERIOD, flash_offsets="random", occupancy=occupancy,
+                    hit_interval=hit_interval, uplink_width=UPLINK_WIDTH, seed=seed)
+    events = list(stim.events())
+    active_changes = []
+    pulses = await drive_sparse(dut, events, total_cycles, watch={dut.active_o: active_changes})
+
+    # active_o for rates 1 and 2 sits in the upper bits of the port
+    locked = ((1 << num_links) - 1) << (NUM_ETROCS - num_links)
+    lock_cycle, unlocks = lock_stats(active_changes, locked)
+
+    hits, injected, efficiency, fakes = [], 0, None, 0
+    if lock_cycle is not None:
+        # Hits just before the lock may still trigger after it, they only explain rises
+        hit_cycles = np.unique(stim.hits[:, 0])
+        hits = [(int(cycle), 0) for cycle in hit_cycles[hit_cycles > lock_cycle - MATCH_WINDOW]]
+        latencies, _, fakes = match_hits(hits, [p for p in pulses if p[0] > lock_cycle])
+        is_injected = [cycle > lock_cycle and cycle % hit_interval == 0 for cycle, _ in hits]
+        injected = sum(is_injected)
+        found = sum(lat is not None for lat, inj in zip(latencies, is_injected) if inj)
+        efficiency = found / injected if injected else None
+
+    expected = trigger_pulses(run_model(dut, rate, events, total_cycles))
+    result = {
+        "rate": rate,
+        "occupancy": occupancy,
+        "seed": seed,
+        "cycles": total_cycles,
+        "lock_cycle": lock_cycle,
+        "lock_time_us": None if lock_cycle is None else lock_cycle * CLK_PERIOD_NS / 1000,
+        "unlocks": unlocks,
+        "injected_hits": injected,
+        "efficiency": efficiency,
+        "fake_triggers": fakes,
+        "fake_rate_per_cycle": fakes / (total_cycles - lock_cycle) if lock_cycle is not None else None,
+        "matches_model": expected == pulses,
+        "passed": lock_cycle is not None and expected == pulses,
+    }
+    write_result("sweep", result)
+    dut._log.info(f"{label} lock at {lock_cycle}, {unlocks} unlocks, efficiency {efficiency}, "
+                  f"{fakes} fake triggers (match window {MATCH_WINDOW}), model match {result['matches_model']}")
+
+
+def hdl_hash():
+    """Hash of the self_trig sources, language revision and simulator version"""
+    sim = backend()
+    sources = [os.path.join(RTL_DIR, src) for src in SOURCES]
+    return source_key("self_trig", sources, [std_flag(sim)], f"{sim} {simulator_version(sim)}")
+
+
+def _testbench_hash():
+    with open(__file__, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()[:16]
+
+
+def point_key(generics, settings, hdl):
+    text = json.dumps({"generics": generics, "settings": settings, "hdl": hdl, "tb": _testbench_hash()},
+                      sort_keys=True)
+    return hashlib.sha256(text.encode()).hexdigest()[:16]
+
+
+def expand_grid(grid):
+    """{name: [values]} -> list of full generic dicts, DEFAULTS for names not swept"""
+    names = list(grid)
+    points = []
+    for values in itertools.product(*(grid[name] for name in names)):
+        generics = {**DEFAULTS, **dict(zip(names, values))}
+        if generics["NUM_ETROCS"] % 4:
+            raise ValueError(f"NUM_ETROCS={generics['NUM_ETROCS']} must be a multiple of 4 (one 32-bit word per 4 ETROCs)")
+        points.append(generics)
+    return points
+
+
+def run_point(generics, settings, key, root):
+    """Simulates one point in its own process, returns the result dict"""
+    parameters = {**generics, "UPLINK_WIDTH": 8 * generics["NUM_ETROCS"], "g_CLK_FREQUENCY": 10000}
+    result, run_time = run_json_tb(
+        "sweep",
+        os.path.join(root, "build", key),
+        vhdl_sources=[os.path.join(RTL_DIR, src) for src in SOURCES],
+        toplevel="self_trig",
+        toplevel_lang="vhdl",
+        module="sweep",
+        python_search=[HERE],
+        parameters=parameters,
+        extra_env={f"SWEEP_{name.upper()}": str(value) for name, value in settings.items()},
+    )
+    if result is None:
+        result = {"passed": False, "error": "simulation did not finish"}
+    result.update({"generics": generics, "run_time_s": run_time})
+    return result
+
+
+def sweep(grid, settings, jobs=None, root=SWEEP_ROOT, refresh=False):
+    """
+    Runs every point of grid not in the cache, returns the results in grid order with
+    key and cached flags added
+    """
+    cache_dir = os.path.join(root, "results")
+    os.makedirs(cache_dir, exist_ok=True)
+    hdl = hdl_hash()
+
+    points = [(generics, point_key(generics, settings, hdl)) for generics in expand_grid(grid)]
+    results, todo = {}, []
+    for generics, key in points:
+        path = os.path.join(cache_dir, f"{key}.json")
+        if os.path.isfile(path) and not refresh:
+            with open(path) as f:
+                results[key] = {**json.load(f), "key": key, "cached": True}
+        else:
+            todo.append((generics, key))
+
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = {key: pool.submit(run_point, generics, settings, key, root) for generics, key in todo}
+        for key, future in futures.items():
+            result = future.result()
+            # Only finished simulations are cached, a crash is retried next time
+            if "error" not in result:
+                with open(os.path.join(cache_dir, f"{key}.json"), "w") as f:
+                    json.dump(result, f, indent=2)
+            results[key] = {**result, "key": key, "cached": False}
+
+    return [results[key] for _, key in points]
+
+
+def _parse_grid(items):
+    grid = {}
+    for item in items:
+        name, _, values = item.partition("=")
+        if name not in SWEEP_GENERICS:
+            raise argparse.ArgumentTypeError(f"{name} is not one of {SWEEP_GENERICS}")
+        grid[name] = [int(value) for value in values.split(",") if value.strip()]
+    return grid
+
+
+def print_table(results):
+    names = list(SWEEP_GENERICS)
+    print(" ".join(f"{name:>12}" for name in names)
+          + f" {'lock us':>9} {'unlocks':>7} {'eff':>6} {'fakes':>6} {'run s':>7} {'status':>7}")
+    for r in results:
+        eff = "-" if r.get("efficiency") is None else f"{r['efficiency']:.3f}"
+        lock = "-" if r.get("lock_time_us") is None else f"{r['lock_time_us']:.1f}"
+        status = ("pass" if r.get("passed") else "FAIL") + (" (c)" if r["cached"] else "")
+        print(" ".join(f"{r['generics'][name]:>12}" for name in names)
+              + f" {lock:>9} {r.get('unlocks', '-'):>7} {eff:>6} {r.get('fake_triggers', '-'):>6} "
+                f"{r['run_time_s']:>7.1f} {status:>7}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-g", "--generic", action="append", default=[], metavar="NAME=v1,v2",
+                        help=f"values of one of {', '.join(SWEEP_GENERICS)}, repeat for a grid")
+    parser.add_argument("--rate", type=int, default=RATE, choices=(0, 1, 2))
+    parser.add_argument("--occupancy", type=float, default=OCCUPANCY, help="noise hits per bit and cycle")
+    parser.add_argument("--hit-interval", type=int, default=HIT_INTERVAL)
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="parallel simulations, all CPUs by default")
+    parser.add_argument("--root", default=SWEEP_ROOT, help="build directories and result cache")
+    parser.add_argument("--refresh", action="store_true", help="re-simulate cached points")
+    parser.add_argument("-o", "--output", default=None, help="write every result as JSON")
+    args = parser.parse_args(argv)
+
+    try:
+        grid = _parse_grid(args.generic)
+    except argparse.ArgumentTypeError as exc:
+        parser.error(str(exc))
+
+    settings = {"rate": args.rate, "occupancy": args.occupancy, "hit_interval": args.hit_interval, "seed": args.seed}
+    results = sweep(grid, settings, args.jobs, args.root, args.refresh)
+    print_table(results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"settings": settings, "results": results}, f, indent=2)
+    return 0 if all(r.get("passed") for r in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,271 @@
+"""
+Description: Resource and logic depth scaling of self_trig over NUM_ETROCS (GHDL + Yosys)
+
+Synthesizes self_trig for every NUM_ETROCS (UPLINK_WIDTH = 8 * NUM_ETROCS) with the
+ghdl-yosys-plugin, no vendor tools: `synth -lut 6` maps to generic 6-input LUTs and
+single-bit flip-flops. From the netlists it reports per point
+
+    luts, ffs           totals of the design
+    modules             LUTs / FFs / instances per entity (flash_bit, bitslip, rate_counter,
+                        trigger_rx, self_trig), the logic of each level without its children
+    depth               LUT levels in front of the registers: the maximum over the design
+                        and of the OR tree stages or_8, or_16, or_32 and trigger_o
+    synth_s             Yosys wall time
+
+as JSON plus a table. Netlists and Yosys logs are kept in sim_build/synth/n<NUM_ETROCS>.
+
+    python src/tests/synth_report.py --num-etrocs 28 56 112 -o synth_scaling.json
+    python src/tests/synth_report.py --num-etrocs 28 -g FLASH_PERIOD=354 -j 1
+
+Requires yosys with the ghdl plugin (`yosys -m ghdl`), YOSYS selects the executable.
+"""
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from hdl_build import std_flag
+from sim_farm import SIM_BUILD_ROOT
+
+
+NUM_ETROCS = (28, 56, 112)
+TOPLEVEL = "self_trig"
+ENTITIES = ("self_trig", "trigger_rx", "flash_bit", "bitslip", "rate_counter")
+# OR tree stages whose registers get their own depth, matched on the last name component
+DEPTH_GROUPS = ("or_8", "or_16", "or_32", "trigger_o")
+LUT_SIZE = 6
+
+HERE = os.path.abspath(os.path.dirname(__file__))
+RTL_DIR = os.path.join(HERE, "..", "hdl")
+SOURCES = ["def_pkg.vhd", "Top.vhd", "trigger_rx.vhd", "flash.vhd", "bitslip.vhd", "rate_counter.vhd"]
+SYNTH_ROOT = os.path.join(SIM_BUILD_ROOT, "synth")
+
+_CLOCK_PORTS = ("C", "CLK")
+
+
+def yosys_script(generics, sources, hier_json, flat_json):
+    """Yosys commands: elaborate with GHDL, map to LUTs, write the netlist before and after flattening"""
+    gflags = " ".join(f"-g{name}={value}" for name, value in generics.items())
+    return "\n".join([
+        f"ghdl {std_flag('ghdl')} {gflags} {' '.join(sources)} -e {TOPLEVEL}",
+        f"synth -top {TOPLEVEL} -lut {LUT_SIZE}",
+        "opt_clean",
+        f"write_json {hier_json}",
+        "flatten",
+        "opt_clean",
+        f"write_json {flat_json}",
+    ]) + "\n"
+
+
+def _is_ff(cell):
+    return "Q" in cell["connections"]
+
+
+def cell_counts(module):
+    """(LUTs, FF bits, {submodule type: instances}) of the cells of one netlist module"""
+    luts = ffs = 0
+    children = {}
+    for cell in module["cells"].values():
+        if cell["type"] == "$lut":
+            luts += 1
+        elif _is_ff(cell):
+            ffs += len(cell["connections"]["Q"])
+        elif not cell["type"].startswith("$"):
+            children[cell["type"]] = children.get(cell["type"], 0) + 1
+    return luts, ffs, children
+
+
+def entity_of(module_name):
+    """Entity behind a GHDL module name (generic values are appended to the entity name)"""
+    name = module_name.lstrip("\\")
+    for entity in sorted(ENTITIES, key=len, reverse=True):
+        if name == entity or name.startswith(entity + "_"):
+            return entity
+    return name
+
+
+def hierarchy_breakdown(netlist, top=TOPLEVEL):
+    """
+    {entity: {"instances", "luts", "ffs"}} summed over every instance below top, each
+    level counting only its own cells, plus the design totals
+    """
+    modules = netlist["modules"]
+    counts = {name: cell_counts(module) for name, module in modules.items()}
+    top = next(name for name in modules if entity_of(name) == top)
+
+    breakdown = {}
+    stack = [(top, 1)]
+    while stack:
+        name, instances = stack.pop()
+        luts, ffs, children = counts[name]
+        row = breakdown.setdefault(entity_of(name), {"instances": 0, "luts": 0, "ffs": 0})
+        row["instances"] += instances
+        row["luts"] += instances * luts
+        row["ffs"] += instances * ffs
+        stack.extend((child, instances * n) for child, n in children.items() if child in modules)
+
+    totals = {"luts": sum(r["luts"] for r in breakdown.values()), "ffs": sum(r["ffs"] for r in breakdown.values())}
+    return breakdown, totals
+
+
+def logic_depth(module):
+    """
+    {FF cell name: combinational cells on the longest path into any of its non-clock
+    inputs}. Paths start at FF outputs, module ports and constants.
+    """
+    cells = module["cells"]
+    driver, inputs = {}, {}
+    for name, cell in cells.items():
+        dirs = cell.get("port_directions", {})
+        inputs[name] = [bit for port, bits in cell["connections"].items()
+                        if dirs.get(port) == "input" and port not in _CLOCK_PORTS
+                        for bit in bits if isinstance(bit, int)]
+        if not _is_ff(cell):
+            for port, bits in cell["connections"].items():
+                if dirs.get(port) == "output":
+                    driver.update((bit, name) for bit in bits if isinstance(bit, int))
+
+    depth = {}
+
+    def resolve(bit):
+        stack, on_path = [(bit, False)], set()
+        while stack:
+            b, expanded = stack.pop()
+            if b in depth:
+                continue
+            cell = driver.get(b)
+            if cell is None:
+                depth[b] = 0
+            elif expanded:
+                # Inputs still on the path close a combinational loop, they count as sources
+                on_path.discard(b)
+                depth[b] = 1 + max((depth.get(i, 0) for i in inputs[cell]), default=0)
+            else:
+                on_path.add(b)
+                stack.append((b, True))
+                stack.extend((i, False) for i in inputs[cell] if i not in depth and i not in on_path)
+        return depth[bit]
+
+    return {name: max((resolve(bit) for bit in inputs[name]), default=0)
+            for name, cell in cells.items() if _is_ff(cell)}
+
+
+def depth_report(netlist, top=TOPLEVEL, groups=DEPTH_GROUPS):
+    """Maximum LUT depth into any register and into the registers of each group"""
+    name = next(name for name in netlist["modules"] if entity_of(name) == top)
+    module = netlist["modules"][name]
+    ff_depth = logic_depth(module)
+
+    q_of = {}
+    for cell_name in ff_depth:
+        for bit in module["cells"][cell_name]["connections"]["Q"]:
+            q_of[bit] = cell_name
+
+    report = {"max": max(ff_depth.values(), default=0)}
+    for group in groups:
+        pattern = re.compile(rf"(^|[.\s]){re.escape(group)}$")
+        bits = {bit for net, info in module["netnames"].items() if pattern.search(net.lstrip("\\"))
+                for bit in info["bits"] if isinstance(bit, int)}
+        report[group] = max((ff_depth[q_of[bit]] for bit in bits if bit in q_of), default=None)
+    return report
+
+
+def synth_point(num_etrocs, generics=None, root=SYNTH_ROOT, yosys=None):
+    """Synthesizes one NUM_ETROCS, returns the result dict"""
+    generics = {**(generics or {}), "NUM_ETROCS": num_etrocs, "UPLINK_WIDTH": 8 * num_etrocs}
+    build = os.path.abspath(os.path.join(root, f"n{num_etrocs}"))
+    os.makedirs(build, exist_ok=True)
+    hier_json, flat_json = os.path.join(build, "hier.json"), os.path.join(build, "flat.json")
+    script = os.path.join(build, "synth.ys")
+    with open(script, "w") as f:
+        f.write(yosys_script(generics, [os.path.join(RTL_DIR, src) for src in SOURCES], hier_json, flat_json))
+
+    start = time.perf_counter()
+    log = os.path.join(build, "yosys.log")
+    result = {"num_etrocs": num_etrocs, "generics": generics}
+    try:
+        proc = subprocess.run([yosys or os.getenv("YOSYS", "yosys"), "-m", "ghdl", "-q", "-l", log, "-s", script],
+                              stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    except FileNotFoundError as exc:
+        result["error"] = f"yosys not found: {exc}"
+        return result
+    result["synth_s"] = time.perf_counter() - start
+    if proc.returncode:
+        result["error"] = f"yosys failed, see {log}: {proc.stdout.strip()[-500:]}"
+        return result
+
+    with open(hier_json) as f:
+        modules, totals = hierarchy_breakdown(json.load(f))
+    with open(flat_json) as f:
+        depth = depth_report(json.load(f))
+    result.update(totals)
+    result.update({"modules": modules, "depth": depth})
+    return result
+
+
+def _synth(args):
+    return synth_point(*args)
+
+
+def print_table(results):
+    print(f"{'ETROCs':>6} {'LUTs':>8} {'FFs':>8} {'LUT/ETROC':>9} {'FF/ETROC':>8} {'depth':>5} "
+          f"{'or_8':>4} {'or_16':>5} {'or_32':>5} {'trig':>4} {'synth s':>8}")
+    for r in results:
+        if "error" in r:
+            print(f"{r['num_etrocs']:>6}  {r['error']}")
+            continue
+        d = {key: "-" if value is None else value for key, value in r["depth"].items()}
+        print(f"{r['num_etrocs']:>6} {r['luts']:>8} {r['ffs']:>8} {r['luts'] / r['num_etrocs']:>9.1f} "
+              f"{r['ffs'] / r['num_etrocs']:>8.1f} {d['max']:>5} {d['or_8']:>4} {d['or_16']:>5} {d['or_32']:>5} "
+              f"{d['trigger_o']:>4} {r['synth_s']:>8.1f}")
+    for r in results:
+        if "modules" in r:
+            print(f"NUM_ETROCS={r['num_etrocs']}: " + ", ".join(
+                f"{entity} {row['instances']}x {row['luts']} LUT {row['ffs']} FF"
+                for entity, row in sorted(r["modules"].items(), key=lambda item: -item[1]["luts"])))
+
+
+def _parse_generics(items):
+    generics = {}
+    for item in items:
+        name, _, value = item.partition("=")
+        if not value:
+            raise argparse.ArgumentTypeError(f"expected NAME=value, got {item!r}")
+        generics[name] = int(value)
+    return generics
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--num-etrocs", type=int, nargs="+", default=list(NUM_ETROCS))
+    parser.add_argument("-g", "--generic", action="append", default=[], metavar="NAME=value",
+                        help="other self_trig generics, hardware defaults otherwise")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="parallel Yosys runs, all CPUs by default")
+    parser.add_argument("--root", default=SYNTH_ROOT, help="netlists and logs")
+    parser.add_argument("-o", "--output", default=None, help="write every result as JSON")
+    args = parser.parse_args(argv)
+
+    try:
+        generics = _parse_generics(args.generic)
+    except argparse.ArgumentTypeError as exc:
+        parser.error(str(exc))
+    for n in args.num_etrocs:
+        if n % 4:
+            parser.error(f"NUM_ETROCS={n}, must be a multiple of 4 for the rate 2 ETROC words")
+
+    with ProcessPoolExecutor(args.jobs) as pool:
+        results = list(pool.map(_synth, [(n, generics, args.root) for n in args.num_etrocs]))
+    print_table(results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"lut_size": LUT_SIZE, "results": results}, f, indent=2)
+    return 1 if any("error" in r for r in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,13 +4,36 @@ Author: Naomi Gonzalez
 Descrition: Testbench to full self trigger works as expected
 """
 
+import heapq
 import os
 import random
 
 import cocotb
+import numpy as np
+import pytest
 from cocotb.clock import Clock
-from cocotb.triggers import RisingEdge, Timer
-from cocotb_test.simulator import run
+from cocotb.triggers import FallingEdge, RisingEdge, Timer
+
+from bus_codec import decode_counts, read_counts
+from event_log import EventLog
+from func_coverage import finish_coverage, start_coverage, stimulus
+from golden_model import INTEGER_WIDTH, RATES, SelfTrigModel, expand_events, rate_counts, trigger_pulses
+from hdl_build import run
+from sim_farm import (CLK_PERIOD_NS, monitor_changes, pulses_to_events, selected, sim_build_dir, skip_cycles,
+                      unit_env, units)
+from sim_profile import finish_profile, phase, start_profile
+from stimulus import generate
+from time_scale import flash_period, rate_window, scale_parameters, scaled
+from uplink_trace import UplinkTrace, replay_model, write_trace
+from warm_start import deposit_checkpoint, locked_checkpoint, restore_model
+from wave_capture import full_waves, wave_capture
+
+
+# drive_sparse wake-up actions, samples are taken before the next word is driven
+SAMPLE, DRIVE = 0, 1
+
+# Length of the synthetic trace Test 4 replays when no UPLINK_TRACE is given
+REPLAY_CYCLES = 60000
 
 
 # reset function
@@ -22,6 +45,149 @@ async def reset_dut(dut):
     await RisingEdge(dut.clk_i)
     dut._log.info("DUT has been reset.")
 
+
+async def monitor_trigger(dut, edge0_ns, pulses):
+    """
+    Wakes only on trigger_o edges and appends (rise, fall) clock cycle numbers,
+    counted from the clock edge at edge0_ns. An open pulse is stored as (rise, None).
+    """
+    def cycle_now():
+        return int(cocotb.utils.get_sim_time("ns") - edge0_ns) // CLK_PERIOD_NS
+
+    while True:
+        await RisingEdge(dut.trigger_o)
+        pulses.append((cycle_now(), None))
+        await FallingEdge(dut.trigger_o)
+        pulses[-1] = (pulses[-1][0], cycle_now())
+
+
+async def drive_sparse(dut, events, total_cycles, on_event=None, watch=None, capture=None):
+    """
+    Drives uplink_data_i only on the cycles where it changes and sleeps with
+    skip_cycles in between. events are sorted (cycle, word) pairs, word is driven
+    before clock edge `cycle` and held until the next event. events may be a
+    generator (e.g. uplink_trace.UplinkTrace.events) unless capture is used. on_event(cycle, word)
+    is called after each word is driven. Returns the trigger_o pulses seen while
+    driving as (rise, fall) cycle pairs, fall == total_cycles if still high.
+    watch is an optional {signal handle: list} whose lists collect (cycle, value) changes.
+    capture is an optional wave_capture.WaveCapture, woken on the cycles it samples.
+    """
+    edge0_ns = cocotb.utils.get_sim_time("ns") + CLK_PERIOD_NS
+    pulses = []
+    monitors = [cocotb.start_soon(monitor_trigger(dut, edge0_ns, pulses))]
+    for signal, changes in (watch or {}).items():
+        monitors.append(cocotb.start_soon(monitor_changes(signal, edge0_ns, changes)))
+
+    # Sampling edge k happens right after it, i.e. when waking up for cycle k + 1
+    samples = () if capture is None else capture.sample_cycles(events, total_cycles)
+    wakes = heapq.merge(
+        ((int(cycle) + 1, SAMPLE, None) for cycle in samples),
+        ((cycle, DRIVE, word) for cycle, word in events),
+    )
+
+    now = 0
+    for cycle, action, word in wakes:
+        if action == DRIVE and cycle >= total_cycles:
+            break
+        if cycle > now:
+            await skip_cycles(dut, cycle - now)
+            now = cycle
+        if action == SAMPLE:
+            capture.sample(cycle - 1)
+        else:
+            dut.uplink_data_i.value = word
+            if on_event is not None:
+                on_event(cycle, word)
+
+    await skip_cycles(dut, total_cycles - now)
+    for monitor in monitors:
+        monitor.kill()
+    if capture is not None:
+        capture.finish()
+
+    return [(rise, total_cycles if fall is None else fall) for rise, fall in pulses]
+
+
+def make_model(dut, checkpoint=None):
+    """NumPy reference model with the DUT generics, from reset or a warm start"""
+    model = SelfTrigModel(
+        num_etrocs=dut.NUM_ETROCS.value.integer,
+        uplink_width=dut.UPLINK_WIDTH.value.integer,
+        flash_period=flash_period(dut),
+        threshold=dut.THRESHOLD.value.integer,
+    )
+    model.reset()
+    if checkpoint is not None:
+        restore_model(model, checkpoint)
+    return model
+
+
+def run_model(dut, rate, events, total_cycles, checkpoint=None):
+    """Replays a sparse stimulus through the NumPy reference model from reset or a warm start"""
+    model = make_model(dut, checkpoint)
+    return model.run(expand_events(events, total_cycles, model.uplink_width), rate=rate)
+
+
+def check_against_model(dut, label, rate, events, total_cycles, pulses, checkpoint=None, trace=None):
+    """
+    Scoreboard: replays the stimulus through the NumPy reference model (unless its
+    trace is given) and compares every trigger_o pulse (rise and fall cycle) with
+    the one seen on the DUT
+    """
+    if trace is None:
+        trace = run_model(dut, rate, events, total_cycles, checkpoint)
+    expected = trigger_pulses(trace)
+
+    failures = []
+    if expected != pulses:
+        missing = sorted(set(expected) - set(pulses))
+        extra = sorted(set(pulses) - set(expected))
+        msg = (f"{label} FAILED: trigger_o differs from the reference model, "
+               f"missing pulses {missing[:10]}, unexpected pulses {extra[:10]}")
+        dut._log.error(msg)
+        failures.append(msg)
+    else:
+        dut._log.info(f"{label} Scoreboard matched the reference model for {total_cycles} cycles "
+                      f"({len(expected)} trigger pulses).")
+    return failures
+
+def rate_counter_timer(dut, lane):
+    """timer of the rate_counter behind cnts_o lane `lane`"""
+    return dut.trigger_inst.cnt_gen[lane].trig_rate_counter_inst.timer
+
+
+def check_rate_counters(dut, label, trace, total_cycles, counts):
+    """
+    Compares cnts_o read after the last edge (counts) with the last complete window of
+    every lane predicted from the model's cnt_flag. The lane timers are read once to
+    place the windows, lanes enabled later than others start their windows later.
+    """
+    window = rate_window(dut)
+    cnt_bits = dut.CNT_BITS.value.integer
+    mismatches, checked = [], 0
+    for lane, got in enumerate(counts.tolist()):
+        # timer holds its value before edge total_cycles
+        phase = (rate_counter_timer(dut, lane).value.integer - total_cycles) % (window + 1)
+        latches, expected = rate_counts(trace["cnt_flag"][:, lane], window, cnt_bits, phase)
+        if not len(latches):
+            continue
+        checked += 1
+        # Only the low INTEGER_WIDTH bits of the CNT_BITS counter are exported
+        expected = int(expected[-1]) & ((1 << INTEGER_WIDTH) - 1)
+        if got != expected:
+            mismatches.append(f"lane {lane}: got {got}, expected {expected} (window ending at edge {latches[-1]})")
+
+    if mismatches:
+        msg = f"{label} FAILED: cnts_o differs from the reference rate counters: " + "; ".join(mismatches[:10])
+        dut._log.error(msg)
+        return [msg]
+    if checked:
+        dut._log.info(f"{label} cnts_o matched the last {window + 1}-cycle window of {checked} lanes.")
+    else:
+        dut._log.info(f"{label} No complete {window + 1}-cycle rate counter window, cnts_o not checked.")
+    return []
+
+
 async def run_no_trigger_test(dut, rate):
     """
     Test 1: Puts the flashing bit for every index at the correct flash period
@@ -30,7 +196,7 @@ async def run_no_trigger_test(dut, rate):
 
     # Capture declared generics
     UPLINK_WIDTH = dut.UPLINK_WIDTH.value.integer
-    FLASH_PERIOD = dut.FLASH_PERIOD.value.integer
+    FLASH_PERIOD = flash_period(dut)
     THRESHOLD = dut.THRESHOLD.value.integer
 
     etroc_width = 8 * (2**rate)
@@ -44,32 +210,29 @@ async def run_no_trigger_test(dut, rate):
     dut.enable_i.value = (1 << UPLINK_WIDTH) - 1  # All bits enabled
     dut.slip_i.value = 0
 
-    bit_state = 0
     failures = []
 
     # Simulation duration needs to be long enough to find flashing bits
     max_periods = THRESHOLD + 10 
+    total_cycles = max_periods * FLASH_PERIOD
 
-    for period in range(max_periods):
-        bit_state ^= 1  # toggles every flash period
-
-        # Send flashing bit in first cyle of this period for each ETROC word
-        pattern = 0
-        if bit_state == 1:
-            for i in range(num_links):
-                pattern |= (1 << (i * etroc_width))
-
-        dut.uplink_data_i.value = pattern
-        await RisingEdge(dut.clk_i)
-
-        # Send all 0's for rest of period
-        dut.uplink_data_i.value = 0
-        for _ in range(FLASH_PERIOD - 1):
-            if dut.trigger_o.value == 1:
-                msg = f"[Test 1, Rate {rate}] FAILED: trigger_o was asserted unexpectedly at clock cycle {cocotb.utils.get_sim_time('ns')} ns"
-                dut._log.error(msg)
-                failures.append(msg)
-            await RisingEdge(dut.clk_i)
+    # Flashing bit in first cycle of every other period for each ETROC word
+    flash_pattern = 0
+    for i in range(num_links):
+        flash_pattern |= (1 << (i * etroc_width))
+    flashes = {cycle: flash_pattern for cycle in range(0, total_cycles, 2 * FLASH_PERIOD)}
+
+    events = pulses_to_events(flashes)
+    with phase("reference model"):
+        trace = run_model(dut, rate, events, total_cycles)
+    capture = wave_capture(dut, f"test1_rate{rate}", trace)
+    with phase("lock-in"):
+        pulses = await drive_sparse(dut, events, total_cycles, capture=capture)
+
+    for rise, fall in pulses:
+        msg = f"[Test 1, Rate {rate}] FAILED: trigger_o was asserted unexpectedly at clock cycles {rise}-{fall - 1}"
+        dut._log.error(msg)
+        failures.append(msg)
 
     # Final check
     if dut.trigger_o.value == 1:
@@ -79,19 +242,20 @@ async def run_no_trigger_test(dut, rate):
     else:
         dut._log.info(f"[Test 1, Rate {rate}] PASSED: trigger_o correctly remained low.")
 
+    failures.extend(check_against_model(dut, f"[Test 1, Rate {rate}]", rate, events, total_cycles, pulses, trace=trace))
+
     return failures
 
 
 async def run_trigger_test(dut, rate):
     """
     Test 2: Puts a continuous flashing bit at a random index and injects hits
-    every 6000 cycles. Checks that trigger_o is 1 for hits and prints final counts.
+    every 6000 cycles. Checks that trigger_o is 1 for hits and that cnts_o holds the
+    last rate counter window of every lane.
     """
     UPLINK_WIDTH = dut.UPLINK_WIDTH.value.integer
-    FLASH_PERIOD = dut.FLASH_PERIOD.value.integer
-    NUM_ETROCS = dut.NUM_ETROCS.value.integer
-    INTEGER_WIDTH = 8
-    HIT_INTERVAL = 6000
+    FLASH_PERIOD = flash_period(dut)
+    HIT_INTERVAL = scaled(6000, minimum=64)
     NUM_HITS = 40
     TOTAL_CYCLES = HIT_INTERVAL * (NUM_HITS + 1) 
 
@@ -104,77 +268,54 @@ async def run_trigger_test(dut, rate):
     dut.slip_i.value = 0
     
     failures = []
-    trigger_count = 0
     
-    # Define ETROC parameters based on the rate
-    etroc_width = 8 * (2**rate)
-    num_links = UPLINK_WIDTH // etroc_width
-
-    # Choose one random bit for each ETROC word to be the flashing bit
-    flashing_bit_positions = []
-    for i in range(num_links):
-        # random_offset is a position within the ETROC word (e.g., 0 to 7 for rate 0)
-        # random_offset = random.randint(0, etroc_width - 1)
-        random_offset = 0
-        # Calculate the absolute position in the 224-bit uplink vector
-        absolute_pos = (i * etroc_width) + random_offset
-        flashing_bit_positions.append(absolute_pos)
-
-    dut._log.info(f"[Test 2, Rate {rate}] Using the following bits as continuous flashing bits: {flashing_bit_positions}")
-
-
-    for cycle in range(TOTAL_CYCLES):
-        # Toggle the flashing bits at the start of a flash period
-        flashing_pattern = 0
-        if cycle % FLASH_PERIOD == 0:
-            for pos in flashing_bit_positions:
-                flashing_pattern |= (1 << pos)
-        
-        # Create the hit pattern based on hit interval
-        hit_pattern = 0
-        if cycle > 0 and cycle % HIT_INTERVAL == 0:
-            hit_position = random.randint(0, UPLINK_WIDTH - 1)
-            # Check hit is not a flashing bit 
-            while hit_position in flashing_bit_positions:
-                hit_position = random.randint(0, UPLINK_WIDTH - 1)
-            hit_pattern = 1 << hit_position
-            dut._log.info(f"[Test 2, Rate {rate}] Injecting hit at cycle {cycle}, position {hit_position}.")
-
-            dut._log.info("--- DEBUG INFO ---")
-            dut._log.info(f"active_o = 0x{dut.active_o.value.integer:x}")
-            dut._log.info("--------------------")
-
-        # Combine patterns and drive the input
-        dut.uplink_data_i.value = flashing_pattern | hit_pattern
-        
-        await RisingEdge(dut.clk_i)
-        
-        if dut.trigger_o.value == 1:
-            trigger_count += 1
-            dut._log.info(f"[Test 2, Rate {rate}] Trigger detected at clock cycle {cycle + 1}!")
-
-    # Log the final counter values
-    full_counts_vector = dut.cnts_o.value
-    final_counts = []
-
-    dut._log.info("--- DEBUG INFO ---")
-    dut._log.info(f"Actual length of dut.cnts_o.value from simulator: {len(full_counts_vector)}")
-    dut._log.info(f"Loop is configured to run {NUM_ETROCS} times.")
-    dut._log.info("--------------------")
-
-    for i in range(NUM_ETROCS):
-        low_bit = i * INTEGER_WIDTH
-        
-        # Manually build the 8-bit string for the current counter
-        current_count_str = ""
-        for j in range(INTEGER_WIDTH):
-            # Prepend the bit to get the correct order (MSB on the left)
-            current_count_str = full_counts_vector[low_bit + j].binstr + current_count_str
-        
-        # Convert the manually built string to an integer
-        final_counts.append(int(current_count_str, 2))
-
-    dut._log.info(f"[Test 2, Rate {rate}] Final counter values (cnts_o): {final_counts}")
+    # Flashing bit at offset 0 of every ETROC word, toggled at the start of every flash
+    # period, one hit every HIT_INTERVAL cycles on any other bit
+    seed = random.getrandbits(32)
+    stim = generate(rate, TOTAL_CYCLES, FLASH_PERIOD, flash_interval=FLASH_PERIOD, flash_offsets=0,
+                    hit_interval=HIT_INTERVAL, uplink_width=UPLINK_WIDTH, seed=seed)
+    hits = stim.hit_map()
+
+    dut._log.info(f"[Test 2, Rate {rate}] Stimulus seed {seed}, {len(stim)} bus changes.")
+    dut._log.info(f"[Test 2, Rate {rate}] Using the following bits as continuous flashing bits: {stim.flash_bits.tolist()}")
+
+    # Start with every flash_bit already locked on its flashing bit, lock-in is covered by Test 3
+    checkpoint = locked_checkpoint(dut, rate, offsets=stim.flash_offsets.tolist(), first_flash=0)
+    deposit_checkpoint(dut, checkpoint)
+
+    # Hits, triggers, active_o changes and cnts_o go to a buffered event file (see event_log.py),
+    # the console only gets periodic counts
+    event_log = EventLog(f"test2_rate{rate}", dut._log, f"[Test 2, Rate {rate}]")
+
+    def log_hit(cycle, word):
+        if cycle in hits:
+            event_log.record("hit", cycle, position=hits[cycle][0])
+
+    events = list(stim.events())
+    with phase("reference model"):
+        trace = run_model(dut, rate, events, TOTAL_CYCLES, checkpoint)
+    capture = wave_capture(dut, f"test2_rate{rate}", trace)
+    # cnts_o only changes when the rate counters latch, so its changes are one counts
+    # snapshot per window (an unchanged window repeats the previous snapshot)
+    active_changes, cnts_changes = [], []
+    with phase("trigger injection"):
+        pulses = await drive_sparse(dut, events, TOTAL_CYCLES, on_event=log_hit,
+                                    watch={dut.active_o: active_changes, dut.cnts_o: cnts_changes},
+                                    capture=capture)
+
+    with phase("readout"):
+        trigger_count = 0
+        event_log.record_changes("active", active_changes)
+        for rise, fall in pulses:
+            trigger_count += fall - rise
+            event_log.record("trigger", rise, fall=fall)
+        num_etrocs = dut.NUM_ETROCS.value.integer
+        event_log.record_changes("counts", cnts_changes, "values", lambda bus: decode_counts(bus, None, num_etrocs))
+
+        # Final counter values, one read of cnts_o
+        final_counts = read_counts(dut)
+        event_log.record("counts", TOTAL_CYCLES, values=final_counts)
+        event_log.close()
 
     # Verify a trigger output for each hit sent
     if trigger_count < NUM_HITS - 1 : # Allow for some margin of error
@@ -184,23 +325,181 @@ async def run_trigger_test(dut, rate):
     else:
         dut._log.info(f"[Test 2, Rate {rate}] PASSED: Trigger test completed with {trigger_count} triggers.")
 
+    failures.extend(check_against_model(dut, f"[Test 2, Rate {rate}]", rate, events, TOTAL_CYCLES, pulses, trace=trace))
+    failures.extend(check_rate_counters(dut, f"[Test 2, Rate {rate}]", trace, TOTAL_CYCLES, final_counts))
+
     return failures
 
 
+async def run_lock_in_test(dut, rate):
+    """
+    Test 3: Cold start from reset with a flashing bit in every ETROC word. Checks every
+    flash_bit walks INIT -> SEARCH -> ACTIVE and active_o changes on the exact cycles
+    predicted by the reference model.
+    """
+    UPLINK_WIDTH = dut.UPLINK_WIDTH.value.integer
+    FLASH_PERIOD = flash_period(dut)
+    THRESHOLD = dut.THRESHOLD.value.integer
+    NUM_ETROCS = dut.NUM_ETROCS.value.integer
+
+    etroc_width = 8 * (2**rate)
+    num_links = UPLINK_WIDTH // etroc_width
+
+    dut._log.info(f"[Test 3, Rate {rate}] Starting lock-in test with {num_links} flashing links.")
+    await reset_dut(dut)
+
+    dut.rate_i.value = rate
+    dut.enable_i.value = (1 << UPLINK_WIDTH) - 1
+    dut.slip_i.value = 0
+
+    failures = []
+
+    # Flash found on the first period, then THRESHOLD confirmations two periods apart
+    total_cycles = (2 * THRESHOLD + 2) * FLASH_PERIOD
+
+    flash_pattern = 0
+    for i in range(num_links):
+        flash_pattern |= (1 << (i * etroc_width))
+    flashes = {cycle: flash_pattern for cycle in range(0, total_cycles, 2 * FLASH_PERIOD)}
+
+    events = pulses_to_events(flashes)
+    with phase("reference model"):
+        trace = run_model(dut, rate, events, total_cycles)
+    capture = wave_capture(dut, f"test3_rate{rate}", trace)
+    active_changes = []
+    with phase("lock-in"):
+        await drive_sparse(dut, events, total_cycles, watch={dut.active_o: active_changes}, capture=capture)
+
+    # active_o for rates 1 and 2 sits in the upper bits of the port
+    locked = ((1 << num_links) - 1) << (NUM_ETROCS - num_links)
+    if dut.active_o.value.integer != locked:
+        msg = (f"[Test 3, Rate {rate}] FAILED: active_o = 0x{dut.active_o.value.integer:x} "
+               f"after {total_cycles} cycles, expected 0x{locked:x}")
+        dut._log.error(msg)
+        failures.append(msg)
+
+    active = trace["active_o"]
+    changed = np.flatnonzero(np.any(active != np.vstack([np.zeros_like(active[:1]), active[:-1]]), axis=1))
+    expected = [(int(cycle), int.from_bytes(np.packbits(active[cycle], bitorder="little").tobytes(), "little"))
+                for cycle in changed]
+
+    if expected != active_changes:
+        msg = (f"[Test 3, Rate {rate}] FAILED: active_o changes {active_changes[:10]} "
+               f"differ from the reference model {expected[:10]}")
+        dut._log.error(msg)
+        failures.append(msg)
+    else:
+        lock_cycle = expected[-1][0] if expected else None
+        dut._log.info(f"[Test 3, Rate {rate}] PASSED: all {num_links} flash_bit instances locked at clock cycle {lock_cycle}.")
+
+    return failures
+
+
+def record_synthetic_trace(dut, path, rate, cycles, occupancy=1e-4, seed=None):
+    """
+    Writes a trace with a flashing bit at a random offset and phase in every ETROC word
+    plus random noise hits (occupancy = probability per bit and cycle). Returns the
+    warm-start checkpoint with every flash_bit locked on its flashing bit.
+    """
+    stim = generate(rate, cycles, flash_period(dut), flash_offsets="random", flash_phases="random",
+                    occupancy=occupancy, exclude_flash_bits=False,
+                    uplink_width=dut.UPLINK_WIDTH.value.integer, seed=seed)
+    write_trace(path, stim.dense(), rate, dut.NUM_ETROCS.value.integer)
+    return locked_checkpoint(dut, rate, offsets=stim.flash_offsets.tolist(), first_flash=stim.flash_phases.tolist())
+
+
+async def run_replay_test(dut, rate):
+    """
+    Test 4: Replays a recorded uplink trace (UPLINK_TRACE=<file>, see uplink_trace.py)
+    straight from the memory-mapped file, into the DUT as sparse changes and into the
+    reference model in chunks, and compares every trigger_o pulse. Without UPLINK_TRACE
+    a synthetic trace with noise and random flash phases is recorded first and the
+    DUT is warm-started locked on it.
+    """
+    NUM_ETROCS = dut.NUM_ETROCS.value.integer
+    UPLINK_WIDTH = dut.UPLINK_WIDTH.value.integer
+    label = f"[Test 4, Rate {rate}]"
+
+    path = os.getenv("UPLINK_TRACE")
+    checkpoint = None
+    if path:
+        trace = UplinkTrace(path)
+        if trace.rate != rate:
+            dut._log.info(f"{label} Skipped: {path} was recorded at rate {trace.rate}.")
+            return []
+        if trace.num_etrocs != NUM_ETROCS:
+            msg = f"{label} FAILED: {path} has NUM_ETROCS={trace.num_etrocs}, the DUT {NUM_ETROCS}"
+            dut._log.error(msg)
+            return [msg]
+    else:
+        path = f"replay_rate{rate}.etrt"
+        # Seeded from cocotb's RANDOM_SEED like the rest of the testbench
+        checkpoint = record_synthetic_trace(dut, path, rate, cycles=scaled(REPLAY_CYCLES, minimum=1000),
+                                            seed=random.getrandbits(32))
+        trace = UplinkTrace(path)
+
+    total_cycles = min(len(trace), int(os.getenv("UPLINK_TRACE_CYCLES", len(trace))))
+    dut._log.info(f"{label} Replaying {total_cycles} of {len(trace)} words from {path}.")
+    await reset_dut(dut)
+
+    dut.rate_i.value = rate
+    dut.enable_i.value = (1 << UPLINK_WIDTH) - 1
+    dut.slip_i.value = 0
+    if checkpoint is not None:
+        deposit_checkpoint(dut, checkpoint)
+
+    with phase("replay"):
+        pulses = await drive_sparse(dut, trace.events(stop=total_cycles), total_cycles)
+    with phase("reference model"):
+        expected = replay_model(make_model(dut, checkpoint), trace, rate, stop=total_cycles)
+
+    if expected != pulses:
+        missing = sorted(set(expected) - set(pulses))
+        extra = sorted(set(pulses) - set(expected))
+        msg = (f"{label} FAILED: trigger_o differs from the reference model, "
+               f"missing pulses {missing[:10]}, unexpected pulses {extra[:10]}")
+        dut._log.error(msg)
+        return [msg]
+
+    dut._log.info(f"{label} PASSED: {len(pulses)} trigger pulses match the reference model.")
+    return []
+
+
 @cocotb.test()
 async def self_trig_tb(dut):
-    """Main test function for that runs both tests for all possible rates"""
-    cocotb.start_soon(Clock(dut.clk_i, 10, units="ns").start())
+    """Main test function for that runs all tests for the selected rates (RATE, all by default)"""
+    cocotb.start_soon(Clock(dut.clk_i, CLK_PERIOD_NS, units="ns").start())
     all_failures = []
-
-    for rate in [0, 1, 2]:
-        # --- Run Test 1 ---
-        failures_t1 = await run_no_trigger_test(dut, rate)
-        all_failures.extend(failures_t1)
-
-        # --- Run Test 2 ---
-        failures_t2 = await run_trigger_test(dut, rate)
-        all_failures.extend(failures_t2)
+    rates = selected("RATE", RATES)
+
+    # Opt-in throughput profile, SIM_PROFILE=1 (see sim_profile.py)
+    start_profile("self_trig_rate" + "_".join(map(str, rates)), CLK_PERIOD_NS)
+    # Opt-in functional coverage, FUNC_COVERAGE=1 (see func_coverage.py)
+    start_coverage(dut, "self_trig_rate" + "_".join(map(str, rates)), CLK_PERIOD_NS)
+    try:
+        for rate in rates:
+            # --- Run Test 1 ---
+            with stimulus(f"no_trigger_rate{rate}"):
+                failures_t1 = await run_no_trigger_test(dut, rate)
+            all_failures.extend(failures_t1)
+
+            # --- Run Test 2 ---
+            with stimulus(f"trigger_rate{rate}"):
+                failures_t2 = await run_trigger_test(dut, rate)
+            all_failures.extend(failures_t2)
+
+            # --- Run Test 3 ---
+            with stimulus(f"lock_in_rate{rate}"):
+                failures_t3 = await run_lock_in_test(dut, rate)
+            all_failures.extend(failures_t3)
+
+            # --- Run Test 4 ---
+            with stimulus(f"replay_rate{rate}"):
+                failures_t4 = await run_replay_test(dut, rate)
+            all_failures.extend(failures_t4)
+    finally:
+        finish_profile(dut._log)
+        finish_coverage(dut._log)
 
     # Check if any failures occurred across all tests
     if all_failures:
@@ -211,10 +510,13 @@ async def self_trig_tb(dut):
         dut._log.info("All tests for all rates passed successfully! 🎉")
 
 
-def test_self_trig():
-    """Sets up cocotb to run the self_trig module test"""
-    os.environ.setdefault("SIM", "ghdl")
-    os.environ.setdefault("GHDL_FLAGS", "--std=08")
+@pytest.mark.parametrize("rate", units("RATE", RATES))
+def test_self_trig(rate):
+    """Sets up cocotb to run the self_trig module test, one simulation per rate"""
+    # The simulation runs inside its sim_build directory
+    for var in ("UPLINK_TRACE", "SIM_PROFILE_OUT", "FUNC_COVERAGE_OUT", "EVENT_LOG_OUT"):
+        if os.getenv(var):
+            os.environ[var] = os.path.abspath(os.environ[var])
 
     here = os.path.abspath(os.path.dirname(__file__))
     rtl_dir = os.path.join(here, "..", "hdl")
@@ -238,11 +540,13 @@ def test_self_trig():
         toplevel="self_trig",
         toplevel_lang="vhdl",
         module=os.path.splitext(os.path.basename(__file__))[0],
-        parameters=generics,
-        waves=True,
+        parameters=scale_parameters(generics),
+        sim_build=sim_build_dir("self_trig", rate=rate),
+        waves=full_waves(),
         gui=0,
         extra_env={
             "COCOTB_LOG_FILE": "stdout",
+            **unit_env(rate=rate),
         },
     )
 
@@ -0,0 +1,67 @@
+"""
+Description: Checks the bus layout, generated wrapper, packing and per instance
+checking of batch_wrapper.py. Runs without a simulator.
+"""
+
+import numpy as np
+
+import batch_wrapper as bw
+
+
+def test_layout_and_wrapper():
+    instances = bw.configurations("bitslip", [8, 32])
+    assert [g["g_TRANSMIT_LOW_TO_HIGH"] for g in instances] == [True, False, True, False]
+    slots, totals = bw.layout("bitslip", instances)
+    assert [s["data"] for s in slots] == [(0, 8), (8, 8), (16, 32), (48, 32)]
+    assert [s["ctrl"] for s in slots] == [(0, 3), (3, 3), (6, 5), (11, 5)]
+    assert totals == {"data": 80, "ctrl": 16, "status": 0}
+
+    vhdl = bw.wrapper_vhdl("bitslip", instances)
+    assert "entity batch_bitslip is" in vhdl and "status_o" not in vhdl and "reset_i" not in vhdl
+    # VHDL-93: the slip count is converted in a signal, the port actual is a plain name
+    assert "signal slip_3 : integer range 0 to 31;" in vhdl
+    assert "slip_3 <= to_integer(unsigned(ctrl_i(15 downto 11)));" in vhdl and "slip_cnt_i => slip_3" in vhdl
+    assert "data_o => data_o(79 downto 48)" in vhdl and "g_TRANSMIT_LOW_TO_HIGH => false" in vhdl
+    assert vhdl.count("entity work.bitslip") == 4
+
+    flash = bw.configurations("flash_bit", [8, 16], thresholds=[4, 10])
+    slots, totals = bw.layout("flash_bit", flash)
+    assert totals == {"data": 48, "ctrl": 0, "status": 4} and slots[3]["status"] == (3, 1)
+    vhdl = bw.wrapper_vhdl("flash_bit", flash)
+    assert "ctrl_i" not in vhdl and "active_o => status_o(3)" in vhdl and "THRESHOLD => 10" in vhdl
+
+
+def test_pack_roundtrip():
+    fields = [(0, 8), (8, 32), (40, 32)]
+    rng = np.random.default_rng(0)
+    columns = [rng.integers(0, 1 << width, 50, dtype=np.uint64) for _, width in fields]
+    bus = bw.pack(columns, fields)
+    assert max(bus) >= 1 << 64
+    for got, exp in zip(bw.unpack(bus, fields), columns):
+        np.testing.assert_array_equal(got, exp)
+
+
+def test_reference_and_check():
+    instances = bw.configurations("flash_bit", [8, 16], thresholds=[3], flash_period=20)
+    cycles = bw.default_cycles("flash_bit", instances)
+    assert cycles == (2 * 16 + 3 + 10) * 20
+    stimuli = bw.batch_stimulus("flash_bit", instances, cycles, occupancy=1e-3)
+    expected = bw.batch_expected("flash_bit", instances, stimuli)
+
+    got = [{bus: exp[bus].copy() for bus in exp} for exp in expected]
+    results = bw.check("flash_bit", instances, expected, got)
+    assert all(r["passed"] and r["lock_cycle"] is not None for r in results)
+
+    # A mismatch is reported on its own instance only
+    got[1]["data"][123] ^= np.uint64(1)
+    results = bw.check("flash_bit", instances, expected, got)
+    assert results[0]["passed"] and not results[1]["passed"]
+    assert (results[1]["data_mismatches"], results[1]["data_first_mismatch"]) == (1, 123)
+
+    bits = bw.configurations("bitslip", [8], low_to_high=[True])
+    stimuli = bw.batch_stimulus("bitslip", bits, 100)
+    assert stimuli[0]["ctrl"][:8].tolist() == list(range(8))
+    expected = bw.batch_expected("bitslip", bits, stimuli)
+    # Slip 0 on the first word passes the word before the stream through
+    assert expected[0]["data"][0] == 0
+    assert bw.check("bitslip", bits, expected, [dict(expected[0])])[0]["passed"]
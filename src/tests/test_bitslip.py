@@ -7,9 +7,23 @@ import os
 import random
 
 import cocotb
+import numpy as np
+import pytest
 from cocotb.clock import Clock
 from cocotb.triggers import RisingEdge
-from cocotb_test.simulator import run
+
+from batch_wrapper import configurations, run_batch
+from golden_model import bitslip
+from hdl_build import run
+from sim_farm import sim_build_dir
+from wave_capture import full_waves
+
+
+DATA_WIDTHS = (8, 16, 32)
+
+# Streaming test: random words back to back, one per clock, compared in batches
+STREAM_WORDS = int(os.getenv("BITSLIP_WORDS", 200_000))
+STREAM_BATCH = 4096
 
 
 def calculate_expected_output(current_data_i, prev_data_i, slip_count, data_width, transmit_low_to_high):
@@ -47,7 +61,7 @@ async def bitslip_tb(dut):
         await RisingEdge(dut.clk_i)
 
     DATA_WIDTH = dut.g_DATA_WIDTH.value.integer
-    TRANSMIT_LOW_TO_HIGH   = dut.g_TRANSMIT_LOW_TO_HIGH.value
+    TRANSMIT_LOW_TO_HIGH   = bool(dut.g_TRANSMIT_LOW_TO_HIGH.value)
 
     failures = [] 
 
@@ -97,11 +111,88 @@ async def bitslip_tb(dut):
         cocotb.log.info("All tests passed successfully 🎉")
 
 
-def test_bitslip():
-    """Sets up cocotb runs bitslip module test"""
-    os.environ.setdefault("SIM", "ghdl")         
-    os.environ.setdefault("GHDL_FLAGS", "--std=08 --vcd=bitslip.vcd")
-    
+@cocotb.test()
+async def bitslip_stream_tb(dut):
+    """
+    Streams STREAM_WORDS random words with a random slip count on every clock, no idle
+    cycles, and checks data_o against the vectorized reference in batches
+    """
+    cocotb.start_soon(Clock(dut.clk_i, 10, units="ns").start())
+
+    DATA_WIDTH = dut.g_DATA_WIDTH.value.integer
+    TRANSMIT_LOW_TO_HIGH = bool(dut.g_TRANSMIT_LOW_TO_HIGH.value)
+
+    rng = np.random.default_rng(DATA_WIDTH)
+    words = rng.integers(0, 1 << DATA_WIDTH, STREAM_WORDS, dtype=np.uint64)
+    slips = rng.integers(0, DATA_WIDTH, STREAM_WORDS)
+    slips[:DATA_WIDTH] = np.arange(DATA_WIDTH)  # every slip count at least once
+
+    # Word driven before the stream is 0
+    dut.slip_cnt_i.value = 0
+    dut.data_i.value = 0
+    for _ in range(3):
+        await RisingEdge(dut.clk_i)
+
+    prev = np.concatenate([[0], words[:-1]]).astype(np.uint64)
+    expected = bitslip(words, prev, slips, DATA_WIDTH, TRANSMIT_LOW_TO_HIGH)
+    got = np.zeros(STREAM_WORDS, dtype=np.uint64)
+
+    failures = []
+
+    def check(lo, hi):
+        bad = np.flatnonzero(got[lo:hi] != expected[lo:hi]) + lo
+        for t in bad[:10 - len(failures)]:
+            msg = (f"[FAIL] cycle={t} slip={slips[t]} prev={int(prev[t]):#x} cur={int(words[t]):#x} "
+                   f"exp={int(expected[t]):#x} got={int(got[t]):#x}")
+            cocotb.log.error(msg)
+            failures.append(msg)
+        return len(bad)
+
+    # data_o registered on edge t is read right after edge t + 1
+    mismatches = 0
+    word_list, slip_list = words.tolist(), slips.tolist()
+    for t in range(STREAM_WORDS + 1):
+        if t < STREAM_WORDS:
+            dut.data_i.value = word_list[t]
+            dut.slip_cnt_i.value = slip_list[t]
+        await RisingEdge(dut.clk_i)
+        if t:
+            got[t - 1] = dut.data_o.value.integer
+            if t % STREAM_BATCH == 0:
+                mismatches += check(t - STREAM_BATCH, t)
+
+    mismatches += check(STREAM_WORDS - STREAM_WORDS % STREAM_BATCH, STREAM_WORDS)
+
+    if mismatches:
+        raise cocotb.result.TestFailure(
+            f"{mismatches} of {STREAM_WORDS} words differ (width {DATA_WIDTH}, "
+            f"low to high {TRANSMIT_LOW_TO_HIGH}):\n" + "\n".join(failures)
+        )
+    cocotb.log.info(f"Streamed {STREAM_WORDS} words over all {DATA_WIDTH} slip counts, all matched 🎉")
+
+
+def test_bitslip_reference_vectorized():
+    """golden_model.bitslip agrees with calculate_expected_output, exhaustively for 8 bits"""
+    rng = np.random.default_rng(0)
+    for width in DATA_WIDTHS:
+        if width == 8:
+            cur, prev, slip = (a.ravel() for a in np.meshgrid(np.arange(256), np.arange(256), np.arange(8)))
+        else:
+            cur = rng.integers(0, 1 << width, 20000)
+            prev = rng.integers(0, 1 << width, 20000)
+            slip = rng.integers(0, width, 20000)
+        for low_to_high in (True, False):
+            got = bitslip(cur, prev, slip, width, low_to_high)
+            exp = [calculate_expected_output(c, p, s, width, low_to_high)
+                   for c, p, s in zip(cur.tolist(), prev.tolist(), slip.tolist())]
+            np.testing.assert_array_equal(got, np.array(exp, dtype=np.uint64),
+                                          err_msg=f"width {width} low to high {low_to_high}")
+
+
+@pytest.mark.parametrize("low_to_high", [True, False])
+@pytest.mark.parametrize("data_width", DATA_WIDTHS)
+def test_bitslip(data_width, low_to_high):
+    """Sets up cocotb runs bitslip module test, one simulation per width and direction"""
 
     here = os.path.abspath(os.path.dirname(__file__))
     rtl  = os.path.join(here, "..", "hdl")
@@ -111,7 +202,12 @@ def test_bitslip():
         toplevel="bitslip",
         toplevel_lang="vhdl",
         module=os.path.splitext(os.path.basename(__file__))[0],
-        waves=True,
+        parameters={
+            "g_DATA_WIDTH": data_width,
+            "g_TRANSMIT_LOW_TO_HIGH": str(low_to_high).lower(),
+        },
+        sim_build=sim_build_dir("bitslip", width=data_width, low_to_high=int(low_to_high)),
+        waves=full_waves(),
         gui=0,
         extra_env={         
             "COCOTB_LOG_FILE":  "stdout",         
@@ -119,6 +215,14 @@ def test_bitslip():
     )
 
 
+def test_bitslip_batch():
+    """Every width and direction side by side in one simulation (batch_wrapper.py)"""
+    report = run_batch("bitslip", configurations("bitslip", DATA_WIDTHS))
+    assert "error" not in report, report.get("error")
+    failed = [r for r in report["instances"] if not r["passed"]]
+    assert not failed, failed
+
+
 
 if __name__ == "__main__":
     import pytest, sys
@@ -0,0 +1,37 @@
+"""
+Description: Checks the packed-bus codec (bus_codec.py) against the bit layout of
+the self_trig ports. Runs without a simulator.
+"""
+
+import numpy as np
+
+import bus_codec as bc
+
+
+def test_lanes_round_trip():
+    """Lane I lands in bits (I+1)*8-1 downto I*8, like slip_i / cnts_o"""
+    rng = np.random.default_rng(5)
+    values = rng.integers(0, 256, 28)
+    bus = bc.pack_lanes(values)
+    assert bus == sum(int(v) << (8 * i) for i, v in enumerate(values))
+    np.testing.assert_array_equal(bc.unpack_lanes(bus, 28), values)
+
+    wide = rng.integers(0, 1 << 26, 7)
+    np.testing.assert_array_equal(bc.unpack_lanes(bc.pack_lanes(wide, 26), 7, 26), wide)
+
+
+def test_rate_layouts():
+    """Counters of rate 1/2 sit on every 2nd/4th lane, enable covers whole ETROC words"""
+    counts = sum((i + 1) << (8 * i) for i in range(28))
+    assert bc.decode_counts(counts, rate=0).tolist() == list(range(1, 29))
+    assert bc.decode_counts(counts, rate=1).tolist() == list(range(1, 29, 2))
+    assert bc.decode_counts(counts, rate=2).tolist() == list(range(1, 29, 4))
+
+    assert bc.encode_slip([3, 5]) == 3 | 5 << 8
+    np.testing.assert_array_equal(bc.decode_slip(bc.encode_slip([7] * 28)), [7] * 28)
+
+    flags = [True, False, True, False, False, False, True]
+    enable = bc.encode_enable(flags, rate=2)
+    assert enable == (0xFFFFFFFF) | (0xFFFFFFFF << 64) | (0xFFFFFFFF << 192)
+    assert bc.decode_enable(enable, rate=2).tolist() == flags
+    assert bc.decode_enable((1 << 224) - 1, rate=0).all()
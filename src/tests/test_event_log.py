@@ -0,0 +1,81 @@
+"""
+Description: Checks batching, file formats and console rate limiting of event_log.py.
+Runs without a simulator.
+"""
+
+import logging
+
+import numpy as np
+import pytest
+
+import event_log as el
+
+
+def _fill(events):
+    for cycle in range(10):
+        events.record("hit", cycle, position=cycle % 3)
+    events.record("trigger", 12, fall=14)
+    events.record("counts", 20, values=np.arange(4, dtype=np.uint64))
+
+
+def test_jsonl_batches(tmp_path, monkeypatch, caplog):
+    monkeypatch.setattr(el, "FLUSH_EVENTS", 5)
+    path = str(tmp_path / "events_{name}.{format}")
+    with caplog.at_level(logging.INFO):
+        with el.EventLog("t2", logging.getLogger("tb"), "[T2]", fmt="jsonl", path=path, interval_s=1e9) as events:
+            _fill(events)
+            # Two full batches are written before the end
+            assert len(events._buffer) == 2
+    rows = el.read_events(str(tmp_path / "events_t2.jsonl"))
+    assert [row["kind"] for row in rows] == ["hit"] * 10 + ["trigger", "counts"]
+    assert rows[4] == {"kind": "hit", "cycle": 4, "position": 1}
+    assert rows[-1]["values"] == [0, 1, 2, 3]
+    # Only the closing line, no per-event output
+    assert [r.message for r in caplog.records] == [
+        f"[T2] Events: 1 counts, 10 hit, 1 trigger, written to {tmp_path / 'events_t2.jsonl'}"]
+
+
+def test_npz_columns(tmp_path, monkeypatch):
+    monkeypatch.setattr(el, "FLUSH_EVENTS", 3)
+    path = str(tmp_path / "events.npz")
+    with el.EventLog("t2", fmt="npz", path=path, interval_s=1e9) as events:
+        _fill(events)
+    data = el.read_events(path)
+    assert data["hit_cycle"].tolist() == list(range(10))
+    assert data["hit_position"].tolist() == [c % 3 for c in range(10)]
+    assert data["trigger_fall"].tolist() == [14]
+    assert data["counts_values"].shape == (1, 4)
+
+
+def test_rate_limited_summary_and_off(tmp_path, monkeypatch, caplog):
+    clock = iter([0.0, 1.0, 2.0, 5.0, 5.5, 11.0, 12.0])
+    monkeypatch.setattr(el.time, "monotonic", lambda: next(clock))
+    with caplog.at_level(logging.INFO):
+        events = el.EventLog("t", logging.getLogger("tb"), "[T]", fmt="off", interval_s=5)
+        for cycle in range(6):
+            events.record("hit", cycle)
+        events.close()
+    assert [r.message for r in caplog.records] == [
+        "[T] 3 hit so far, cycle 2", "[T] 5 hit so far, cycle 4", "[T] Events: 6 hit"]
+    assert events.path is None and not list(tmp_path.iterdir())
+
+    with pytest.raises(ValueError):
+        el.EventLog("t", fmt="csv")
+
+
+def test_counter_snapshots_per_window(tmp_path):
+    """cnts_o changes become counts events at their own cycles, next to the triggers"""
+    path = str(tmp_path / "events.jsonl")
+    changes = [(10001, 0x0201), (20002, 0x0503), (30003, 0x0504)]
+    with el.EventLog("t2", fmt="jsonl", path=path, interval_s=1e9) as events:
+        events.record("trigger", 15000, fall=15001)
+        events.record_changes("counts", changes, "values", lambda bus: [bus & 0xFF, bus >> 8])
+        events.record_changes("active", [(3, 1)])
+    rows = el.read_events(path)
+    counts = [row for row in rows if row["kind"] == "counts"]
+    assert [row["cycle"] for row in counts] == [10001, 20002, 30003]
+    assert [row["values"] for row in counts] == [[1, 2], [3, 5], [4, 5]]
+    # The trigger falls in the second window
+    trigger = next(row for row in rows if row["kind"] == "trigger")
+    assert counts[0]["cycle"] < trigger["cycle"] < counts[1]["cycle"]
+    assert rows[-1] == {"kind": "active", "cycle": 3, "value": 1}
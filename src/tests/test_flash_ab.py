@@ -0,0 +1,76 @@
+"""
+Description: Checks the stimulus and the lock / clearing analysis of flash_ab.py on
+synthetic signal changes. Runs without a simulator.
+"""
+
+import numpy as np
+
+import flash_ab as ab
+
+
+def _changes(values):
+    """(cycle, value) changes of a dense trace, as monitor_changes records them"""
+    values = np.asarray(values)
+    at = np.flatnonzero(np.diff(values, prepend=0))
+    return [(int(c), int(values[c])) for c in at]
+
+
+def test_stimulus():
+    cycles = 2000
+    data, flash, info = ab.ab_stimulus("single", 8, 50, cycles, seed=3)
+    rows = np.flatnonzero(flash)
+    assert rows[0] == info["phase"] and (np.diff(rows) == 100).all() and len(rows) == info["flashes"]
+    assert set(flash[rows].tolist()) == {1 << info["index"]} and (data == flash).all()
+
+    data, flash, info = ab.ab_stimulus("all_bits_slipped", 8, 50, cycles, seed=3)
+    rows = np.flatnonzero(flash)
+    offset = info["offset"]
+    assert (flash[rows[0]], flash[rows[1]]) == ((0xFF << offset) & 0xFF, 0xFF >> (8 - offset))
+    # Slipped by the offset the two words make up one all-ones word
+    assert int(ab.bitslip(flash[rows[1]], flash[rows[0]], offset, 8)) == 0xFF
+
+    data, flash, _ = ab.ab_stimulus("all_bits_hits", 8, 50, cycles, seed=3)
+    assert (data & flash == flash).all() and (data & ~flash).any()
+
+    jittered = np.flatnonzero(ab.ab_stimulus("single_jitter", 8, 50, 200_000, seed=3)[1])
+    assert set(np.diff(jittered).tolist()) <= {98, 99, 100, 101, 102} and (np.diff(jittered) != 100).any()
+
+
+def test_dense_and_ideal_output():
+    assert ab.dense([(2, 5), (4, 1), (4, 3)], 6).tolist() == [0, 0, 5, 5, 3, 3]
+    assert ab.dense([], 3, initial=1).tolist() == [1, 1, 1]
+
+    words = np.array([0, 0xF0, 0x0F, 0, 0])
+    assert ab.ideal_output(words, "v1", 8).tolist() == words.tolist()
+    # v2: row t holds bitslip(cur = row t - 1, prev = row t - 2)
+    assert ab.ideal_output(words, "v2", 8, slip=4).tolist() == [0, 0, 0, 0xFF, 0]
+    assert ab.ideal_output(words, "v2", 8, slip=0).tolist() == [0, 0, 0, 0xF0, 0x0F]
+
+
+def test_analyze():
+    cycles, fp = 1000, 50
+    data, flash, info = ab.ab_stimulus("single_hits", 8, fp, cycles, seed=5)
+    rows = np.flatnonzero(flash)
+    lock = np.zeros(cycles, dtype=np.int64)
+    lock[rows[2] + 1:] = 1
+
+    # Ideal v1: every flash bit removed while locked, hits untouched
+    out = np.where(lock.astype(bool), data & ~flash, data)
+    r = ab.analyze("v1", data, flash, _changes(lock), _changes(out), 0, 8, fp)
+    assert r["lock_cycle"] == rows[2] + 1 and r["lock_periods"] == (rows[2] + 1) / fp
+    assert r["unlocks"] == 0 and r["flashes_locked"] == len(rows) - 3 == r["clean_flashes"]
+    assert r["leaked_bits"] == 0 and r["lost_hits"] == 0
+
+    # One flash leaks, the hits on one row are cleared with it, one lock loss
+    out[rows[4]] = data[rows[4]]
+    hit_row = np.flatnonzero((data & ~flash)[rows[5]:])[0] + rows[5]
+    out[hit_row] = 0
+    lock[rows[6] + 3] = 0
+    r = ab.analyze("v1", data, flash, _changes(lock), _changes(out), 0, 8, fp)
+    assert r["unlocks"] == 1 and r["unlocks_per_1k_periods"] == 1000 / ((cycles - rows[2] - 1) / fp)
+    assert r["clean_flashes"] == r["flashes_locked"] - 1 and r["leaked_bits"] == 1
+    assert r["lost_hits"] == bin(int(data[hit_row] & ~flash[hit_row])).count("1")
+
+    never = ab.analyze("v2", data, flash, [], _changes(data), 3, 8, fp)
+    assert never["lock_cycle"] is None and never["unlocks_per_1k_periods"] is None
+    assert never["flashes_locked"] == 0
@@ -8,9 +8,23 @@ import os
 from pathlib import Path
 
 import cocotb
+import pytest
 from cocotb.clock import Clock
 from cocotb.triggers import RisingEdge
-from cocotb_test.simulator import run
+
+from batch_wrapper import configurations, run_batch
+from hdl_build import run
+from sim_farm import selected, sim_build_dir, unit_env, units
+from time_scale import scale_parameters
+from wave_capture import full_waves
+
+
+# flash_bit generics used by the launcher
+DATA_WIDTH = 8
+
+# Configurations of test_flashbit_batch, all in one simulation
+BATCH_WIDTHS = (8, 16, 32)
+BATCH_THRESHOLDS = (4, 7, 10)
 
 
 @cocotb.test()
@@ -34,8 +48,8 @@ async def flashbitclear_tb(dut):
 
     failures = []
 
-    # test every index as the flashing bit position
-    for idx in range(DATA_WIDTH):
+    # test every selected index (FLASH_IDX, all by default) as the flashing bit position
+    for idx in selected("FLASH_IDX", range(DATA_WIDTH)):
 
         await reset()
 
@@ -95,10 +109,9 @@ async def flashbitclear_tb(dut):
         cocotb.log.info("FlashBitClear – all indices passed ✔")
 
 
-def test_flashbitclear():
-    """Sets up cocotb runs flashbitclear module test"""
-    os.environ.setdefault("SIM", "ghdl")
-    os.environ.setdefault("GHDL_FLAGS", "--std=08")
+@pytest.mark.parametrize("flash_idx", units("FLASH_IDX", range(DATA_WIDTH)))
+def test_flashbitclear(flash_idx):
+    """Sets up cocotb runs flashbitclear module test, one simulation per bit index"""
 
     here = os.path.abspath(os.path.dirname(__file__))
     rtl  = os.path.join(here, "..", "hdl")
@@ -108,14 +121,25 @@ def test_flashbitclear():
         toplevel="flash_bit",
         toplevel_lang="vhdl",
         module=os.path.splitext(os.path.basename(__file__))[0],
-        waves=True,
+        parameters=scale_parameters({"DATA_WIDTH": DATA_WIDTH}, toplevel="flash_bit"),
+        sim_build=sim_build_dir("flash_bit", flash_idx=flash_idx),
+        waves=full_waves(),
         gui=0,
         extra_env={        
             "COCOTB_LOG_FILE":  "stdout",        
+            **unit_env(flash_idx=flash_idx),
         },
     )
 
 
+def test_flashbit_batch():
+    """Every BATCH_WIDTHS x BATCH_THRESHOLDS flash_bit side by side in one simulation (batch_wrapper.py)"""
+    report = run_batch("flash_bit", configurations("flash_bit", BATCH_WIDTHS, BATCH_THRESHOLDS))
+    assert "error" not in report, report.get("error")
+    failed = [r for r in report["instances"] if not r["passed"]]
+    assert not failed, failed
+
+
 
 if __name__ == "__main__":
     import pytest, sys
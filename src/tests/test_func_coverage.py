@@ -0,0 +1,95 @@
+"""
+Description: Checks the bin bookkeeping, merging and stimulus ranking of func_coverage.py
+with a fake simulation clock. Runs without a simulator.
+"""
+
+import json
+
+import func_coverage as fc
+
+
+class FakeClock:
+    def __init__(self):
+        self.ns = 0
+
+    def __call__(self):
+        return self.ns
+
+
+def test_bin_space():
+    space = fc.bin_space(28)
+    # Per word: 3 states, 4 transitions, W indices, W slips. Lanes: 28 + 14 + 7
+    assert len(space) == 28 * (7 + 16) + 14 * (7 + 32) + 7 * (7 + 64) + 49
+    assert len(set(space)) == len(space)
+    assert "transition/1/13/ACTIVE>INIT" in space and "lane/2/24" in space and "lane/2/25" not in space
+    assert "slip/0/27/7" in space and "slip/0/27/8" not in space
+
+
+def test_stimulus_labels_and_cycles():
+    clock = FakeClock()
+    cov = fc.Coverage("run", clk_period_ns=10, now_ns=clock)
+    cov.record("state", 0, 0, "INIT")
+    clock.ns = 100
+    with cov.stimulus("lock"):
+        clock.ns = 300
+        cov.record("state", 0, 0, "SEARCH")
+        cov.record("state", 0, 0, "SEARCH")
+        clock.ns = 1100
+    cov.record("state", 0, 0, "SEARCH")
+    clock.ns = 1200
+    cov.uninstall()
+
+    summary = cov.summary()
+    assert summary["stimuli"] == {
+        "run": {"cycles": 20, "bins": {"state/0/0/INIT": 1, "state/0/0/SEARCH": 1}},
+        "lock": {"cycles": 100, "bins": {"state/0/0/SEARCH": 2}},
+    }
+    assert summary["bins"] == {"state/0/0/INIT": 1, "state/0/0/SEARCH": 3}
+    assert summary["first"] == {"state/0/0/INIT": 0, "state/0/0/SEARCH": 30}
+    assert summary["cycles"] == 120
+
+
+def test_flash_index_only_on_lock():
+    """A warm start deposit or reset reaches ACTIVE / INIT without touching the index bins"""
+    cov = fc.Coverage("run", now_ns=FakeClock())
+    cov.flash_change(0, 3, "INIT", "ACTIVE", 5)                 # deposit
+    cov.flash_change(0, 3, "ACTIVE", "INIT", 5, in_reset=True)  # reset
+    cov.flash_change(0, 3, "INIT", "SEARCH", 6)
+    cov.flash_change(0, 3, "SEARCH", "ACTIVE", 6)               # lock
+    bins = cov.summary()["bins"]
+    assert [key for key in bins if key.startswith("index")] == ["index/0/3/6"]
+    assert [key for key in bins if key.startswith("transition")] \
+        == ["transition/0/3/INIT>SEARCH", "transition/0/3/SEARCH>ACTIVE"]
+    assert bins["state/0/3/ACTIVE"] == 2
+
+def _run(name, stimuli):
+    return {"name": name, "num_etrocs": 28, "cycles": sum(c for c, _ in stimuli.values()),
+            "bins": {key: 1 for _, keys in stimuli.values() for key in keys},
+            "stimuli": {label: {"cycles": c, "bins": {key: 1 for key in keys}} for label, (c, keys) in stimuli.items()}}
+
+
+def test_merge_and_ranking(tmp_path, capsys):
+    space = ["state/0/0/INIT", "state/0/0/SEARCH", "state/0/0/ACTIVE", "lane/0/0"]
+    runs = [
+        _run("long", {"soak": (1000, space[:3])}),
+        _run("short", {"lock": (10, space[:2]), "hits": (50, ["lane/0/0", "state/0/0/INIT"])}),
+    ]
+    ranking = fc.rank_stimuli(runs, space)
+    assert [(r["stimulus"], r["new"], r["redundant"]) for r in ranking] \
+        == [("lock", 2, False), ("hits", 1, False), ("soak", 1, False)]
+    assert ranking[-1]["cumulative_percent"] == 100.0
+
+    runs.append(_run("again", {"lock": (10, space[:2])}))
+    assert fc.rank_stimuli(runs, space)[-1]["redundant"]
+
+    groups = fc.group_coverage(fc.merge(runs), fc.bin_space(28))
+    assert groups["state"]["covered"] == 3 and groups["lane"]["covered"] == 1
+    assert groups["transition"]["covered"] == 0 and groups["transition"]["percent"] == 0.0
+
+    for run in runs:
+        (tmp_path / f"coverage_{run['name']}.json").write_text(json.dumps(run))
+    out = tmp_path / "merged.json"
+    assert fc.main([str(tmp_path / "coverage_*.json"), "--uncovered", "2", "-o", str(out)]) == 0
+    merged = json.loads(out.read_text())
+    assert merged["bins"]["state/0/0/INIT"] == 3
+    assert "redundant" in capsys.readouterr().out
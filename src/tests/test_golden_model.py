@@ -0,0 +1,217 @@
+"""
+Description: Checks the NumPy self_trig reference model (golden_model.py) against a
+plain per-cycle Python transcription of the RTL. Runs without a simulator.
+"""
+
+import random
+
+import numpy as np
+
+import golden_model as gm
+from test_bitslip import calculate_expected_output
+
+
+class ScalarFlashBit:
+    """flash.vhd clocked one edge at a time"""
+
+    def __init__(self, data_width, flash_period, threshold):
+        self.w, self.p, self.th = data_width, flash_period, threshold
+        self.state, self.index, self.count, self.clk = gm.INIT, 0, 0, 0
+        self.data_o, self.active_o = 0, 0
+
+    def clock(self, data_i):
+        if self.state == gm.INIT:
+            self.data_o, self.active_o = data_i, 0
+            prim = [i for i in range(self.w) if data_i >> i & 1 and i >= self.index]
+            sec = [i for i in range(self.w) if data_i >> i & 1 and i < self.index]
+            if prim or sec:
+                self.index = (prim or sec)[0]
+                self.state, self.count, self.clk = gm.SEARCH, 0, 0
+            else:
+                self.index = (self.index + 1) % self.w
+
+        elif self.state == gm.SEARCH:
+            self.data_o, self.active_o = data_i, 0
+            if self.clk == 2 * self.p - 1:
+                self.clk = 0
+                if data_i >> self.index & 1:
+                    if self.count == self.th - 1:
+                        self.state = gm.ACTIVE
+                    self.count += 1
+                else:
+                    self.state, self.count = gm.INIT, 0
+            else:
+                self.clk += 1
+
+        else:
+            self.active_o = 1
+            tmp = data_i
+            if self.clk == 2 * self.p - 1:
+                self.clk = 0
+                if data_i >> self.index & 1:
+                    tmp &= ~(1 << self.index)
+                else:
+                    self.state, self.count = gm.INIT, 0
+            else:
+                self.clk += 1
+            self.data_o = tmp
+
+
+def scalar_self_trig(words, rate, flash_period, threshold, enable, slip, num_etrocs=28):
+    """Top.vhd + trigger_rx.vhd clocked one edge at a time, returns trigger_o and or_8 per edge"""
+    uplink_width = 8 * num_etrocs
+    width = gm.etroc_width(rate)
+    num_links = uplink_width // width
+    lane_mask = (1 << width) - 1
+    fsms = [ScalarFlashBit(width, flash_period, threshold) for _ in range(num_links)]
+
+    flash_data = active = prev_data = slip_data = data_slip = data_masked = 0
+    or_8 = or_16 = or_32 = [0] * num_etrocs
+    trigger = []
+    or_8_trace = []
+    for word in words:
+        # Next register values from the current ones
+        active_enable = 0
+        for i in range(num_links):
+            if active >> i & 1:
+                active_enable |= lane_mask << (i * width)
+        next_masked = data_slip & enable & active_enable
+        next_data_slip = slip_data
+
+        next_slip_data = 0
+        for i in range(num_links):
+            cur = flash_data >> (i * width) & lane_mask
+            prev = prev_data >> (i * width) & lane_mask
+            next_slip_data |= calculate_expected_output(cur, prev, slip[i], width, True) << (i * width)
+
+        next_or_8 = [int(data_masked >> (8 * i) & 0xFF != 0) for i in range(num_etrocs)]
+        next_or_16 = [or_8[2 * i] | or_8[2 * i + 1] for i in range(num_etrocs // 2)]
+        next_or_32 = [or_16[2 * i] | or_16[2 * i + 1] for i in range(num_etrocs // 4)]
+        trigger.append(int(any(or_32)))
+
+        next_flash_data = next_active = 0
+        for i, fsm in enumerate(fsms):
+            fsm.clock(word >> (i * width) & lane_mask)
+            next_flash_data |= fsm.data_o << (i * width)
+            next_active |= fsm.active_o << i
+
+        prev_data = flash_data
+        flash_data, active = next_flash_data, next_active
+        slip_data, data_slip, data_masked = next_slip_data, next_data_slip, next_masked
+        or_8, or_16, or_32 = next_or_8, next_or_16, next_or_32
+        or_8_trace.append(next_or_8)
+
+    return np.array(trigger, dtype=bool), np.array(or_8_trace, dtype=bool)
+
+
+def random_stimulus(rng, cycles, rate, flash_period, hit_prob, uplink_width=224):
+    """Flashing bit at a random offset of every ETROC word plus random hits"""
+    width = gm.etroc_width(rate)
+    flash_bits = 0
+    for i in range(uplink_width // width):
+        flash_bits |= 1 << (i * width + rng.randrange(width))
+
+    words = []
+    for cycle in range(cycles):
+        word = flash_bits if cycle % (2 * flash_period) == 0 else 0
+        if rng.random() < hit_prob:
+            word |= 1 << rng.randrange(uplink_width)
+        words.append(word)
+    return words
+
+
+def test_golden_model_matches_scalar_rtl():
+    """Vectorized model and scalar transcription agree cycle by cycle for every rate"""
+    rng = random.Random(1234)
+    flash_period, threshold, cycles = 6, 3, 600
+
+    for rate in gm.RATES:
+        num_links = 224 // gm.etroc_width(rate)
+        for slip_value in (0, 3):
+            words = random_stimulus(rng, cycles, rate, flash_period, hit_prob=0.1)
+            enable = (1 << 224) - 1 - (0xFF << 40)
+            slip = [slip_value] * 28
+
+            expected_trigger, expected_or_8 = scalar_self_trig(words, rate, flash_period, threshold, enable, slip)
+
+            model = gm.SelfTrigModel(flash_period=flash_period, threshold=threshold)
+            stimulus = gm.pack_words(words)
+            # Split the stimulus so state is carried across calls
+            traces = [model.run(chunk, rate=rate, enable=enable, slip=slip)
+                      for chunk in np.array_split(stimulus, 7)]
+            trigger = np.concatenate([t["trigger_o"] for t in traces])
+            or_8 = np.concatenate([t["or_8"] for t in traces])
+            active = np.concatenate([t["active_o"] for t in traces])
+
+            assert active[-1, 28 - num_links:].all(), f"rate {rate}: not every ETROC locked"
+            assert trigger.any(), f"rate {rate}: stimulus produced no triggers"
+            np.testing.assert_array_equal(trigger, expected_trigger, err_msg=f"rate {rate} slip {slip_value}")
+            np.testing.assert_array_equal(or_8, expected_or_8, err_msg=f"rate {rate} slip {slip_value}")
+
+
+def test_golden_model_latency():
+    """A single hit on a locked ETROC reaches trigger_o TRIGGER_LATENCY edges later"""
+    flash_period, threshold = 8, 2
+    model = gm.SelfTrigModel(flash_period=flash_period, threshold=threshold)
+
+    # Lock every ETROC on bit 0 of its word
+    flash = sum(1 << (8 * i) for i in range(28))
+    lock_cycles = 2 * flash_period * (threshold + 1)
+    words = [flash if c % (2 * flash_period) == 0 else 0 for c in range(lock_cycles)]
+    trace = model.run(gm.pack_words(words), rate=0)
+    assert trace["active_o"][-1].all()
+
+    # Flashing continues (and is cleared), one hit lands between two flashes
+    hit_cycle = 5
+    words = [flash if c % (2 * flash_period) == 0 else 0 for c in range(20)]
+    words[hit_cycle] = 1 << 101
+    trace = model.run(gm.pack_words(words))
+    assert list(gm.trigger_cycles(trace)) == [hit_cycle + gm.TRIGGER_LATENCY]
+
+
+def test_reset_post_edge():
+    """reset_dut() releases reset one edge before the stimulus, the INIT index walks to 1 on it"""
+    model = gm.SelfTrigModel(flash_period=8, threshold=2)
+    model.run(gm.pack_words([0] * 5), rate=0)
+    model.reset()
+    assert {fsm.index for lanes in model.flash.values() for fsm in lanes} == {1}
+    model.reset(post_edge=False)
+    assert {fsm.index for lanes in model.flash.values() for fsm in lanes} == {0}
+
+    # The first '1' at or above the index wins: bit 1 of 0b11 after reset_dut()
+    model.reset()
+    model.run(gm.pack_words([0b11]))
+    assert model.flash[0][0].index == 1
+
+def scalar_rate_counter(en, clk_frequency, counter_width, phase):
+    """rate_counter.vhd clocked one edge at a time, returns rate_o after every edge"""
+    max_count = (1 << counter_width) - 1
+    count, timer, rate_o, out = 0, phase, 0, []
+    for en_i in en:
+        if timer < clk_frequency:
+            timer += 1
+            if en_i and count < max_count:
+                count += 1
+        else:
+            timer, rate_o, count = 0, count, 0
+        out.append(rate_o)
+    return out
+
+
+def test_rate_counts_matches_scalar_rtl():
+    """Windows, phase and saturation of rate_counts against the transcription of rate_counter"""
+    rng = np.random.default_rng(3)
+    for clk_frequency, counter_width, density in ((37, 26, 0.3), (50, 4, 0.9), (9, 3, 1.0)):
+        flags = rng.random(400) < density
+        for phase in (0, 5, clk_frequency):
+            # en_i at edge t is cnt_flag row t - 1, edge 0 sees a 0
+            rate_o = scalar_rate_counter(np.concatenate([[False], flags[:-1]]), clk_frequency, counter_width, phase)
+            latches, counts = gm.rate_counts(flags, clk_frequency, counter_width, phase)
+            assert len(latches) and latches[0] >= clk_frequency + 1
+            for latch, count in zip(latches.tolist(), counts.tolist()):
+                assert rate_o[latch] == count, (clk_frequency, phase, latch)
+            # rate_o only changes on the latch edges
+            changes = [t for t in range(1, len(rate_o)) if rate_o[t] != rate_o[t - 1]]
+            assert set(changes) <= set(latches.tolist()) | set(range(clk_frequency + 1))
+            if counter_width == 3:
+                assert counts.max() == 7
@@ -0,0 +1,86 @@
+"""
+Description: Checks the sparse module model of l1a_mc.py against the full NumPy
+reference model (golden_model.SelfTrigModel) and the segment bookkeeping of the
+Monte Carlo. Runs without a simulator.
+"""
+
+import numpy as np
+import pytest
+
+import golden_model as gm
+import l1a_mc as mc
+
+
+LANE_DTYPES = {8: np.uint8, 16: np.dtype("<u2"), 32: np.dtype("<u4")}
+
+
+def _params(**kw):
+    return mc.default_params(flash_period=6, threshold=3, clock_hz=1000, **kw)
+
+
+def _dense(events, rate, cycles):
+    """Uplink rows of the per word events"""
+    width = gm.etroc_width(rate)
+    lanes = np.zeros((cycles, len(events)), dtype=LANE_DTYPES[width])
+    for iword, (times, values) in enumerate(events):
+        lanes[times, iword] = values
+    return gm.from_lanes(lanes, rate)
+
+
+@pytest.mark.parametrize("rate", gm.RATES)
+def test_module_matches_golden_model(rate):
+    """Trigger edges and fully locked edges equal SelfTrigModel on the same stimulus"""
+    params = _params(rate=rate)
+    rng = np.random.default_rng(rate)
+    num_words = 224 // gm.etroc_width(rate)
+    enable = [(1 << gm.etroc_width(rate)) - 1] * num_words
+    enable[1] = 0
+    module = mc.resolve_module({"noise": 2e-3, "hits": 0.02, "flash_bits": rng.integers(0, 8, num_words),
+                                "enable": enable}, params, rng)
+    cycles = 1500
+    events = mc.module_events(module, params, 0, cycles, rng)
+    result = mc.simulate_module(module, params, events, 0, cycles, warm=False)
+
+    model = gm.SelfTrigModel(flash_period=6, threshold=3)
+    model.reset(post_edge=False)
+    enable_bus = sum(value << (iword * gm.etroc_width(rate)) for iword, value in enumerate(enable))
+    trace = model.run(_dense(events, rate, cycles), rate=rate, enable=enable_bus)
+
+    edges = result["trigger_edges"]
+    assert len(edges) and edges[edges < cycles].tolist() == gm.trigger_cycles(trace).tolist()
+    assert result["live_cycles"] == int(trace["active_o"][:, 28 - num_words:].all(axis=1).sum())
+    assert result["lock_cycle"] == int(np.argmax(trace["active_o"][:, 28 - num_words:].all(axis=1)))
+
+
+def test_noiseless_lock_and_warm_segment():
+    """Cold segments lock phase + 2*FLASH_PERIOD*THRESHOLD + 1 edges in, warm ones are locked from edge 0"""
+    params = _params()
+    module = mc.resolve_module({"noise": 0, "hits": 0, "phases": [5] * 27 + [9]}, params, None)
+    events = mc.module_events(module, params, 0, 200, np.random.default_rng(0))
+    cold = mc.simulate_module(module, params, events, 0, 200, warm=False)
+    assert cold["lock_cycle"] == 9 + 2 * 6 * 3 + 1
+    assert cold["live_cycles"] == 200 - cold["lock_cycle"]
+    assert cold["unlocks"] == 0 and cold["unlock_dead"] == 0
+    # The flash confirming the lock is not cleared yet and passes the freshly set active_enable
+    assert cold["trigger_edges"].tolist() == [p + 2 * 6 * 3 + gm.TRIGGER_LATENCY for p in (5, 9)]
+
+    events = mc.module_events(module, params, 1000, 200, np.random.default_rng(0))
+    warm = mc.simulate_module(module, params, events, 1000, 200, warm=True)
+    assert (warm["lock_cycle"], warm["live_cycles"], warm["unlocks"], warm["lockin_dead"]) == (0, 200, 0, 0)
+    assert len(warm["trigger_edges"]) == 0
+
+
+def test_pulses_and_units():
+    assert mc.count_pulses(np.array([3, 4, 5, 9, 11, 12])) == (3, 12)
+    # A pulse high on the last edge of the previous segment continues
+    assert mc.count_pulses(np.array([13, 20]), last=12) == (1, 20)
+    assert mc.count_pulses(np.array([], dtype=np.int64), last=7) == (0, 7)
+
+    params = _params()
+    modules = [mc.resolve_module({}, params, np.random.default_rng(0), i) for i in range(3)]
+    units = mc.make_units(modules, params, seconds=2.5, segment_s=1.0, seed=1)
+    assert [(u["segment"], u["index"], u["start"], u["cycles"]) for u in units[::3]] \
+        == [(0, 0, 0, 1000), (1, 0, 1000, 1000), (2, 0, 2000, 500)]
+
+    with pytest.raises(ValueError):
+        mc.resolve_module({"noise": [0.0] * 3}, params, np.random.default_rng(0))
@@ -0,0 +1,233 @@
+"""
+Description: Trigger latency and efficiency characterization of self_trig per data rate
+
+Every flash_bit is warm-started locked, then isolated hits are injected at known
+cycles and bit positions for several slip values. Each hit is matched to the first
+trigger_o rise after it to build latency histograms, efficiency, fake and double
+trigger rates, written as JSON (LATENCY_REPORT, latency_rate<N>.json in the
+simulation directory by default).
+
+The L1A latency has to be fixed for the DAQ. bitslip moves the low `slip` bits of a
+word into the aligned word that leaves one edge earlier, so the latency measured
+from the raw input is TRIGGER_LATENCY - 1 for those bits. After removing that
+realignment every hit must see exactly TRIGGER_LATENCY.
+"""
+
+import json
+import os
+import random
+from collections import Counter
+
+import cocotb
+import numpy as np
+import pytest
+from cocotb.clock import Clock
+
+from bus_codec import encode_slip
+from func_coverage import finish_coverage, start_coverage, stimulus
+from golden_model import RATES, TRIGGER_LATENCY, bitslip, etroc_width, expand_events, trigger_pulses
+from hdl_build import run
+from sim_farm import CLK_PERIOD_NS, pulses_to_events, selected, sim_build_dir, unit_env, units
+from test_Top import drive_sparse, make_model, reset_dut
+from time_scale import flash_period, scale_parameters
+from warm_start import deposit_checkpoint, locked_checkpoint
+from wave_capture import full_waves
+
+
+# slip_i lanes feed the bitslips of every rate at once, rate 0 limits them to 0..7
+SLIPS = (0, 1, 4, 7)
+NUM_HITS = 200
+HIT_SPACING = 64    # cycles between hits, well above latency + pulse length
+MATCH_WINDOW = 32   # trigger_o rises within this many cycles belong to the hit
+SEED = 1234
+
+
+def realignment(bit, slip, width):
+    """1 when bitslip moves `bit` into the aligned word that leaves one edge earlier"""
+    return int(bitslip(1 << bit, 0, slip, width) != 0)
+
+
+def match_hits(hits, pulses, window=MATCH_WINDOW):
+    """
+    hits is a list of (cycle, bit), pulses the trigger_o (rise, fall) pairs.
+    Returns the latency of the first rise after every hit (None if missed), the
+    number of hits with more than one rise and the number of unmatched rises.
+    """
+    rises = np.array([rise for rise, _ in pulses], dtype=np.int64)
+    claimed = np.zeros(len(rises), dtype=bool)
+    latencies, doubles = [], 0
+    for cycle, _ in hits:
+        lo, hi = np.searchsorted(rises, [cycle, cycle + window])
+        claimed[lo:hi] = True
+        latencies.append(int(rises[lo] - cycle) if hi > lo else None)
+        doubles += int(hi - lo > 1)
+    return latencies, doubles, int(np.count_nonzero(~claimed))
+
+
+def block_stimulus(rng, rate, uplink_width, flash_pattern, flash_period, start, cycles):
+    """Hits of one slip block plus the flashes falling into it, cycles local to the block"""
+    width = etroc_width(rate)
+    words = {cycle - start: flash_pattern
+             for cycle in range(-(-start // (2 * flash_period)) * 2 * flash_period, start + cycles, 2 * flash_period)}
+
+    hits = []
+    for cycle in range(HIT_SPACING, cycles - MATCH_WINDOW, HIT_SPACING):
+        # Any bit but the flashing one (offset 0) of a random ETROC word
+        bit = rng.randrange(1, width)
+        pos = rng.randrange(uplink_width // width) * width + bit
+        hits.append((cycle, bit))
+        words[cycle] = words.get(cycle, 0) | (1 << pos)
+    return words, hits
+
+
+async def characterize_rate(dut, rate):
+    """Runs every slip block for one rate, returns (report dict, failures)"""
+    UPLINK_WIDTH = dut.UPLINK_WIDTH.value.integer
+    FLASH_PERIOD = flash_period(dut)
+    NUM_ETROCS = dut.NUM_ETROCS.value.integer
+    label = f"[Latency, Rate {rate}]"
+
+    width = etroc_width(rate)
+    num_links = UPLINK_WIDTH // width
+    flash_pattern = sum(1 << (i * width) for i in range(num_links))
+    block_cycles = (NUM_HITS + 1) * HIT_SPACING + MATCH_WINDOW
+
+    await reset_dut(dut)
+    dut.rate_i.value = rate
+    dut.enable_i.value = (1 << UPLINK_WIDTH) - 1
+    dut.slip_i.value = 0
+    checkpoint = locked_checkpoint(dut, rate, first_flash=0)
+    deposit_checkpoint(dut, checkpoint)
+    model = make_model(dut, checkpoint)
+
+    rng = random.Random(SEED + rate)
+    failures = []
+    report = {
+        "rate": rate,
+        "generics": checkpoint["generics"],
+        "clk_period_ns": CLK_PERIOD_NS,
+        "trigger_latency": TRIGGER_LATENCY,
+        "slips": {},
+    }
+    aligned_all = Counter()
+
+    for index, slip in enumerate(SLIPS):
+        start = index * block_cycles
+        words, hits = block_stimulus(rng, rate, UPLINK_WIDTH, flash_pattern, FLASH_PERIOD, start, block_cycles)
+        events = pulses_to_events(words)
+
+        dut.slip_i.value = encode_slip([slip] * NUM_ETROCS)
+        pulses = await drive_sparse(dut, events, block_cycles)
+
+        latencies, doubles, fakes = match_hits(hits, pulses)
+        raw = Counter(lat for lat in latencies if lat is not None)
+        aligned = Counter(lat + realignment(bit, slip, width)
+                          for lat, (_, bit) in zip(latencies, hits) if lat is not None)
+        aligned_all.update(aligned)
+        matched = sum(raw.values())
+
+        report["slips"][str(slip)] = {
+            "hits": len(hits),
+            "matched": matched,
+            "efficiency": matched / len(hits),
+            "fake_triggers": fakes,
+            "fake_rate_per_cycle": fakes / block_cycles,
+            "double_triggers": doubles,
+            "double_trigger_rate": doubles / max(matched, 1),
+            "latency_histogram": {str(k): v for k, v in sorted(raw.items())},
+            "aligned_latency_histogram": {str(k): v for k, v in sorted(aligned.items())},
+        }
+        dut._log.info(f"{label} slip {slip}: efficiency {matched}/{len(hits)}, fakes {fakes}, "
+                      f"doubles {doubles}, latency {dict(sorted(raw.items()))}")
+
+        expected = trigger_pulses(model.run(expand_events(events, block_cycles, UPLINK_WIDTH),
+                                            rate=rate, slip=[slip] * NUM_ETROCS))
+        if expected != pulses:
+            msg = f"{label} FAILED: slip {slip} trigger_o pulses differ from the reference model"
+            dut._log.error(msg)
+            failures.append(msg)
+        if matched != len(hits) or fakes or doubles:
+            msg = (f"{label} FAILED: slip {slip} efficiency {matched}/{len(hits)}, "
+                   f"{fakes} fake and {doubles} double triggers")
+            dut._log.error(msg)
+            failures.append(msg)
+
+    report["constant_latency"] = list(aligned_all) == [TRIGGER_LATENCY]
+    if not report["constant_latency"]:
+        msg = (f"{label} FAILED: latency is not constant, aligned latency histogram "
+               f"{dict(sorted(aligned_all.items()))}, expected only {TRIGGER_LATENCY}")
+        dut._log.error(msg)
+        failures.append(msg)
+    else:
+        dut._log.info(f"{label} PASSED: constant latency of {TRIGGER_LATENCY} cycles "
+                      f"({TRIGGER_LATENCY * CLK_PERIOD_NS} ns) for {sum(aligned_all.values())} hits.")
+
+    return report, failures
+
+
+@cocotb.test()
+async def latency_tb(dut):
+    """Characterizes trigger latency and efficiency for the selected rates (RATE, all by default)"""
+    cocotb.start_soon(Clock(dut.clk_i, CLK_PERIOD_NS, units="ns").start())
+    all_failures = []
+    rates = selected("RATE", RATES)
+
+    # Opt-in functional coverage, FUNC_COVERAGE=1 (see func_coverage.py)
+    start_coverage(dut, "latency_rate" + "_".join(map(str, rates)), CLK_PERIOD_NS)
+    try:
+        for rate in rates:
+            with stimulus(f"latency_rate{rate}"):
+                report, failures = await characterize_rate(dut, rate)
+            all_failures.extend(failures)
+
+            path = os.getenv("LATENCY_REPORT", f"latency_rate{rate}.json").format(rate=rate)
+            with open(path, "w") as f:
+                json.dump(report, f, indent=2)
+            dut._log.info(f"[Latency, Rate {rate}] Report written to {os.path.abspath(path)}")
+    finally:
+        finish_coverage(dut._log)
+
+    if all_failures:
+        raise cocotb.result.TestFailure(
+            f"{len(all_failures)} failure(s) detected:\n" + "\n".join(all_failures)
+        )
+
+
+@pytest.mark.parametrize("rate", units("RATE", RATES))
+def test_latency(rate):
+    """Sets up cocotb to run the latency characterization, one simulation per rate"""
+    # The simulation runs inside its sim_build directory
+    for var in ("LATENCY_REPORT", "FUNC_COVERAGE_OUT"):
+        if os.getenv(var):
+            os.environ[var] = os.path.abspath(os.environ[var])
+
+    here = os.path.abspath(os.path.dirname(__file__))
+    rtl_dir = os.path.join(here, "..", "hdl")
+
+    vhdl_sources = [
+        os.path.join(rtl_dir, "def_pkg.vhd"),
+        os.path.join(rtl_dir, "Top.vhd"),
+        os.path.join(rtl_dir, "trigger_rx.vhd"),
+        os.path.join(rtl_dir, "flash.vhd"),
+        os.path.join(rtl_dir, "bitslip.vhd"),
+        os.path.join(rtl_dir, "rate_counter.vhd")
+    ]
+
+    run(
+        vhdl_sources=vhdl_sources,
+        toplevel="self_trig",
+        toplevel_lang="vhdl",
+        module=os.path.splitext(os.path.basename(__file__))[0],
+        parameters=scale_parameters({"g_CLK_FREQUENCY": 10000}),
+        sim_build=sim_build_dir("self_trig_latency", rate=rate),
+        waves=full_waves(),
+        gui=0,
+        extra_env={
+            "COCOTB_LOG_FILE": "stdout",
+            **unit_env(rate=rate),
+        },
+    )
+
+if __name__ == "__main__":
+    import pytest, sys
+    sys.exit(pytest.main(sys.argv[1:] + [__file__]))
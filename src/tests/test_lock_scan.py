@@ -0,0 +1,46 @@
+"""
+Description: Checks the stimulus, model trials and distributions of lock_scan.py.
+Runs without a simulator.
+"""
+
+import numpy as np
+
+import lock_scan as ls
+
+
+def _point(**kw):
+    return {"width": 8, "flash_period": 10, "index": 3, "threshold": 4, "occupancy": 0.0, **kw}
+
+
+def test_trial_stimulus():
+    """Flashing bit every 2 * flash_period from the phase, hits never on it, reproducible"""
+    words = ls.trial_stimulus(8, 10, 3, 7, 0.05, 2000, seed=5)
+    flashes = np.flatnonzero(words & (1 << 3))
+    assert flashes.tolist() == list(range(7, 2000, 20))
+    assert np.count_nonzero(words & ~(1 << 3)) > 0
+    assert np.array_equal(words, ls.trial_stimulus(8, 10, 3, 7, 0.05, 2000, seed=5))
+
+
+def test_noiseless_lock_time():
+    """Without noise the lock follows the first flash after THRESHOLD confirmations"""
+    for phase in (0, 5, 13):
+        for index in (0, 7):
+            lock, unlocks, false = ls.run_trial(_point(index=index), phase, 1, 400)
+            assert (lock, unlocks, false) == (phase + 2 * 10 * 4 + 1, 0, False)
+    assert ls.run_trial(_point(), 0, 1, 50) == (None, 0, False)
+
+
+def test_summarize_and_grid():
+    point = _point()
+    trials = [(100, 0, False), (250, 1, False), (None, 0, False), (95, 0, True)]
+    summary = ls.summarize(point, trials, budget_periods=60)
+    assert (summary["trials"], summary["locked"], summary["unlocks"], summary["false_locks"]) == (4, 3, 1, 1)
+    # test_flashbit allows 2 * 8 + 4 + 10 = 30 periods of 10 cycles
+    assert summary["in_test_budget"] == 3
+    assert summary["histogram"] == {"9": 1, "10": 1, "25": 1}
+    assert summary["lock_periods"]["max"] == 25.0
+
+    points = ls.expand_grid((8, 16), (10,), (0.0, 1e-4), indices=(0, 12))
+    assert [(p["width"], p["index"]) for p in points] == [(8, 0), (8, 0), (16, 0), (16, 12), (16, 0), (16, 12)]
+    assert len(ls.expand_grid((8,), (4, 10), (0.0,))) == 16
+    assert ls.trial_seeds(point, 3) == ls.trial_seeds(dict(point), 3) != ls.trial_seeds(_point(index=4), 3)
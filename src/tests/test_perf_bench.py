@@ -0,0 +1,40 @@
+"""
+Description: Checks the baseline and regression logic of perf_bench.py on a synthetic
+history. Runs without a simulator.
+"""
+
+import perf_bench as pb
+
+
+def _run(wall_s=10.0, build_s=2.0, cycles_per_s=50000.0, artifact_bytes=1_000_000, passed=True):
+    return {"wall_s": wall_s, "build_s": build_s, "cycles_per_s": cycles_per_s,
+            "artifact_bytes": artifact_bytes, "sim_cycles": 500000, "passed": passed}
+
+
+def _entry(result, host="stand", backend="ghdl"):
+    return {"host": host, "backend": backend, "results": {"bitslip_w32": result}}
+
+
+def test_baseline_median_of_matching_runs():
+    """Median over the last window passing runs of the same host and backend only"""
+    history = [_entry(_run(wall_s=w)) for w in (100.0, 10.0, 12.0, 11.0)]
+    history += [_entry(_run(wall_s=1.0), host="laptop"), _entry(_run(wall_s=1.0), backend="nvc"),
+                _entry(_run(wall_s=1.0, passed=False))]
+    base = pb.baseline(history, "bitslip_w32", "stand", "ghdl", window=3)
+    assert base["wall_s"] == 11.0
+    assert pb.baseline(history, "flash_bit_w8", "stand", "ghdl") is None
+
+
+def test_regressions_thresholds():
+    """Slower, bigger or lower throughput beyond the threshold is reported, noise is not"""
+    base = _run()
+    assert pb.regressions(_run(wall_s=12.0), base, 0.25) == []
+    assert [msg.split()[0] for msg in pb.regressions(_run(wall_s=20.0, cycles_per_s=30000.0), base, 0.25)] \
+        == ["wall_s", "cycles_per_s"]
+    # Faster is never a regression
+    assert pb.regressions(_run(wall_s=2.0, cycles_per_s=1e6), base, 0.25) == []
+    # Below TIME_FLOOR_S the ratio does not matter
+    assert pb.regressions(_run(build_s=0.4), _run(build_s=0.1), 0.25) == []
+    # ... but it is not applied to throughput, a small cycles_per_s drop still counts
+    assert [msg.split()[0] for msg in pb.regressions(_run(cycles_per_s=0.2), _run(cycles_per_s=0.5), 0.25)] \
+        == ["cycles_per_s"]
@@ -0,0 +1,210 @@
+"""
+Description: Load test of the hit-rate counters (cnt_gen lanes of trigger_rx) under
+sustained occupancy, up to a hit in every cycle, for every data rate
+
+Every flash_bit is warm-started locked, then each ETROC word gets a hit on a random
+non-flashing bit with its own probability per cycle (OCCUPANCY, cycled over the ETROC
+words, 1 = every cycle). The rate_o of every rate_counter and the cnts_o port are
+watched edge-triggered and after every latch compared with the window count predicted
+from the reference model's cnt_flag: saturated at 2**CNT_BITS - 1 for rate_o, its low
+INTEGER_WIDTH bits for cnts_o. Lanes without an ETROC at rates 1 and 2 must stay 0.
+
+The launcher runs every rate with CNT_BITS=8, where busy lanes saturate, and with the
+default CNT_BITS=26, where cnts_o wraps.
+
+    OCCUPANCY=1,0.5 RATE=2 pytest src/tests/test_rate_counter.py
+"""
+
+import os
+import random
+
+import cocotb
+import numpy as np
+import pytest
+from cocotb.clock import Clock
+
+from func_coverage import finish_coverage, start_coverage, stimulus
+from golden_model import INTEGER_WIDTH, RATES, etroc_width, rate_counts
+from hdl_build import run
+from sim_farm import CLK_PERIOD_NS, selected, sim_build_dir, unit_env, units
+from test_Top import check_against_model, drive_sparse, make_model, rate_counter_timer, reset_dut
+from time_scale import flash_period, rate_window, scale_parameters
+from warm_start import deposit_checkpoint, locked_checkpoint
+from wave_capture import full_waves
+
+
+# Hit probability per cycle of each ETROC word, cycled when there are more words
+OCCUPANCIES = (1.0, 0.9, 0.5, 0.25, 0.1, 0.01, 0.0)
+WINDOWS = 6  # complete rate counter windows checked per rate
+COUNTER_WIDTHS = (8, 26)  # CNT_BITS launcher units, 8 saturates at full occupancy, 26 wraps in cnts_o
+
+
+def occupancies():
+    return [float(value) for value in os.getenv("OCCUPANCY", ",".join(map(str, OCCUPANCIES))).split(",")]
+
+
+def occupancy_stimulus(rng, rate, cycles, occupancy, flash_period, uplink_width=224):
+    """
+    Dense (cycles, uplink_width // 8) stimulus: the flashing bit (offset 0) of every
+    ETROC word every 2 * flash_period cycles from cycle 0, plus a hit on a random
+    other bit of ETROC word j with probability occupancy[j % len(occupancy)] per cycle
+    """
+    width = etroc_width(rate)
+    num_links = uplink_width // width
+    bits = np.zeros((cycles, uplink_width), dtype=bool)
+
+    prob = np.resize(np.asarray(occupancy, dtype=float), num_links)
+    rows, links = np.nonzero(rng.random((cycles, num_links)) < prob)
+    bits[rows, links * width + rng.integers(1, width, len(rows))] = True
+    bits[::2 * flash_period, ::width] = True
+
+    return np.packbits(bits, axis=1, bitorder="little")
+
+
+def dense_events(dense):
+    """(cycle, word) changes of a dense stimulus for drive_sparse, the bus starts at 0"""
+    changed = np.any(dense != np.vstack([np.zeros_like(dense[:1]), dense[:-1]]), axis=1)
+    return [(int(row), int.from_bytes(dense[row].tobytes(), "little")) for row in np.flatnonzero(changed)]
+
+
+def value_at(changes, cycles, initial=0):
+    """Value after each edge in cycles of a signal recorded as (cycle, value) changes"""
+    change_cycles = np.array([cycle for cycle, _ in changes], dtype=np.int64)
+    values = [initial] + [value for _, value in changes]
+    return [values[i] for i in np.searchsorted(change_cycles, cycles, side="right")]
+
+
+async def load_rate(dut, rate):
+    """Drives one rate and checks every complete window of every lane, returns failures"""
+    UPLINK_WIDTH = dut.UPLINK_WIDTH.value.integer
+    NUM_ETROCS = dut.NUM_ETROCS.value.integer
+    CNT_BITS = dut.CNT_BITS.value.integer
+    window = rate_window(dut)
+    label = f"[Rate counter, Rate {rate}, CNT_BITS {CNT_BITS}]"
+
+    # One extra window, the first one after reset is incomplete
+    total_cycles = (WINDOWS + 1) * (window + 1)
+    occupancy = occupancies()
+    seed = random.getrandbits(32)
+    dense = occupancy_stimulus(np.random.default_rng(seed), rate, total_cycles, occupancy,
+                               flash_period(dut), UPLINK_WIDTH)
+    events = dense_events(dense)
+    dut._log.info(f"{label} Occupancy per ETROC word {occupancy}, seed {seed}, "
+                  f"{total_cycles} cycles, {len(events)} bus changes.")
+
+    # rate_i before reset, so every enabled lane starts its windows on the same edge
+    dut.rate_i.value = rate
+    dut.enable_i.value = (1 << UPLINK_WIDTH) - 1
+    dut.slip_i.value = 0
+    dut.uplink_data_i.value = 0
+    await reset_dut(dut)
+    checkpoint = locked_checkpoint(dut, rate, first_flash=0)
+    deposit_checkpoint(dut, checkpoint)
+
+    lanes = {lane: [] for lane in range(NUM_ETROCS)}
+    cnts_changes = []
+    watch = {dut.trigger_inst.cnt_gen[lane].cnt: changes for lane, changes in lanes.items()}
+    watch[dut.cnts_o] = cnts_changes
+    pulses = await drive_sparse(dut, events, total_cycles, watch=watch)
+
+    trace = make_model(dut, checkpoint).run(dense, rate=rate)
+    failures = check_against_model(dut, label, rate, events, total_cycles, pulses, trace=trace)
+
+    # timer holds its value before edge total_cycles
+    phase = (rate_counter_timer(dut, 0).value.integer - total_cycles) % (window + 1)
+    low = (1 << INTEGER_WIDTH) - 1
+    max_count = (1 << CNT_BITS) - 1
+    mismatches, saturated, wrapped, checked = [], 0, 0, 0
+    for lane, changes in lanes.items():
+        latches, expected = rate_counts(trace["cnt_flag"][:, lane], window, CNT_BITS, phase)
+        rate_o = value_at(changes, latches)
+        exported = [(bus >> (lane * INTEGER_WIDTH)) & low for bus in value_at(cnts_changes, latches)]
+        for latch, want, got, port in zip(latches.tolist(), expected.tolist(), rate_o, exported):
+            checked += 1
+            saturated += want == max_count
+            wrapped += want > low
+            if got != want or port != want & low:
+                mismatches.append(f"lane {lane} window ending at edge {latch}: rate_o {got}, cnts_o {port}, "
+                                  f"expected {want} ({want & low} in cnts_o)")
+
+    if mismatches:
+        msg = f"{label} FAILED: {len(mismatches)} rate counter windows differ: " + "; ".join(mismatches[:10])
+        dut._log.error(msg)
+        failures.append(msg)
+    elif not checked:
+        msg = f"{label} FAILED: no complete {window + 1}-cycle rate counter window"
+        dut._log.error(msg)
+        failures.append(msg)
+    else:
+        dut._log.info(f"{label} PASSED: {checked} windows of {NUM_ETROCS} lanes matched, "
+                      f"{saturated} saturated at {max_count}, {wrapped} wrapped in the "
+                      f"{INTEGER_WIDTH}-bit cnts_o.")
+    return failures
+
+
+@cocotb.test()
+async def rate_counter_tb(dut):
+    """Rate counter load test for the selected rates (RATE, all by default)"""
+    cocotb.start_soon(Clock(dut.clk_i, CLK_PERIOD_NS, units="ns").start())
+    all_failures = []
+    rates = selected("RATE", RATES)
+
+    # Opt-in functional coverage, FUNC_COVERAGE=1 (see func_coverage.py)
+    start_coverage(dut, f"rate_counter_cnt{dut.CNT_BITS.value.integer}_rate" + "_".join(map(str, rates)), CLK_PERIOD_NS)
+    try:
+        for rate in rates:
+            with stimulus(f"rate_counter_rate{rate}"):
+                all_failures.extend(await load_rate(dut, rate))
+    finally:
+        finish_coverage(dut._log)
+
+    if all_failures:
+        raise cocotb.result.TestFailure(
+            f"{len(all_failures)} failure(s) detected:\n" + "\n".join(all_failures)
+        )
+
+
+@pytest.mark.parametrize("cnt_bits", COUNTER_WIDTHS)
+@pytest.mark.parametrize("rate", units("RATE", RATES))
+def test_rate_counter(rate, cnt_bits):
+    """Sets up cocotb to run the rate counter load test, one simulation per rate and CNT_BITS"""
+    # The simulation runs inside its sim_build directory
+    if os.getenv("FUNC_COVERAGE_OUT"):
+        os.environ["FUNC_COVERAGE_OUT"] = os.path.abspath(os.environ["FUNC_COVERAGE_OUT"])
+
+    here = os.path.abspath(os.path.dirname(__file__))
+    rtl_dir = os.path.join(here, "..", "hdl")
+
+    vhdl_sources = [
+        os.path.join(rtl_dir, "def_pkg.vhd"),
+        os.path.join(rtl_dir, "Top.vhd"),
+        os.path.join(rtl_dir, "trigger_rx.vhd"),
+        os.path.join(rtl_dir, "flash.vhd"),
+        os.path.join(rtl_dir, "bitslip.vhd"),
+        os.path.join(rtl_dir, "rate_counter.vhd")
+    ]
+
+    # Windows of 1001 cycles instead of one second
+    generics = {
+        "g_CLK_FREQUENCY": 1000,
+        "CNT_BITS": cnt_bits,
+    }
+
+    run(
+        vhdl_sources=vhdl_sources,
+        toplevel="self_trig",
+        toplevel_lang="vhdl",
+        module=os.path.splitext(os.path.basename(__file__))[0],
+        parameters=scale_parameters(generics),
+        sim_build=sim_build_dir("self_trig_rate_counter", rate=rate, cnt_bits=cnt_bits),
+        waves=full_waves(),
+        gui=0,
+        extra_env={
+            "COCOTB_LOG_FILE": "stdout",
+            **unit_env(rate=rate),
+        },
+    )
+
+if __name__ == "__main__":
+    import pytest, sys
+    sys.exit(pytest.main(sys.argv[1:] + [__file__]))
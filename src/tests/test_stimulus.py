@@ -0,0 +1,38 @@
+"""
+Description: Checks the pre-generated stimulus (stimulus.py): sparse arrays match the
+dense bus, constraints hold and a seed reproduces the run. Runs without a simulator.
+"""
+
+import numpy as np
+
+import golden_model as gm
+from stimulus import generate
+
+
+def test_stimulus_constraints():
+    """Flashes on their offset and phase, hits off the flashing bits, bursts on consecutive cycles"""
+    stim = generate(1, 20000, flash_period=50, flash_offsets="random", flash_phases="random",
+                    occupancy=2e-4, hit_interval=500, burst_size=2, burst_length=3, seed=11)
+    dense = stim.dense()
+    np.testing.assert_array_equal(dense, gm.expand_events(list(stim.events()), 20000))
+
+    bits = np.unpackbits(dense, axis=1, bitorder="little")
+    for link, (bit, phase) in enumerate(zip(stim.flash_bits, stim.flash_phases)):
+        assert bit // 16 == link
+        assert np.flatnonzero(bits[:, bit]).tolist() == list(range(phase, 20000, 100))
+
+    assert not np.isin(stim.hits[:, 1], stim.flash_bits).any()
+    # Poisson hits may add bits to the same cycles, the periodic ones repeat 3 times
+    hits = stim.hit_map()
+    for start in range(500, 20000 - 2, 500):
+        assert len(hits[start]) >= 2
+        assert len(set(hits[start]) & set(hits[start + 1]) & set(hits[start + 2])) >= 2
+
+
+def test_stimulus_seed():
+    """Same seed, same run; another seed, another run"""
+    kwargs = dict(rate=0, cycles=10000, flash_period=30, flash_offsets="random", occupancy=1e-3)
+    a, b, c = generate(**kwargs, seed=1), generate(**kwargs, seed=1), generate(**kwargs, seed=2)
+    np.testing.assert_array_equal(a.cycles, b.cycles)
+    np.testing.assert_array_equal(a.words, b.words)
+    assert not np.array_equal(a.hits, c.hits)
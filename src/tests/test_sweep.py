@@ -0,0 +1,59 @@
+"""
+Description: Checks the grid expansion, cache keys and lock statistics of sweep.py,
+and the result hand-over of hdl_build.run_json_tb with a stand-in for the simulator.
+Runs without a simulator.
+"""
+
+import json
+import os
+
+import pytest
+
+import hdl_build
+import sweep
+
+
+def test_expand_grid_fills_defaults():
+    points = sweep.expand_grid({"THRESHOLD": [4, 10], "FLASH_PERIOD": [354]})
+    assert [p["THRESHOLD"] for p in points] == [4, 10]
+    assert all(p["FLASH_PERIOD"] == 354 and p["NUM_ETROCS"] == 28 and p["CNT_BITS"] == 26 for p in points)
+    assert sweep.expand_grid({}) == [sweep.DEFAULTS]
+    with pytest.raises(ValueError):
+        sweep.expand_grid({"NUM_ETROCS": [30]})
+
+
+def test_point_key():
+    """Same generics, settings and HDL give the same key, any change a new one"""
+    generics, settings = dict(sweep.DEFAULTS), {"rate": 0, "occupancy": 0.0, "hit_interval": 97, "seed": 1}
+    key = sweep.point_key(generics, settings, "hdl0")
+    assert key == sweep.point_key(dict(generics), dict(settings), "hdl0")
+    assert key != sweep.point_key({**generics, "THRESHOLD": 4}, settings, "hdl0")
+    assert key != sweep.point_key(generics, {**settings, "seed": 2}, "hdl0")
+    assert key != sweep.point_key(generics, settings, "hdl1")
+
+
+def test_lock_stats():
+    changes = [(10, 0b01), (20, 0b11), (30, 0b01), (40, 0b11), (50, 0b11)]
+    assert sweep.lock_stats(changes, 0b11) == (20, 1)
+    assert sweep.lock_stats([(10, 0b01)], 0b11) == (None, 0)
+
+
+def test_run_json_tb_drops_stale_results(tmp_path, monkeypatch):
+    """A crashed rerun in the same directory returns None, not the previous result"""
+    def finished(**kwargs):
+        env = kwargs["extra_env"]
+        with open(env["DEMO_SPEC"]) as f:
+            spec = json.load(f)
+        with open(env["DEMO_RESULT"], "w") as f:
+            json.dump({"echo": spec, "sim_build": kwargs["sim_build"]}, f)
+        raise SystemExit("test failed")   # a failing test still hands its result back
+
+    def crashed(**kwargs):
+        raise SystemExit("simulator crashed")
+
+    monkeypatch.setattr(hdl_build, "run", finished)
+    result, _ = hdl_build.run_json_tb("demo", tmp_path / "build", {"point": 1}, toplevel="x")
+    assert result == {"echo": {"point": 1}, "sim_build": os.path.abspath(tmp_path / "build")}
+
+    monkeypatch.setattr(hdl_build, "run", crashed)
+    assert hdl_build.run_json_tb("demo", tmp_path / "build", {"point": 1}, toplevel="x")[0] is None
@@ -0,0 +1,75 @@
+"""
+Description: Checks the netlist accounting of synth_report.py (hierarchy breakdown and
+logic depth) on small hand-written Yosys JSON netlists. Runs without Yosys.
+"""
+
+import synth_report as sr
+
+
+def _lut(inputs, output):
+    return {"type": "$lut", "port_directions": {"A": "input", "Y": "output"},
+            "connections": {"A": inputs, "Y": [output]}}
+
+
+def _ff(d, q):
+    return {"type": "$_DFF_P_", "port_directions": {"C": "input", "D": "input", "Q": "output"},
+            "connections": {"C": [2], "D": [d], "Q": [q]}}
+
+
+def _inst(entity):
+    return {"type": entity, "connections": {}}
+
+
+def test_hierarchy_breakdown():
+    """Every level counts its own cells once per instance"""
+    netlist = {"modules": {
+        "self_trig": {"cells": {"t": _inst("trigger_rx"), "f0": _inst("flash_bit_8_3546_10"),
+                                "f1": _inst("flash_bit_8_3546_10"), "f2": _inst("flash_bit_16_3546_10"),
+                                "l": _lut([3], 4)}},
+        "trigger_rx": {"cells": {"b": _inst("bitslip_8"), "b2": _inst("bitslip_8"),
+                                 "r": _ff(5, 6), "l": _lut([5, 6], 7)}},
+        "flash_bit_8_3546_10": {"cells": {"l1": _lut([1], 8), "l2": _lut([8], 9), "q": _ff(9, 10)}},
+        "flash_bit_16_3546_10": {"cells": {"l1": _lut([1], 8)}},
+        "bitslip_8": {"cells": {"q": {"type": "$_DFFE_PP_", "connections": {"Q": [11, 12]}}}},
+    }}
+    modules, totals = sr.hierarchy_breakdown(netlist)
+    assert modules["flash_bit"] == {"instances": 3, "luts": 5, "ffs": 2}
+    assert modules["bitslip"] == {"instances": 2, "luts": 0, "ffs": 4}
+    assert modules["trigger_rx"] == {"instances": 1, "luts": 1, "ffs": 1}
+    assert modules["self_trig"] == {"instances": 1, "luts": 1, "ffs": 0}
+    assert totals == {"luts": 7, "ffs": 7}
+
+
+def test_logic_depth_and_groups():
+    """LUT levels between registers, shared fan-in counted once, loops do not hang"""
+    cells = {
+        # data_masked (20, 21) -> two LUT levels -> or_8 register (30)
+        "m0": _ff(3, 20), "m1": _ff(4, 21),
+        "a": _lut([20, 21], 22), "b": _lut([22, 20], 23),
+        "or8": _ff(23, 30),
+        # or_8 -> one LUT -> trigger_o register (40)
+        "c": _lut([30], 31), "trig": _ff(31, 40),
+        # combinational loop 50 <-> 51 feeding a register
+        "x": _lut([51, 30], 50), "y": _lut([50], 51), "loop": _ff(51, 52),
+    }
+    module = {"cells": cells, "netnames": {
+        "trigger_inst.or_8": {"bits": [30]}, "trigger_inst.or_8_r": {"bits": [52]},
+        "trigger_o": {"bits": [40]}, "trigger_inst.data_masked": {"bits": [20, 21]},
+    }}
+    depth = sr.logic_depth(module)
+    assert depth["or8"] == 2 and depth["trig"] == 1 and depth["m0"] == 0
+    assert depth["loop"] >= 2
+
+    report = sr.depth_report({"modules": {"self_trig": module}})
+    assert report["or_8"] == 2 and report["trigger_o"] == 1
+    assert report["or_16"] is None
+    assert report["max"] == max(depth.values())
+
+
+def test_entity_of_and_script():
+    assert sr.entity_of("\\flash_bit_8_3546_10") == "flash_bit"
+    assert sr.entity_of("rate_counter_26") == "rate_counter"
+    assert sr.entity_of("other") == "other"
+    script = sr.yosys_script({"NUM_ETROCS": 56, "UPLINK_WIDTH": 448}, ["a.vhd"], "h.json", "f.json")
+    assert "-gNUM_ETROCS=56 -gUPLINK_WIDTH=448 a.vhd -e self_trig" in script
+    assert script.index("write_json h.json") < script.index("flatten") < script.index("write_json f.json")
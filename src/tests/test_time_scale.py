@@ -0,0 +1,24 @@
+"""
+Description: Checks the launcher generics and run lengths of the compressed-time mode
+(time_scale.py). Runs without a simulator.
+"""
+
+import pytest
+
+import time_scale as ts
+
+
+def test_scale_parameters(monkeypatch):
+    monkeypatch.delenv("TIME_SCALE", raising=False)
+    assert ts.scale_parameters({"g_CLK_FREQUENCY": 10000}) == {"g_CLK_FREQUENCY": 10000}
+
+    monkeypatch.setenv("TIME_SCALE", "100")
+    # self_trig divides in the RTL, flash_bit gets the divided period
+    assert ts.scale_parameters({"g_CLK_FREQUENCY": 10000}) == {"g_CLK_FREQUENCY": 10000, "TIME_SCALE": 100}
+    assert ts.scale_parameters({"DATA_WIDTH": 8}, toplevel="flash_bit") == {"DATA_WIDTH": 8, "FLASH_PERIOD": 35}
+    assert ts.scaled(6000, minimum=64) == 64
+    assert ts.scaled(60000, minimum=1000) == 1000
+
+    monkeypatch.setenv("TIME_SCALE", "0")
+    with pytest.raises(ValueError):
+        ts.time_scale()
@@ -11,11 +11,17 @@ from pathlib import Path
 import cocotb
 from cocotb.clock import Clock
 from cocotb.triggers import RisingEdge
-from cocotb_test.simulator import run
 
-@cocotb.test()
-async def flashclearv2_tb(dut):
-    """Test flashing bit pattern with (all bits flashing at the same time)"""
+from hdl_build import run
+from sim_farm import sim_build_dir
+from time_scale import scale_parameters
+from wave_capture import full_waves
+
+async def run_flash_pattern(dut, clear):
+    """
+    Flashes all trigger bits until flash_bit v2 locks, then returns the data_o row of
+    the next all-ones flash, or None with the failures of the lock-in
+    """
 
 	# Capture declared generics
     DATA_WIDTH   = dut.DATA_WIDTH.value.integer
@@ -25,6 +31,9 @@ async def flashclearv2_tb(dut):
     # Start the clock
     cocotb.start_soon(Clock(dut.clk_i, 10, units="ns").start())
 
+    # Whether the flashing bits are cleared from data_o once locked
+    dut.clear_i.value = int(clear)
+
     # reset function
     async def reset(cycles=5):
         dut.reset_i.value = 1
@@ -40,7 +49,7 @@ async def flashclearv2_tb(dut):
     # Enough periods for search of flashing pattern + confirmation it clears it
     bit_state     = 0  # toggles every period
     active_period = None
-    confirm_done = False
+    confirm_output = None
 
     max_periods = THRESHOLD + 3
 
@@ -54,17 +63,18 @@ async def flashclearv2_tb(dut):
         dut.data_i.value = pattern
         await RisingEdge(dut.clk_i)
 
-        # If the device is active, wait for a period where the input bit is '1' to confirm the output is cleared
-        if active_period is not None and bit_state == 1 and not confirm_done:
+        # If the device is active, wait for a period where the input bit is '1' and capture the output
+        if active_period is not None and bit_state == 1:
+            # data_o holds the pattern after the second edge from here (bitslip + state machine
+            # registers), a read right after an edge returns the value from before it: wait three
+            dut.data_i.value = 0
+            for _ in range(3):
+                await RisingEdge(dut.clk_i)
+            confirm_output = int(dut.data_o.value)
             cocotb.log.info(
-                f"Confirm pulse (input bit=1)  input=0x{pattern:0{DATA_WIDTH//4}X} "
-                f"output=0x{int(dut.data_o.value):0{DATA_WIDTH//4}X}"
+                f"Confirm pulse (input bit=1, clear_i={int(clear)})  input=0x{pattern:0{DATA_WIDTH//4}X} "
+                f"output=0x{confirm_output:0{DATA_WIDTH//4}X}"
             )
-            if int(dut.data_o.value) != 0:
-                failures.append(
-                    f"Flashing bits pattern not cleared during confirmation period"
-                )
-            confirm_done = True
             break
 
         # Send all 0's for rest of period
@@ -73,40 +83,66 @@ async def flashclearv2_tb(dut):
             await RisingEdge(dut.clk_i)
 
         # Check if flashing bit found 
-        if active_period is None and dut.active_o.value == 1:
+        if active_period is None and dut.locked_o.value == 1:
             active_period = period
-            cocotb.log.info(f"DUT entered ACTIVE state during period {period}")
+            cocotb.log.info(f"DUT entered LOCKED state during period {period}")
 
         # Check if flashing bit previously found but now lost
-        if active_period is not None and dut.active_o.value != 1 and not confirm_done:
-            failures.append(f"active_o de-asserted at period {period} before confirmation")
+        if active_period is not None and dut.locked_o.value != 1:
+            failures.append(f"locked_o de-asserted at period {period} before confirmation")
 
     # Append possible failures
     if active_period is None:
-        failures.append(f"Never entered ACTIVE")
-    elif not confirm_done:
+        failures.append(f"Never entered LOCKED")
+    elif confirm_output is None:
         failures.append(f"Confirmation pulse not executed")
 
+    return confirm_output, failures
+
+
+@cocotb.test()
+async def flashclearv2_tb(dut):
+    """Test flashing bit pattern with (all bits flashing at the same time), cleared with clear_i='1'"""
+    output, failures = await run_flash_pattern(dut, clear=True)
+
+    if output is not None and output != 0:
+        failures.append(f"Flashing bits pattern not cleared during confirmation period")
+
      # Check if any failures occurred
     if failures:
         raise cocotb.result.TestFailure(f"{len(failures)} failure(s):\n" + "\n".join(failures))
     else:
         cocotb.log.info("FlashBitClear – clearing pattern passed ✔")
 
+
+@cocotb.test()
+async def flashkeepv2_tb(dut):
+    """Same pattern with clear_i='0': locks, but the flashing bits must reach data_o"""
+    output, failures = await run_flash_pattern(dut, clear=False)
+
+    all_ones = (1 << dut.DATA_WIDTH.value.integer) - 1
+    if output is not None and output != all_ones:
+        failures.append(f"Flashing bits pattern changed with clear_i='0': output=0x{output:X}")
+
+    if failures:
+        raise cocotb.result.TestFailure(f"{len(failures)} failure(s):\n" + "\n".join(failures))
+    else:
+        cocotb.log.info("FlashBitClear – pattern kept with clear_i='0' ✔")
+
 def test_v2flashbit():
     """Sets up cocotb runs flashclearv2 module test"""
-    os.environ.setdefault("SIM", "ghdl")
-    os.environ.setdefault("GHDL_FLAGS", "--std=08")
 
     here = os.path.abspath(os.path.dirname(__file__))
     rtl  = os.path.join(here, "..", "hdl")
 
     run(
-        vhdl_sources=[os.path.join(rtl, "flash.vhd")],
+        vhdl_sources=[os.path.join(rtl, "bitslip.vhd"), os.path.join(rtl, "flash_v2.vhd")],
         toplevel="flash_bit",
         toplevel_lang="vhdl",
         module=os.path.splitext(os.path.basename(__file__))[0],
-        waves=True,
+        parameters=scale_parameters({}, toplevel="flash_bit"),
+        sim_build=sim_build_dir("flash_bit_v2"),
+        waves=full_waves(),
         gui=0,
         extra_env={        
             "COCOTB_LOG_FILE":  "stdout",        
@@ -0,0 +1,109 @@
+"""
+Description: Checks the streaming VCD reader and the offline analyses of wave_events.py
+on small hand-made dumps. Runs without a simulator.
+"""
+
+import numpy as np
+import pytest
+
+import wave_events as we
+from golden_model import SelfTrigModel
+from wave_capture import write_vcd
+
+
+def _events(name, width, changes, period=10):
+    """SignalEvents from (cycle, integer) changes"""
+    nbytes = max(1, -(-width // 8))
+    values = np.array([list(value.to_bytes(nbytes, "little")) for _, value in changes], dtype=np.uint8)
+    times = np.array([cycle * period for cycle, _ in changes], dtype=np.int64)
+    return we.SignalEvents(name, name, width, times, values.reshape(-1, nbytes))
+
+
+def test_read_vcd_selected_signals(tmp_path, monkeypatch):
+    """Capture dumps read back with their values, chunked, unknown bits as 0"""
+    monkeypatch.setattr(we, "CHUNK_EVENTS", 2)
+    samples = [(cycle, {"trigger_o": str(cycle % 2), "active_o": format(cycle, "012b"), "or_32": "x"})
+               for cycle in range(3, 9)]
+    path = str(tmp_path / "capture.vcd")
+    write_vcd(path, samples, {"trigger_o": 1, "active_o": 12, "or_32": 1})
+
+    events, end_ns = we.read_vcd(path, ["trigger_o", "active_o", "or_32", "or_8"])
+    assert sorted(events) == ["active_o", "or_32", "trigger_o"]
+    assert events["active_o"].path == "self_trig.active_o"
+    assert events["active_o"].cycles().tolist() == list(range(3, 9))
+    assert events["active_o"].integers() == list(range(3, 9))
+    assert events["trigger_o"].integers() == [1, 0, 1, 0, 1, 0]
+    assert events["or_32"].integers() == [0]
+    assert end_ns == 80
+
+    saved = str(tmp_path / "events.npz")
+    we.save_events(saved, events, end_ns)
+    loaded, loaded_end = we.load_events(saved)
+    assert loaded_end == end_ns
+    assert np.array_equal(loaded["active_o"].values, events["active_o"].values)
+    with pytest.raises(ValueError):
+        we.load_events(str(tmp_path / "self_trig.ghw"))
+
+
+def test_nested_scopes_and_timescale(tmp_path):
+    """GHDL style dump: fs timescale, nested scopes, shallowest match for a leaf name"""
+    path = tmp_path / "self_trig.vcd"
+    path.write_text("\n".join([
+        "$date today $end", "$timescale 1 fs $end",
+        "$scope module self_trig $end", "$var reg 4 ! active_o [3:0] $end",
+        "$scope module trigger_inst $end", "$var reg 1 \" or_8 [0:0] $end", "$var reg 4 # active_o [3:0] $end",
+        "$upscope $end", "$upscope $end", "$enddefinitions $end",
+        "#0", "$dumpvars", "b0 !", "0\"", "bx #", "$end",
+        "#20000000", "b11 !", "1\"",
+        "#30000000", "b1010 !",
+    ]) + "\n")
+    events, end_ns = we.read_vcd(str(path), ["active_o", "trigger_inst.active_o", "or_8"])
+    assert events["active_o"].path == "self_trig.active_o"
+    assert events["active_o"].integers() == [0, 3, 10]
+    assert events["active_o"].times.tolist() == [0, 20, 30]
+    assert events["trigger_inst.active_o"].integers() == [0]
+    assert events["or_8"].integers() == [0, 1]
+    assert end_ns == 30
+    assert events["active_o"].values_at([0, 1, 2, 5]).ravel().tolist() == [0, 0, 3, 10]
+
+
+def test_triggers_and_locks():
+    events = {
+        "trigger_o": _events("trigger_o", 1, [(0, 0), (5, 1), (7, 0), (20, 1)]),
+        # 4 ETROCs, rate 1 uses the upper two active_o bits
+        "active_o": _events("active_o", 4, [(0, 0), (10, 0b0100), (12, 0b1100), (30, 0b1000), (40, 0b1100)]),
+    }
+    assert we.trigger_pulses(events) == [(5, 7), (20, None)]
+
+    locks = we.lock_times(events, rate=1)
+    assert [(row["etroc"], row["bit"], row["lock_cycle"], row["unlocks"], row["locked"]) for row in locks] \
+        == [(0, 2, 10, 1, True), (1, 3, 12, 0, True)]
+    assert [row["lock_cycle"] for row in we.lock_times(events, rate=0)] == [None, None, 10, 12]
+
+
+def test_flash_clears():
+    """Bits of active words missing MASK_LAG cycles later are clears, inactive words are not"""
+    lag = we.MASK_LAG
+    events = {
+        # 16-bit bus, ETROC 0 active from cycle 5, ETROC 1 never
+        "active_o": _events("active_o", 2, [(0, 0), (5, 0b01)]),
+        "uplink_data_i": _events("uplink_data_i", 16, [(0, 0), (2, 0x0101), (3, 0), (10, 0x0103), (12, 0)]),
+        "data_masked": _events("data_masked", 16, [(0, 0), (10 + lag, 0x0002), (11 + lag, 0)]),
+    }
+    assert we.flash_clears(events, end_ns=400) == [(10, 0), (11, 0), (11, 1)]
+    # Clears whose data_masked cycle lies past the end of the dump are not reported
+    assert we.flash_clears(events, end_ns=(11 + lag) * 10) == [(10, 0)]
+
+
+def test_mask_lag_matches_model():
+    """uplink_data_i sampled by edge t reaches data_masked after edge t + MASK_LAG - 1"""
+    flash_period, threshold = 20, 2
+    model = SelfTrigModel(flash_period=flash_period, threshold=threshold)
+    model.reset(post_edge=False)
+    lock = np.zeros(((2 * threshold + 4) * flash_period + 5, model.nbytes), dtype=np.uint8)
+    lock[::2 * flash_period, :] = 1
+    assert model.run(lock, rate=0)["active_o"][-1].all()
+
+    hit = np.zeros((10, model.nbytes), dtype=np.uint8)
+    hit[0, 3] = 0b100
+    assert np.flatnonzero(model.run(hit)["data_masked"].any(axis=1)).tolist() == [we.MASK_LAG - 1]
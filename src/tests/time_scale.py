@@ -0,0 +1,60 @@
+"""
+Description: Compressed-time mode for self_trig simulations
+
+self_trig divides FLASH_PERIOD (every flash_bit) and g_CLK_FREQUENCY (the rate_counter
+window in trigger_rx) by its TIME_SCALE generic, 1 in hardware. Setting TIME_SCALE=100
+in the environment makes every launcher pass it, and the testbenches derive their
+periods, windows and run lengths from the same factor, so a smoke regression runs
+about 100x fewer cycles and still sees the rate counters latch.
+
+The standalone flash_bit launchers have no TIME_SCALE generic, they get the divided
+FLASH_PERIOD instead.
+
+    TIME_SCALE=100 pytest -n auto src/tests
+"""
+
+import os
+
+
+# flash_bit / self_trig FLASH_PERIOD default (flash.vhd, Top.vhd)
+FLASH_PERIOD = 3546
+
+
+def time_scale():
+    """Factor selected with TIME_SCALE, 1 when unset"""
+    scale = int(os.getenv("TIME_SCALE", 1))
+    if scale < 1:
+        raise ValueError(f"TIME_SCALE={scale}, must be a positive integer")
+    return scale
+
+
+def scale_parameters(parameters, toplevel="self_trig"):
+    """Launcher generics with the selected compression applied"""
+    scale = time_scale()
+    if scale == 1:
+        return dict(parameters)
+    if toplevel == "flash_bit":
+        return {**parameters, "FLASH_PERIOD": max(parameters.get("FLASH_PERIOD", FLASH_PERIOD) // scale, 1)}
+    return {**parameters, "TIME_SCALE": scale}
+
+
+def scaled(cycles, minimum=1):
+    """A testbench run length or interval in compressed time"""
+    return max(cycles // time_scale(), minimum)
+
+
+def _scale(dut):
+    return dut.TIME_SCALE.value.integer if hasattr(dut, "TIME_SCALE") else 1
+
+
+def flash_period(dut):
+    """FLASH_PERIOD the flash_bit instances of self_trig actually use"""
+    period = dut.FLASH_PERIOD.value.integer // _scale(dut)
+    if period < 1:
+        raise ValueError(f"FLASH_PERIOD={dut.FLASH_PERIOD.value.integer} is below TIME_SCALE={_scale(dut)}")
+    return period
+
+
+def rate_window(dut):
+    """g_CLK_FREQUENCY the rate_counter instances of self_trig actually use"""
+    return dut.g_CLK_FREQUENCY.value.integer // _scale(dut)
@@ -0,0 +1,153 @@
+"""
+Description: Recorded trigger-uplink traces, stored as packed words and replayed from memory maps
+
+Captures from the test stands are hundreds of millions of UPLINK_WIDTH-bit words, so
+they are never loaded whole: the words are read through numpy.memmap and handed out
+in chunks, to the reference model as arrays and to the DUT as (cycle, word) changes.
+
+File layout, all fields little-endian:
+
+    header, HEADER_SIZE bytes
+        magic       4s   b"ETRT"
+        version     u2   FORMAT_VERSION
+        header_size u2   offset of the first word
+        rate        u1   0==320, 1==640, 2==1280
+        reserved    u1
+        num_etrocs  u2   NUM_ETROCS of the capture
+        word_bytes  u2   UPLINK_WIDTH // 8
+        num_words   u8
+        (zero padding up to header_size)
+    words, num_words x word_bytes
+        byte k of a word holds uplink bits 8k+7 .. 8k, the layout golden_model uses
+"""
+
+import struct
+
+import numpy as np
+
+from golden_model import ETROC_WIDTH, RATES, pack_words, trigger_pulses
+
+
+MAGIC = b"ETRT"
+FORMAT_VERSION = 1
+HEADER_SIZE = 64
+CHUNK_CYCLES = 1 << 16
+
+_HEADER = struct.Struct("<4sHHBBHHQ")
+
+
+class TraceWriter:
+    """
+    Appends words to a trace file, the header word count is written on close.
+
+        with TraceWriter("run.etrt", rate=0) as writer:
+            writer.write(chunk)  # (cycles, word_bytes) uint8 array or a list of integers
+    """
+
+    def __init__(self, path, rate, num_etrocs=28):
+        if rate not in RATES:
+            raise ValueError(f"rate {rate} is not one of {RATES}")
+        self.path = path
+        self.rate = rate
+        self.num_etrocs = num_etrocs
+        self.word_bytes = num_etrocs * ETROC_WIDTH // 8
+        self.num_words = 0
+        self._file = open(path, "wb")
+        self._write_header()
+
+    def _write_header(self):
+        header = _HEADER.pack(MAGIC, FORMAT_VERSION, HEADER_SIZE, self.rate, 0,
+                              self.num_etrocs, self.word_bytes, self.num_words)
+        self._file.seek(0)
+        self._file.write(header.ljust(HEADER_SIZE, b"\0"))
+
+    def write(self, words):
+        if not isinstance(words, np.ndarray):
+            words = pack_words(words, self.word_bytes * 8)
+        if words.dtype != np.uint8 or words.ndim != 2 or words.shape[1] != self.word_bytes:
+            raise ValueError(f"expected a (cycles, {self.word_bytes}) uint8 array, got {words.dtype} {words.shape}")
+        self._file.seek(0, 2)
+        self._file.write(np.ascontiguousarray(words).tobytes())
+        self.num_words += len(words)
+
+    def close(self):
+        if not self._file.closed:
+            self._write_header()
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def write_trace(path, words, rate, num_etrocs=28):
+    """Write a whole trace at once"""
+    with TraceWriter(path, rate, num_etrocs) as writer:
+        writer.write(words)
+
+
+class UplinkTrace:
+    """Read-only view of a trace file, words is a (num_words, word_bytes) numpy.memmap"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            raw = f.read(_HEADER.size)
+        if len(raw) < _HEADER.size:
+            raise ValueError(f"{path}: too short for an uplink trace header")
+        magic, version, header_size, rate, _, num_etrocs, word_bytes, num_words = _HEADER.unpack(raw)
+        if magic != MAGIC:
+            raise ValueError(f"{path}: not an uplink trace (magic {magic!r})")
+        if version != FORMAT_VERSION:
+            raise ValueError(f"{path}: trace format version {version}, expected {FORMAT_VERSION}")
+
+        self.rate = rate
+        self.num_etrocs = num_etrocs
+        self.uplink_width = word_bytes * 8
+        self.words = np.memmap(path, dtype=np.uint8, mode="r", offset=header_size, shape=(num_words, word_bytes))
+
+    def __len__(self):
+        return len(self.words)
+
+    def chunks(self, chunk_cycles=CHUNK_CYCLES, start=0, stop=None):
+        """Consecutive (first cycle, words) views, only the pages touched are read from disk"""
+        stop = len(self) if stop is None else min(stop, len(self))
+        for first in range(start, stop, chunk_cycles):
+            yield first, self.words[first:min(first + chunk_cycles, stop)]
+
+    def events(self, chunk_cycles=CHUNK_CYCLES, start=0, stop=None):
+        """
+        (cycle, word) changes for a sparse driver, cycle counted from start. The first
+        word is always reported so the bus does not keep a value from before the replay.
+        """
+        prev = None
+        for first, chunk in self.chunks(chunk_cycles, start, stop):
+            changed = np.empty(len(chunk), dtype=bool)
+            changed[0] = prev is None or bool(np.any(chunk[0] != prev))
+            changed[1:] = np.any(chunk[1:] != chunk[:-1], axis=1)
+            for row in np.flatnonzero(changed):
+                yield first - start + int(row), int.from_bytes(chunk[row].tobytes(), "little")
+            prev = chunk[-1]
+
+
+def replay_model(model, trace, rate=None, chunk_cycles=CHUNK_CYCLES, start=0, stop=None):
+    """
+    Runs a trace through a golden_model.SelfTrigModel chunk by chunk and returns the
+    trigger_o pulses as (rise, fall) cycles from start, like golden_model.trigger_pulses
+    """
+    if model.uplink_width != trace.uplink_width:
+        raise ValueError(f"trace is {trace.uplink_width} bits wide, the model {model.uplink_width}")
+    rate = trace.rate if rate is None else rate
+
+    pulses = []
+    for first, chunk in trace.chunks(chunk_cycles, start, stop):
+        for rise, fall in trigger_pulses(model.run(chunk, rate=rate)):
+            rise, fall = rise + first - start, fall + first - start
+            # A pulse still high at the end of a chunk continues in the next one
+            if pulses and pulses[-1][1] == rise:
+                pulses[-1] = (pulses[-1][0], fall)
+            else:
+                pulses.append((rise, fall))
+    return pulses
@@ -0,0 +1,128 @@
+"""
+Description: Warm start for self_trig simulations
+
+Deposits the internal state of every flash_bit instance (flash_irate_gen ->
+flash_ietroc_gen -> gen_rate_N -> flash_inst_N) so trigger-path tests can start
+directly in ACTIVE instead of clocking THRESHOLD * 2 * FLASH_PERIOD cycles of lock-in.
+
+A checkpoint has the same layout as golden_model.SelfTrigModel.snapshot():
+    {rate: [{"state", "index", "count", "clk_counter"} per ETROC word]}
+plus the generics it is valid for, so the reference model can be restored from the
+same data. Checkpoints come either from locked_checkpoint() (a spec) or from
+capture_checkpoint() on an earlier run, and can be stored as JSON.
+"""
+
+import json
+
+from golden_model import ACTIVE, RATES, etroc_width
+from time_scale import flash_period
+
+
+FLASH_SIGNALS = ("state", "index", "count", "clk_counter")
+
+
+def flash_instance(dut, rate, ietroc):
+    """Handle of the flash_bit instance for one ETROC word at one rate"""
+    gen = dut.flash_irate_gen[rate].flash_ietroc_gen[ietroc]
+    return getattr(getattr(gen, f"gen_rate_{rate}"), f"flash_inst_{rate}")
+
+
+def _generics(dut):
+    return {
+        "UPLINK_WIDTH": dut.UPLINK_WIDTH.value.integer,
+        "FLASH_PERIOD": flash_period(dut),
+        "THRESHOLD": dut.THRESHOLD.value.integer,
+    }
+
+
+def locked_checkpoint(dut, rate, offsets=None, first_flash=0):
+    """
+    Spec for every ETROC word of one rate already locked (ACTIVE) on its flashing bit.
+
+    offsets     : flashing bit position inside each ETROC word, 0 for all by default
+    first_flash : stimulus cycle (clock edge counted from the deposit) carrying the
+                  next flashing '1', the FSM checks it and then every 2*FLASH_PERIOD.
+                  One cycle for every word or a list with one per word.
+    """
+    generics = _generics(dut)
+    num_links = generics["UPLINK_WIDTH"] // etroc_width(rate)
+    offsets = [0] * num_links if offsets is None else list(offsets)
+    if len(offsets) != num_links:
+        raise ValueError(f"rate {rate} has {num_links} ETROC words, got {len(offsets)} offsets")
+
+    first_flash = [first_flash] * num_links if isinstance(first_flash, int) else list(first_flash)
+    if len(first_flash) != num_links:
+        raise ValueError(f"rate {rate} has {num_links} ETROC words, got {len(first_flash)} flash cycles")
+
+    states = [
+        locked_state(offset, flash, generics["FLASH_PERIOD"], generics["THRESHOLD"])
+        for offset, flash in zip(offsets, first_flash)
+    ]
+    return {"generics": generics, "flash": {rate: states}}
+
+
+def locked_state(offset, first_flash, flash_period, threshold):
+    """flash_bit internal signals of one word locked on bit offset, next flash on edge first_flash"""
+    # clk_counter reaches FLASH_PERIOD*2 - 1 on the edge sampling the flash
+    period = 2 * flash_period
+    return {"state": ACTIVE, "index": offset, "count": threshold, "clk_counter": (period - 1 - first_flash) % period}
+
+
+def capture_checkpoint(dut, rates=RATES):
+    """Read the flash_bit internal signals of a running simulation"""
+    flash = {}
+    for rate in rates:
+        num_links = dut.UPLINK_WIDTH.value.integer // etroc_width(rate)
+        flash[rate] = [
+            {name: int(getattr(flash_instance(dut, rate, ietroc), name).value) for name in FLASH_SIGNALS}
+            for ietroc in range(num_links)
+        ]
+    return {"generics": _generics(dut), "flash": flash}
+
+
+def deposit_checkpoint(dut, checkpoint):
+    """
+    Write a checkpoint into the flash_bit instances. Call right after a rising edge;
+    the FSMs continue from the deposited values on the next edge.
+    """
+    generics = _generics(dut)
+    if checkpoint["generics"] != generics:
+        raise ValueError(f"checkpoint generics {checkpoint['generics']} do not match the DUT {generics}")
+
+    for rate, states in checkpoint["flash"].items():
+        for ietroc, values in enumerate(states):
+            inst = flash_instance(dut, int(rate), ietroc)
+            for name in FLASH_SIGNALS:
+                getattr(inst, name).value = values[name]
+            # active_o is registered from the state, keep it consistent with the deposit
+            inst.active_o_internal.value = int(values["state"] == ACTIVE)
+
+    dut._log.info(f"Warm start: deposited flash_bit state for rates {sorted(int(r) for r in checkpoint['flash'])}")
+
+
+def model_checkpoint(model):
+    """Checkpoint of a golden_model.SelfTrigModel, e.g. after running the lock-in offline"""
+    generics = {
+        "UPLINK_WIDTH": model.uplink_width,
+        "FLASH_PERIOD": model.flash_period,
+        "THRESHOLD": model.threshold,
+    }
+    return {"generics": generics, "flash": model.snapshot()}
+
+
+def restore_model(model, checkpoint):
+    """Apply a checkpoint to a golden_model.SelfTrigModel"""
+    model.restore({int(rate): states for rate, states in checkpoint["flash"].items()})
+
+
+def save_checkpoint(path, checkpoint):
+    with open(path, "w") as f:
+        json.dump(checkpoint, f, indent=2)
+
+
+def load_checkpoint(path):
+    with open(path) as f:
+        checkpoint = json.load(f)
+    checkpoint["flash"] = {int(rate): states for rate, states in checkpoint["flash"].items()}
+    return checkpoint
+
@@ -0,0 +1,200 @@
+"""
+Description: Trigger-windowed waveform capture for self_trig simulations
+
+Instead of dumping every signal for the whole run (waves=True), the testbench keeps
+a ring buffer of the last WAVE_DEPTH sampled cycles of a few signals and only writes
+a VCD when something worth looking at happens. Samples are taken in windows of
+WAVE_WINDOW cycles around every stimulus event and every trigger_o edge predicted by
+the reference model, or on every cycle in "ring" mode.
+
+WAVE_CAPTURE  window (default) | ring | full (simulator waves=True, the old behaviour,
+              add WAVE_FORMAT=vcd for a GHDL VCD) | off
+WAVE_DUMP     fail (default, dump around a mismatch with the model) | trigger (also
+              around every trigger_o rise)
+WAVE_DEPTH    ring buffer length in sampled cycles, 512 by default
+WAVE_WINDOW   cycles sampled before and after each event, 16 by default
+WAVE_MAX_DUMPS  VCD files written per capture at most, 4 by default
+
+Dumps go to waves/<name>_cycle<N>.vcd in the simulation directory. The value at
+time N * CLK_PERIOD_NS is the one present right before clock edge N: the input
+sampled by that edge and the registered outputs of edge N - 1.
+"""
+
+import os
+from collections import deque
+
+import numpy as np
+
+
+CAPTURE_MODES = ("window", "ring", "full", "off")
+DUMP_MODES = ("fail", "trigger")
+
+# name in the VCD -> path below the self_trig toplevel
+CAPTURE_SIGNALS = {
+    "uplink_data_i": ("uplink_data_i",),
+    "active_o": ("active_o",),
+    "trigger_o": ("trigger_o",),
+    "data_masked": ("trigger_inst", "data_masked"),
+    "or_32": ("trigger_inst", "or_32"),
+}
+
+_VCD_BITS = str.maketrans("UXW-LHZ", "xxxx01z")
+
+
+def capture_mode():
+    mode = os.getenv("WAVE_CAPTURE", "window")
+    if mode not in CAPTURE_MODES:
+        raise ValueError(f"WAVE_CAPTURE={mode}, expected one of {CAPTURE_MODES}")
+    return mode
+
+
+def full_waves():
+    """waves= argument for the cocotb-test launchers"""
+    return capture_mode() == "full"
+
+
+def _resolve(dut, path):
+    handle = dut
+    for name in path:
+        handle = getattr(handle, name)
+    return handle
+
+
+def _bits(trace_row):
+    """Model trace row (bool per bit, bit 0 first) -> integer"""
+    return int.from_bytes(np.packbits(trace_row, bitorder="little").tobytes(), "little")
+
+
+class WaveCapture:
+    """
+    Ring buffer of sampled cycles for one stimulus run.
+
+    trace is the reference model output for the same stimulus (golden_model
+    SelfTrigModel.run). Its trigger_o and active_o are compared with the DUT on
+    every sampled cycle to decide when to dump.
+    """
+
+    def __init__(self, dut, name, trace, mode=None, signals=CAPTURE_SIGNALS):
+        self.dut = dut
+        self.name = name
+        self.mode = mode or capture_mode()
+        self.dump_mode = os.getenv("WAVE_DUMP", "fail")
+        if self.dump_mode not in DUMP_MODES:
+            raise ValueError(f"WAVE_DUMP={self.dump_mode}, expected one of {DUMP_MODES}")
+        self.window = int(os.getenv("WAVE_WINDOW", "16"))
+        self.max_dumps = int(os.getenv("WAVE_MAX_DUMPS", "4"))
+
+        self.handles = {name: _resolve(dut, path) for name, path in signals.items()}
+        self.widths = {name: len(handle) for name, handle in self.handles.items()}
+        self.samples = deque(maxlen=int(os.getenv("WAVE_DEPTH", "512")))
+
+        self.expected_trigger = trace["trigger_o"]
+        self.expected_active = trace["active_o"]
+        self.mismatches = []
+        self.dumps = []
+        self._pending = None
+        self._last_trigger = 0
+
+    def sample_cycles(self, events, total_cycles):
+        """Sorted clock edges to sample: windows around events and model trigger edges, or all"""
+        if self.mode == "ring":
+            return np.arange(total_cycles)
+
+        centers = [cycle for cycle, word in events if word]
+        trigger = self.expected_trigger.astype(np.int8)
+        centers.extend(np.flatnonzero(np.diff(trigger, prepend=0)).tolist())
+        if not centers:
+            return np.zeros(0, dtype=np.int64)
+
+        offsets = np.arange(-self.window, self.window + 1)
+        cycles = np.unique((np.asarray(centers)[:, None] + offsets).ravel())
+        return cycles[(cycles >= 0) & (cycles < total_cycles)]
+
+    def sample(self, cycle):
+        """
+        Record the values present before clock edge `cycle`. Must be called right
+        after rising edge `cycle`, while the signals still hold their pre-edge values.
+        """
+        values = {name: handle.value.binstr for name, handle in self.handles.items()}
+        self.samples.append((cycle, values))
+
+        if cycle > 0:
+            trigger = values["trigger_o"] == "1"
+            expected_trigger = bool(self.expected_trigger[cycle - 1])
+            active = self.handles["active_o"].value
+            active_ok = active.is_resolvable and active.integer == _bits(self.expected_active[cycle - 1])
+            if trigger != expected_trigger or not active_ok:
+                self.mismatches.append(cycle)
+                if self._pending is None:
+                    self._pending = cycle + self.window
+            elif self.dump_mode == "trigger" and trigger and not self._last_trigger:
+                if self._pending is None:
+                    self._pending = cycle + self.window
+            self._last_trigger = trigger
+
+        if self._pending is not None and cycle >= self._pending:
+            self.dump()
+
+    def finish(self):
+        """Flush a dump that was waiting for the end of its window"""
+        if self._pending is not None:
+            self.dump()
+        if self.mismatches:
+            self.dut._log.warning(f"Wave capture {self.name}: DUT differed from the model on "
+                                  f"{len(self.mismatches)} sampled cycles, dumps: {self.dumps}")
+
+    def dump(self):
+        """Write the ring buffer as a VCD"""
+        self._pending = None
+        samples = list(self.samples)
+        if not samples or len(self.dumps) >= self.max_dumps:
+            return None
+
+        os.makedirs("waves", exist_ok=True)
+        path = os.path.join("waves", f"{self.name}_cycle{samples[-1][0]}.vcd")
+        write_vcd(path, samples, self.widths)
+        self.dumps.append(path)
+        self.dut._log.info(f"Wave capture {self.name}: wrote {path} "
+                           f"(cycles {samples[0][0]}..{samples[-1][0]})")
+        return path
+
+
+def write_vcd(path, samples, widths, period_ns=10, module="self_trig"):
+    """
+    samples is a list of (cycle, {name: binstr}). A `captured` marker goes low
+    between non-consecutive cycles so gaps in the capture are visible.
+    """
+    ids = {name: chr(34 + i) for i, name in enumerate(widths)}
+    ids["captured"] = chr(34 + len(widths))
+
+    lines = ["$timescale 1ns $end", f"$scope module {module} $end"]
+    for name, width in widths.items():
+        lines.append(f"$var wire {width} {ids[name]} {name} $end")
+    lines += [f"$var wire 1 {ids['captured']} captured $end", "$upscope $end", "$enddefinitions $end"]
+
+    last = {}
+    prev_cycle = None
+    for cycle, values in samples:
+        if prev_cycle is not None and cycle != prev_cycle + 1:
+            lines += [f"#{(prev_cycle + 1) * period_ns}", f"0{ids['captured']}"]
+            last.pop("captured", None)
+        lines.append(f"#{cycle * period_ns}")
+        if last.get("captured") != "1":
+            lines.append(f"1{ids['captured']}")
+            last["captured"] = "1"
+        for name, binstr in values.items():
+            if last.get(name) != binstr:
+                bits = binstr.translate(_VCD_BITS)
+                lines.append(f"{bits}{ids[name]}" if widths[name] == 1 else f"b{bits} {ids[name]}")
+                last[name] = binstr
+        prev_cycle = cycle
+
+    with open(path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def wave_capture(dut, name, trace):
+    """WaveCapture for the current WAVE_CAPTURE mode, None when no windowed capture is wanted"""
+    if capture_mode() in ("window", "ring"):
+        return WaveCapture(dut, name, trace)
+    return None
@@ -0,0 +1,370 @@
+"""
+Description: Streaming VCD event extractor for offline analysis of finished runs
+
+Reads a VCD (plain or .gz) line by line and keeps only the value changes of the
+selected signals (SIGNALS by default), each as a SignalEvents: change times in ns
+and the values as little-endian packed bytes, the (rows, width // 8) uint8 layout
+of golden_model. Memory grows with the changes of the selected signals only, not
+with the size of the dump. The extracted events can be saved as .npz, so further
+questions about a long run need neither the dump nor a new simulation.
+
+Sources of VCDs: the full-run dump of GHDL with WAVE_CAPTURE=full WAVE_FORMAT=vcd
+(see hdl_build.py) and the windowed dumps of wave_capture.py. GHDL's own .ghw
+format is not read, rerun with WAVE_FORMAT=vcd.
+
+Cycle c covers [c * period, (c + 1) * period), an input shown in cycle c is
+sampled by the clock edge ending it. With slip 0 a bit of uplink_data_i shows up
+in data_masked MASK_LAG cycles later.
+
+    python src/tests/wave_events.py extract sim_build/self_trig_rate0/self_trig.vcd -o run.npz
+    python src/tests/wave_events.py triggers run.npz
+    python src/tests/wave_events.py locks run.npz --rate 0
+    python src/tests/wave_events.py clears run.npz --rate 0 --json clears.json
+"""
+
+import argparse
+import gzip
+import json
+import re
+import sys
+
+import numpy as np
+
+from golden_model import etroc_width
+
+
+CLK_PERIOD_NS = 10
+SIGNALS = ("trigger_o", "active_o", "uplink_data_i", "or_8", "data_masked")
+# Changes buffered as Python objects before they are packed into arrays
+CHUNK_EVENTS = 65536
+# Cycles from uplink_data_i to data_masked in a dump: four edges through flash_bit,
+# bitslip and the mask, one more as an input is shown in the cycle before its edge
+MASK_LAG = 5
+
+# timescale unit -> (multiplier, divisor) to ns
+_TIMESCALES = {"s": (10**9, 1), "ms": (10**6, 1), "us": (1000, 1), "ns": (1, 1),
+               "ps": (1, 1000), "fs": (1, 10**6)}
+# Unknown and high-impedance bits read as 0
+_BITS = str.maketrans("xXzZuUwW-lLhH", "0000000000011")
+
+
+class SignalEvents:
+    """Value changes of one signal, times in ns, values packed (changes, width // 8 rounded up)"""
+
+    def __init__(self, name, path, width, times, values):
+        self.name = name
+        self.path = path
+        self.width = width
+        self.times = times
+        self.values = values
+
+    def __len__(self):
+        return len(self.times)
+
+    def cycles(self, period_ns=CLK_PERIOD_NS):
+        """Clock cycle of every change"""
+        return self.times // period_ns
+
+    def bits(self):
+        """(changes, width) bool, bit 0 first"""
+        return np.unpackbits(self.values, axis=1, bitorder="little")[:, :self.width].astype(bool)
+
+    def integers(self):
+        return [int.from_bytes(row.tobytes(), "little") for row in self.values]
+
+    def values_at(self, cycles, period_ns=CLK_PERIOD_NS):
+        """Packed value held in each of cycles (last change in or before it), 0 before the first"""
+        rows = np.searchsorted(self.cycles(period_ns), np.asarray(cycles, dtype=np.int64), side="right") - 1
+        out = self.values[np.maximum(rows, 0)]
+        out[rows < 0] = 0
+        return out
+
+
+class _Buffer:
+    """Changes of one signal while the dump is read"""
+
+    def __init__(self, width):
+        self.width = width
+        self.nbytes = max(1, -(-width // 8))
+        self.times, self.values = [], bytearray()
+        self.time_chunks, self.value_chunks = [], []
+
+    def add(self, time, bits):
+        if len(bits) < self.width:
+            bits = bits.rjust(self.width, "0")
+        self.times.append(time)
+        self.values += int(bits.translate(_BITS), 2).to_bytes(self.nbytes, "little")
+        if len(self.times) >= CHUNK_EVENTS:
+            self.flush()
+
+    def flush(self):
+        if self.times:
+            self.time_chunks.append(np.array(self.times, dtype=np.int64))
+            self.value_chunks.append(np.frombuffer(bytes(self.values), dtype=np.uint8).reshape(-1, self.nbytes))
+            self.times, self.values = [], bytearray()
+
+    def arrays(self, mult, div):
+        self.flush()
+        if not self.time_chunks:
+            return np.zeros(0, dtype=np.int64), np.zeros((0, self.nbytes), dtype=np.uint8)
+        return np.concatenate(self.time_chunks) * mult // div, np.concatenate(self.value_chunks)
+
+
+def _open(path):
+    return gzip.open(path, "rt") if path.endswith(".gz") else open(path)
+
+
+def _tokens(f):
+    for line in f:
+        yield from line.split()
+
+
+def _until_end(tokens):
+    return list(iter(lambda: next(tokens), "$end"))
+
+
+def _select(variables, names):
+    """
+    name -> (path, id, width) of the shallowest variable whose dotted path is name or
+    ends with ".name", names without a match are left out
+    """
+    selected = {}
+    for name in names:
+        matches = [(path.count("."), path, code, width) for path, (code, width) in variables.items()
+                   if path == name or path.endswith("." + name)]
+        if matches:
+            _, path, code, width = min(matches)
+            selected[name] = (path, code, width)
+    return selected
+
+
+def read_vcd(path, signals=SIGNALS):
+    """
+    Streams a VCD and returns ({name: SignalEvents} of the signals found, end time in ns).
+    A signal name may be a leaf name (the shallowest match wins) or a dotted path suffix.
+    """
+    with _open(path) as f:
+        tokens = _tokens(f)
+
+        # Header: scopes, variables and the timescale
+        variables, scope = {}, []
+        mult, div = 1, 1
+        for token in tokens:
+            if token == "$scope":
+                scope.append(_until_end(tokens)[1])
+            elif token == "$upscope":
+                _until_end(tokens)
+                scope.pop()
+            elif token == "$var":
+                fields = _until_end(tokens)
+                ref = fields[3].split("[")[0]
+                variables.setdefault(".".join(scope + [ref]), (fields[2], int(fields[1])))
+            elif token == "$timescale":
+                match = re.fullmatch(r"(\d+)\s*([a-z]+)", "".join(_until_end(tokens)))
+                mult, div = _TIMESCALES[match.group(2)]
+                mult *= int(match.group(1))
+            elif token == "$enddefinitions":
+                _until_end(tokens)
+                break
+            elif token.startswith("$"):
+                _until_end(tokens)
+
+        selected = _select(variables, signals)
+        buffers = {}   # id -> [_Buffer], several names may share one id
+        by_name = {}
+        for name, (_, code, width) in selected.items():
+            by_name[name] = _Buffer(width)
+            buffers.setdefault(code, []).append(by_name[name])
+
+        # Value changes
+        time = 0
+        for token in tokens:
+            first = token[0]
+            if first == "#":
+                time = int(token[1:])
+            elif first in "bB":
+                code = next(tokens)
+                for buffer in buffers.get(code, ()):
+                    buffer.add(time, token[1:])
+            elif first in "rR":
+                next(tokens)
+            elif first == "$":
+                continue
+            else:
+                for buffer in buffers.get(token[1:], ()):
+                    buffer.add(time, first)
+
+    events = {}
+    for name, (signal_path, _, width) in selected.items():
+        times, values = by_name[name].arrays(mult, div)
+        events[name] = SignalEvents(name, signal_path, width, times, values)
+    return events, time * mult // div
+
+
+def save_events(path, events, end_ns):
+    """Extracted events as a compressed .npz"""
+    meta = {"end_ns": int(end_ns),
+            "signals": {name: {"path": ev.path, "width": ev.width} for name, ev in events.items()}}
+    arrays = {}
+    for name, ev in events.items():
+        arrays[f"{name}__times"] = ev.times
+        arrays[f"{name}__values"] = ev.values
+    np.savez_compressed(path, meta=json.dumps(meta), **arrays)
+
+
+def load_events(path, signals=SIGNALS):
+    """({name: SignalEvents}, end time in ns) from a VCD or a .npz written by save_events"""
+    if path.endswith(".ghw"):
+        raise ValueError(f"{path}: GHW dumps are not supported, rerun with WAVE_FORMAT=vcd")
+    if not path.endswith(".npz"):
+        return read_vcd(path, signals)
+
+    with np.load(path) as data:
+        meta = json.loads(str(data["meta"]))
+        events = {name: SignalEvents(name, info["path"], info["width"],
+                                     data[f"{name}__times"], data[f"{name}__values"])
+                  for name, info in meta["signals"].items()}
+    return events, meta["end_ns"]
+
+
+def _require(events, *names):
+    missing = [name for name in names if name not in events]
+    if missing:
+        raise ValueError(f"signals {missing} are not in the dump")
+
+
+def trigger_pulses(events, period_ns=CLK_PERIOD_NS):
+    """trigger_o pulses as (rise, fall) cycles, fall None while still high at the end"""
+    _require(events, "trigger_o")
+    trigger = events["trigger_o"]
+    high = trigger.bits()[:, 0]
+    cycles = trigger.cycles(period_ns)
+    pulses = []
+    for cycle, value in zip(cycles.tolist(), high.tolist()):
+        if value and (not pulses or pulses[-1][1] is not None):
+            pulses.append((cycle, None))
+        elif not value and pulses and pulses[-1][1] is None:
+            pulses[-1] = (pulses[-1][0], cycle)
+    return pulses
+
+
+def _active_bits(rate, num_etrocs):
+    """active_o bit of every ETROC word of rate, rates 1 and 2 use the upper bits"""
+    num_links = num_etrocs * 8 // etroc_width(rate)
+    return np.arange(num_etrocs - num_links, num_etrocs)
+
+
+def lock_times(events, rate=0, period_ns=CLK_PERIOD_NS):
+    """
+    Per ETROC word of rate: the cycle active_o first rose (None if never), the number
+    of times it fell afterwards and whether it is high at the end
+    """
+    _require(events, "active_o")
+    active = events["active_o"]
+    bits = active.bits()
+    cycles = active.cycles(period_ns)
+    prev = np.vstack([np.zeros_like(bits[:1]), bits[:-1]])
+
+    report = []
+    for etroc, bit in enumerate(_active_bits(rate, active.width).tolist()):
+        rises = np.flatnonzero(bits[:, bit] & ~prev[:, bit])
+        first = int(cycles[rises[0]]) if len(rises) else None
+        unlocks = int(np.count_nonzero(~bits[rises[0]:, bit] & prev[rises[0]:, bit])) if len(rises) else 0
+        report.append({"etroc": etroc, "bit": bit, "lock_cycle": first, "unlocks": unlocks,
+                       "locked": bool(len(bits) and bits[-1, bit])})
+    return report
+
+
+def _high_cycles(ev, end_cycle, period_ns):
+    """Cycles before end_cycle in which ev holds a nonzero value"""
+    cycles = ev.cycles(period_ns)
+    stops = np.append(cycles[1:], end_cycle)
+    nonzero = np.flatnonzero(ev.values.any(axis=1))
+    ranges = [np.arange(cycles[i], min(stops[i], end_cycle)) for i in nonzero]
+    return np.concatenate(ranges) if ranges else np.zeros(0, dtype=np.int64)
+
+
+def flash_clears(events, end_ns, rate=0, period_ns=CLK_PERIOD_NS):
+    """
+    (cycle, uplink bit) of every uplink_data_i bit of an ETROC word with active_o high
+    that is missing from data_masked MASK_LAG cycles later: the flashing bits cleared
+    by flash_bit (and bits masked by enable_i). Assumes slip 0.
+    """
+    _require(events, "uplink_data_i", "data_masked", "active_o")
+    uplink, masked, active = events["uplink_data_i"], events["data_masked"], events["active_o"]
+    width = etroc_width(rate)
+    word_bytes = width // 8
+    active_bits = _active_bits(rate, active.width)
+
+    cycles = _high_cycles(uplink, end_ns // period_ns - MASK_LAG, period_ns)
+    clears = []
+    for start in range(0, len(cycles), CHUNK_EVENTS):
+        chunk = cycles[start:start + CHUNK_EVENTS]
+        words_active = np.unpackbits(active.values_at(chunk, period_ns), axis=1,
+                                     bitorder="little")[:, active_bits].astype(bool)
+        mask = np.where(np.repeat(words_active, word_bytes, axis=1), 0xFF, 0).astype(np.uint8)
+        cleared = uplink.values_at(chunk, period_ns) & ~masked.values_at(chunk + MASK_LAG, period_ns) & mask
+        rows, bits = np.nonzero(np.unpackbits(cleared, axis=1, bitorder="little"))
+        clears.extend(zip(chunk[rows].tolist(), bits.tolist()))
+    return clears
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+    commands = {
+        "extract": "save the selected signals as .npz",
+        "triggers": "trigger_o pulses",
+        "locks": "per-ETROC lock cycle and unlocks from active_o",
+        "clears": "flashing bits removed between uplink_data_i and data_masked",
+    }
+    for name, text in commands.items():
+        cmd = sub.add_parser(name, help=text)
+        cmd.add_argument("dump", help="VCD (.vcd, .vcd.gz) or .npz from extract")
+        cmd.add_argument("--period", type=int, default=CLK_PERIOD_NS, help="clock period in ns")
+        cmd.add_argument("--signals", nargs="+", default=list(SIGNALS))
+        if name == "extract":
+            cmd.add_argument("-o", "--output", required=True)
+        else:
+            cmd.add_argument("--json", help="write the full result to this file")
+        if name in ("locks", "clears"):
+            cmd.add_argument("--rate", type=int, default=0, choices=(0, 1, 2))
+    args = parser.parse_args(argv)
+
+    events, end_ns = load_events(args.dump, args.signals)
+    for name in args.signals:
+        if name not in events:
+            print(f"{name}: not in the dump", file=sys.stderr)
+
+    if args.command == "extract":
+        save_events(args.output, events, end_ns)
+        for ev in events.values():
+            print(f"{ev.name:<14} {ev.path:<40} {ev.width:>4} bits {len(ev):>10} changes")
+        return 0
+
+    if args.command == "triggers":
+        result = trigger_pulses(events, args.period)
+        print(f"{len(result)} trigger_o pulses")
+        for rise, fall in result[:20]:
+            print(f"  cycle {rise}-{'end' if fall is None else fall - 1}")
+    elif args.command == "locks":
+        result = lock_times(events, args.rate, args.period)
+        print(f"{'etroc':>5} {'bit':>4} {'lock cycle':>11} {'unlocks':>8}  locked")
+        for row in result:
+            print(f"{row['etroc']:>5} {row['bit']:>4} {str(row['lock_cycle']):>11} {row['unlocks']:>8}  {row['locked']}")
+    else:
+        result = flash_clears(events, end_ns, args.rate, args.period)
+        per_etroc = np.bincount([bit // etroc_width(args.rate) for _, bit in result])
+        print(f"{len(result)} cleared bits")
+        for etroc, count in enumerate(per_etroc.tolist()):
+            if count:
+                print(f"  etroc {etroc}: {count}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())